@@ -0,0 +1,49 @@
+"""
+Compares thread and process throughput of `batch.check_batch`.
+
+Run it on both a regular and a free-threaded interpreter (e.g. python3.13t) to
+compare GIL and no-GIL throughput.
+
+Usage: python benchmarks/bench_batch.py [corpus_size] [max_workers]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from batch import check_batch, gil_enabled  # noqa: E402
+from c_rule_enforcer import Rules  # noqa: E402
+from synthetic import make_corpus  # noqa: E402
+
+RULES = Rules.from_dict({
+    'allow_includes': ['stdio.h', 'stdlib.h'],
+    'require_functions': ['f0'],
+    'disallow': ['main', 'loops', 'printing', 'direct_recursion', 'arrays', 'braceless_blocks'],
+    'disallow_symbols': ['scanf', 'malloc'],
+})
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    corpus = make_corpus(size)
+
+    print(f'Python {sys.version.split()[0]}, GIL {"enabled" if gil_enabled() else "disabled"}, '
+          f'{size} submissions, {sum(map(len, corpus)) / 1e6:.1f} MB')
+
+    workers = 1
+    while workers <= max_workers:
+        for mode in ['thread', 'process']:
+            start = time.perf_counter()
+            check_batch(corpus, RULES, workers=workers, mode=mode)
+            elapsed = time.perf_counter() - start
+
+            print(f'{mode:>8} x{workers:<3}: {size / elapsed:9.1f} submissions/s')
+
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the generic engine, the shared-traversal engine, the specialized
+checker, and the NumPy snapshot engine on a synthetic source.
+
+Usage: python benchmarks/bench_engines.py [number_of_functions]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from tree_sitter import Parser  # noqa: E402
+
+from c_rule_enforcer import (C_LANGUAGE, Rules, compile_rules,  # noqa: E402
+                             get_unique_rule_violations, run_checks)
+from snapshot import check_snapshot, snapshot_tree  # noqa: E402
+from specialize import get_checker  # noqa: E402
+
+FUNCTION = '''
+int f{i}(int n, int *a) {{
+    int total = 0;
+    for (int j = 0; j < n; j++) {{
+        if (a[j] % 2 == 0) {{
+            total += helper{i}(a[j]);
+        }} else {{
+            printf("%d", a[j]);
+        }}
+    }}
+    return total;
+}}
+'''
+
+RULES = Rules.from_dict({
+    'require_includes': ['stdio.h'],
+    'allow_includes': ['stdlib.h'],
+    'require_functions': ['f0'],
+    'disallow': ['main', 'loops', 'printing', 'direct_recursion', 'arrays', 'braceless_blocks', 'asm'],
+    'disallow_symbols': ['scanf', 'malloc'],
+    'limit_source_bytes': 100_000,
+})
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    src = ('#include <stdio.h>\n' + ''.join(FUNCTION.format(i=i) for i in range(n))).encode()
+    tree = Parser(C_LANGUAGE).parse(src)
+    compiled = compile_rules(RULES)
+    checker = get_checker(compiled)
+
+    snapshot = snapshot_tree(tree, src)
+
+    assert checker(tree, src) == get_unique_rule_violations(src, RULES)
+    assert check_snapshot(snapshot, compiled) == get_unique_rule_violations(src, RULES)
+
+    timings = {
+        'parse only': lambda: Parser(C_LANGUAGE).parse(src),
+        'generic': lambda: get_unique_rule_violations(src, RULES),
+        'shared traversal (no parse)': lambda: run_checks(tree, src, compiled.checks),
+        'specialized (no parse)': lambda: checker(tree, src),
+        'snapshot (no parse)': lambda: snapshot_tree(tree, src),
+        'vectorized (on snapshot)': lambda: check_snapshot(snapshot, compiled),
+    }
+
+    print(f'{len(src)} bytes, {tree.root_node.descendant_count} nodes')
+
+    for name, fn in timings.items():
+        best = min(timeit.repeat(fn, number=5, repeat=5)) / 5
+        print(f'{name:>28}: {best * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+End-to-end throughput and latency of every execution mode, for sizing grading
+hosts.
+
+For each mode and each worker count 1, 2, 4, ... and `--max-workers`, a
+local load generator drives a synthetic corpus (`synthetic.make_corpus`)
+through the mode's submission API under three load profiles:
+
+- capacity: everything submitted at once; gives submissions/s
+- steady: Poisson arrivals at `--load` times the measured capacity
+- burst: groups of `--burst` submissions at once, at the same average rate
+
+Latency is measured from a submission's scheduled arrival to its result, so
+time spent queueing counts. Batch-only modes (`check_batch`,
+`check_batch_shared`) have no per-submission API and only report capacity.
+
+Usage: python benchmarks/bench_throughput.py [--size N] [--max-workers N] [--modes MODE ...]
+"""
+import argparse
+import base64
+import io
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Generator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from batch import check_batch, check_batch_shared, check_source, gil_enabled, make_executor  # noqa: E402
+from c_rule_enforcer import CompiledRules, Rules, compile_rules  # noqa: E402
+from pipeline import serve  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from synthetic import make_corpus  # noqa: E402
+from warm_pool import WarmPool  # noqa: E402
+
+RULES = compile_rules(Rules.from_dict({
+    'allow_includes': ['stdio.h', 'stdlib.h'],
+    'require_functions': ['f0'],
+    'disallow': ['main', 'loops', 'printing', 'direct_recursion', 'arrays', 'braceless_blocks'],
+    'disallow_symbols': ['scanf', 'malloc'],
+}))
+
+Submit = Callable[[bytes], Future]
+
+
+class _PipelineOutput(io.TextIOBase):
+    """Resolves the future of each result line `serve` writes"""
+
+    def __init__(self, futures: dict[int, Future]):
+        self.futures = futures
+
+    def write(self, line: str) -> int:
+        result = json.loads(line)
+        future = self.futures.pop(result['id'])
+
+        if 'error' in result:
+            future.set_exception(RuntimeError(result['error']))
+        else:
+            future.set_result(result['violations'])
+
+        return len(line)
+
+
+@contextmanager
+def _pipeline(workers: int) -> Generator[Submit, None, None]:
+    # Requests go through JSON and base64 like they would on stdin
+    lines: queue.Queue = queue.Queue()
+    futures: dict[int, Future] = {}
+    ids = itertools.count()
+
+    def submit(src: bytes) -> Future:
+        futures[request_id := next(ids)] = future = Future()
+        lines.put(json.dumps({'id': request_id, 'source': base64.b64encode(src).decode(), 'rules': 'rules'}))
+
+        return future
+
+    with WarmPool([RULES], workers) as pool:
+        server = threading.Thread(target=serve, args=(iter(lines.get, None), _PipelineOutput(futures),
+                                                      {'rules': RULES}, pool.submit, workers * 4))
+        server.start()
+
+        try:
+            yield submit
+        finally:
+            lines.put(None)
+            server.join()
+
+
+@contextmanager
+def _executor(mode: str, workers: int) -> Generator[Submit, None, None]:
+    with make_executor(mode, workers) as executor:
+        yield lambda src: executor.submit(check_source, src, RULES)
+
+
+@contextmanager
+def _warm(workers: int) -> Generator[Submit, None, None]:
+    with WarmPool([RULES], workers) as pool:
+        yield lambda src: pool.submit(src, RULES)
+
+
+@contextmanager
+def _scheduler(workers: int) -> Generator[Submit, None, None]:
+    with Scheduler(workers) as scheduler:
+        yield lambda src: scheduler.submit(None, src, RULES)
+
+
+MODES: dict[str, Callable[[int], AbstractContextManager[Submit]]] = {
+    'thread': lambda workers: _executor('thread', workers),
+    'process': lambda workers: _executor('process', workers),
+    'warm': _warm,
+    'scheduler': _scheduler,
+    'pipeline': _pipeline,
+}
+
+BATCH_MODES: dict[str, Callable[[list[bytes], CompiledRules, int], list]] = {
+    'batch-thread': lambda corpus, rules, workers: check_batch(corpus, rules, workers, 'thread'),
+    'batch-process': lambda corpus, rules, workers: check_batch(corpus, rules, workers, 'process'),
+    'shared': lambda corpus, rules, workers: check_batch_shared(corpus, rules, workers),
+}
+
+
+@dataclass
+class Run:
+    throughput: float
+    """Submissions per second"""
+    p50: float
+    p99: float
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def drive(submit: Submit, corpus: list[bytes], arrivals: list[float]) -> Run:
+    """Submits `corpus[i]` at `arrivals[i]` seconds from now and waits for every result"""
+    latencies = [0.0] * len(corpus)
+    remaining = len(corpus)
+    finished = threading.Condition()
+    errors: list[BaseException] = []
+
+    def done(i: int, scheduled: float, future: Future) -> None:
+        nonlocal remaining
+        latencies[i] = time.perf_counter() - scheduled
+
+        if error := future.exception():
+            errors.append(error)
+
+        with finished:
+            remaining -= 1
+            finished.notify()
+
+    start = time.perf_counter()
+
+    for i, (src, arrival) in enumerate(zip(corpus, arrivals)):
+        scheduled = start + arrival
+
+        if (delay := scheduled - time.perf_counter()) > 0:
+            time.sleep(delay)
+
+        submit(src).add_done_callback(lambda future, i=i, scheduled=scheduled: done(i, scheduled, future))
+
+    with finished:
+        finished.wait_for(lambda: not remaining)
+
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    return Run(len(corpus) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99))
+
+
+def steady_arrivals(size: int, rate: float, rng: random.Random) -> list[float]:
+    return list(itertools.accumulate(rng.expovariate(rate) for _ in range(size)))
+
+
+def burst_arrivals(size: int, rate: float, burst: int) -> list[float]:
+    return [(i // burst) * burst / rate for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=500, help='Submissions per run')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--modes', nargs='+', choices=[*MODES, *BATCH_MODES], default=[*MODES, *BATCH_MODES])
+    parser.add_argument('--load', type=float, default=0.7, help='Steady and burst rate as a fraction of capacity')
+    parser.add_argument('--burst', type=int, default=50, help='Submissions per burst')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.size, args.seed)
+    rng = random.Random(args.seed)
+    worker_counts = sorted({*(2 ** i for i in range(args.max_workers.bit_length())), args.max_workers})
+    capacities: dict[str, float] = {}
+
+    print(f'Python {sys.version.split()[0]}, GIL {"enabled" if gil_enabled() else "disabled"}, '
+          f'{os.cpu_count()} CPUs, {args.size} submissions, {sum(map(len, corpus)) / 1e6:.1f} MB')
+    print(f'{"mode":>13} {"workers":>7} {"subs/s":>9} {"speedup":>7} {"eff.":>5} '
+          f'{"steady p50/p99 ms":>18} {"burst p50/p99 ms":>17}')
+
+    for mode in args.modes:
+        for workers in worker_counts:
+            if mode in BATCH_MODES:
+                start = time.perf_counter()
+                BATCH_MODES[mode](corpus, RULES, workers)
+                throughput = args.size / (time.perf_counter() - start)
+                latencies = f'{"-":>18} {"-":>17}'
+
+            else:
+                with MODES[mode](workers) as submit:
+                    # Warms up workers and caches before anything is measured
+                    drive(submit, corpus[:workers * 4], [0.0] * min(len(corpus), workers * 4))
+
+                    throughput = drive(submit, corpus, [0.0] * len(corpus)).throughput
+                    rate = throughput * args.load
+                    steady = drive(submit, corpus, steady_arrivals(len(corpus), rate, rng))
+                    burst = drive(submit, corpus, burst_arrivals(len(corpus), rate, args.burst))
+
+                latencies = (f'{steady.p50 * 1e3:8.1f}/{steady.p99 * 1e3:<9.1f} '
+                             f'{burst.p50 * 1e3:7.1f}/{burst.p99 * 1e3:<9.1f}')
+
+            baseline = capacities.setdefault(mode, throughput)
+            speedup = throughput / baseline
+
+            print(f'{mode:>13} {workers:>7} {throughput:9.1f} {speedup:6.2f}x {speedup / workers:5.0%} {latencies}',
+                  flush=True)
+
+
+if __name__ == '__main__':
+    main()
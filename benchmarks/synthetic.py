@@ -0,0 +1,41 @@
+"""
+Synthetic submissions resembling typical student code.
+"""
+import random
+
+HEADERS = ['stdio.h', 'stdlib.h', 'string.h', 'math.h']
+
+FUNCTION = '''
+int {name}(int n, int *a) {{
+    int total = 0;
+    for (int j = 0; j < n; j++) {{
+        if (a[j] % {k} == 0) {{
+            total += a[j] * {k};
+        }} else {{
+            printf("%d\\n", a[j]);
+        }}
+    }}
+    while (total > {limit}) {{
+        total /= 2;
+    }}
+    return total;
+}}
+'''
+
+
+def make_submission(rng: random.Random, functions: int) -> bytes:
+    lines = [f'#include <{header}>' for header in rng.sample(HEADERS, rng.randint(1, len(HEADERS)))]
+    lines.extend(FUNCTION.format(name=f'f{i}', k=rng.randint(2, 9), limit=rng.randint(10, 10_000))
+                 for i in range(functions))
+
+    return '\n'.join(lines).encode()
+
+
+def make_corpus(size: int, seed: int = 0, max_functions: int = 20) -> list[bytes]:
+    """
+    `size` submissions of mostly small sources with a long tail of large ones
+    """
+    rng = random.Random(seed)
+
+    return [make_submission(rng, min(max_functions, int(rng.paretovariate(1.5))))
+            for _ in range(size)]
@@ -0,0 +1,129 @@
+"""
+Checking submissions straight out of zip and tar archives.
+
+Entries are read and decompressed by a background thread into a bounded queue,
+so nothing is extracted to disk and decompression overlaps checking. Results
+are listed per entry in archive order; archives may hold several members with
+the same path, and each one is kept.
+
+No entry is decompressed past `max_entry_bytes`, so a small archive cannot
+expand into unbounded memory; a larger entry fails with `EntryTooLarge`.
+"""
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import Future
+from typing import IO, Generator, Iterable, Iterator
+
+from c_rule_enforcer import CompiledRules, Rules, compile_rules
+from batch import Mode, check_source, make_executor
+
+
+MAX_ENTRY_BYTES = 16 * 1024 * 1024
+
+
+class EntryTooLarge(ValueError):
+    pass
+
+
+def _read_entry(f: IO[bytes], name: str, limit: int) -> bytes:
+    # Sizes in archive headers are not trusted; at most one byte past the limit is decompressed
+    if len(contents := f.read(limit + 1)) > limit:
+        raise EntryTooLarge(f'Archive entry {name} is larger than {limit} bytes once decompressed')
+
+    return contents
+
+
+def iter_archive(path: str | os.PathLike, extensions: Iterable[str] = ('.c',),
+                 max_entry_bytes: int = MAX_ENTRY_BYTES) -> Generator[tuple[str, bytes], None, None]:
+    """
+    Yields `(member path, contents)` of the regular files in a zip or tar
+    (optionally compressed) archive whose names end with one of `extensions`.
+    """
+    extensions = tuple(extension.lower() for extension in extensions)
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(extensions):
+                    with archive.open(info) as f:
+                        yield info.filename, _read_entry(f, info.filename, max_entry_bytes)
+
+        return
+
+    # Stream mode reads the archive front to back without seeking
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(extensions):
+                yield member.name, _read_entry(archive.extractfile(member), member.name, max_entry_bytes)
+
+
+_DONE = object()
+
+
+def read_ahead(entries: Iterable, maxsize: int) -> Iterator:
+    """
+    Iterates `entries` in a background thread, buffering at most `maxsize`
+    of them. Exceptions are re-raised in the consuming thread.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for entry in entries:
+                if stop.is_set():
+                    return
+
+                buffer.put(entry)
+
+        except BaseException as e:
+            buffer.put(e)
+
+        buffer.put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while (entry := buffer.get()) is not _DONE:
+            if isinstance(entry, BaseException):
+                raise entry
+
+            yield entry
+
+    finally:
+        stop.set()
+
+        # Unblocks the producer if it is waiting on a full buffer
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def check_archive(path: str | os.PathLike, rules: Rules | CompiledRules,
+                  workers: int | None = None, mode: Mode = 'thread',
+                  extensions: Iterable[str] = ('.c',), queue_size: int = 64,
+                  max_entry_bytes: int = MAX_ENTRY_BYTES) -> list[tuple[str, set[str]]]:
+    """
+    Checks every matching entry of an archive against `rules`, returning
+    `(member path, violations)` in archive order. At most `queue_size`
+    decompressed entries wait for a worker at any time.
+    """
+    compiled = compile_rules(rules)
+    workers = workers or os.cpu_count() or 1
+    in_flight = threading.BoundedSemaphore(queue_size)
+    futures: list[tuple[str, Future]] = []
+
+    with make_executor(mode, workers) as executor:
+        for name, src in read_ahead(iter_archive(path, extensions, max_entry_bytes), queue_size):
+            in_flight.acquire()
+            future = executor.submit(check_source, src, compiled)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append((name, future))
+
+    return [(name, future.result()) for name, future in futures]
@@ -0,0 +1,294 @@
+"""
+Batch checking of many sources with a thread or process pool.
+
+Thread safety of the public API:
+
+- `Rules` is a plain mutable dataclass; do not mutate one while it is being
+  checked. `compile_rules` returns an immutable `CompiledRules` which may be
+  shared freely between threads.
+- `get_rule_violations`, `get_unique_rule_violations`,
+  `get_rule_violations_str` and `check_against` create their own `Parser`
+  per call and may be called concurrently.
+- `specialize.get_checker` is safe to call concurrently (a checker may be
+  generated twice in a race, both are equivalent) and checkers have no
+  shared state.
+- `tree_sitter.Parser` objects must not be shared between threads; this
+  module keeps one per thread (`get_parser`).
+- `snapshot.SnapshotCache` and `memo.RuleMemo` are not thread-safe; use one
+  per thread or guard them with a lock.
+
+Parsing releases the GIL, so threads already overlap parsing on regular
+CPython; on free-threaded builds (`python3.13t`) the rule traversals run in
+parallel too.
+
+Run as a script, it checks source files against one rules object and writes
+a JSON line with the violations of each file.
+
+Usage: python batch.py RULES SOURCE... [--mode thread|process] [--workers N]
+           [--trace TRACE] [--trace-rules]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from typing import Generator, Iterable, Literal, Sequence
+
+from tree_sitter import Parser
+
+from c_rule_enforcer import (C_LANGUAGE, CompiledRules, Rules, compile_rules,
+                             group_by_rule, run_checks, run_visitors)
+from specialize import get_checker
+
+Mode = Literal['thread', 'process']
+
+_local = threading.local()
+
+
+def gil_enabled() -> bool:
+    # `sys._is_gil_enabled` only exists on 3.13+
+    return getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+def get_parser() -> Parser:
+    """Returns the calling thread's own `Parser`"""
+    if (parser := getattr(_local, 'parser', None)) is None:
+        parser = _local.parser = Parser(C_LANGUAGE)
+
+    return parser
+
+
+def check_source(src: bytes, rules: Rules | CompiledRules) -> set[str]:
+    """Same as `get_unique_rule_violations`, using the thread's parser"""
+    return get_checker(rules)(get_parser().parse(src), src)
+
+
+def check_source_by_rule(src: bytes, rules: Rules | CompiledRules) -> dict[str, set[str]]:
+    """Same as `get_violations_by_rule`, using the thread's parser"""
+    tree = get_parser().parse(src)
+
+    return group_by_rule(run_checks(tree, src, dict.fromkeys(compile_rules(rules).checks_for(tree))))
+
+
+def _check_chunk(rules: CompiledRules, sources: list[bytes]) -> list[set[str]]:
+    return [check_source(src, rules) for src in sources]
+
+
+def _chunks(sources: list[bytes], size: int) -> list[list[bytes]]:
+    return [sources[i:i + size] for i in range(0, len(sources), size)]
+
+
+def make_executor(mode: Mode, workers: int | None = None) -> Executor:
+    workers = workers or os.cpu_count() or 1
+
+    if mode == 'thread':
+        return ThreadPoolExecutor(workers, thread_name_prefix='c-rule-enforcer')
+
+    if mode == 'process':
+        return ProcessPoolExecutor(workers)
+
+    raise ValueError(f'Unknown mode: {mode}')
+
+
+def check_batch(sources: Iterable[bytes], rules: Rules | CompiledRules,
+                workers: int | None = None, mode: Mode = 'thread',
+                chunk_size: int | None = None, trace: str | os.PathLike | None = None,
+                trace_rules: bool = False) -> list[set[str]]:
+    """
+    Checks every source against `rules` on a pool of `workers` threads or
+    processes. Results are in the order of `sources`.
+
+    If `trace` is given, every worker buffers spans of its chunks (see
+    `tracing.traced_chunk`) and a Chrome trace of the batch is written there;
+    `trace_rules` adds the opt-in per-rule spans.
+    """
+    sources = list(sources)
+    compiled = compile_rules(rules)
+    workers = workers or os.cpu_count() or 1
+
+    if chunk_size is None:
+        # A few chunks per worker balances load while amortizing task overhead
+        chunk_size = max(1, len(sources) // (workers * 4))
+
+    chunks = _chunks(sources, chunk_size)
+
+    with make_executor(mode, workers) as executor:
+        if trace is None:
+            return [violations for chunk in executor.map(partial(_check_chunk, compiled), chunks)
+                    for violations in chunk]
+
+        # `tracing` imports this module
+        from tracing import traced_chunk, write_trace
+
+        results = []
+        events = []
+
+        for chunk, chunk_events in executor.map(partial(traced_chunk, compiled, trace_rules),
+                                                range(0, len(sources), chunk_size), chunks):
+            results.extend(chunk)
+            events.extend(chunk_events)
+
+    write_trace(events, trace)
+
+    return results
+
+
+class SourceArena:
+    """
+    Sources packed into one shared memory block: the number of sources, an
+    offsets table, then the sources back to back. Worker processes attach by
+    `name` and parse slices of it without copying or unpickling them.
+    """
+    _COUNT = struct.Struct('<Q')
+
+    def __init__(self, sources: Sequence[bytes]):
+        header = self._COUNT.size + (len(sources) + 1) * 8
+        offsets = array('Q', [header])
+
+        for src in sources:
+            offsets.append(offsets[-1] + len(src))
+
+        self.shm = SharedMemory(create=True, size=max(1, offsets[-1]))
+        self.name = self.shm.name
+
+        try:
+            self._COUNT.pack_into(self.shm.buf, 0, len(sources))
+            self.shm.buf[self._COUNT.size:header] = offsets.tobytes()
+
+            for src, start, end in zip(sources, offsets, offsets[1:]):
+                self.shm.buf[start:end] = src
+
+        except BaseException:
+            # Not entered yet, so nobody else would unlink the segment
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> 'SourceArena':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+@contextmanager
+def _attach_arena(name: str) -> Generator[tuple[memoryview, memoryview], None, None]:
+    """
+    Attaches to an arena for the duration of the block, yielding its offsets
+    table and its whole buffer. Slices of the buffer must be released before
+    the block ends, since the mapping cannot be closed while they are alive.
+    """
+    shm = SharedMemory(name)
+    buffer = shm.buf
+    (count,) = SourceArena._COUNT.unpack_from(buffer)
+    offsets = buffer[SourceArena._COUNT.size:SourceArena._COUNT.size + (count + 1) * 8].cast('Q')
+
+    try:
+        yield offsets, buffer
+    finally:
+        offsets.release()
+        shm.close()
+
+
+def _check_arena_chunk(name: str, rules: CompiledRules, first: int, last: int) -> tuple[bytes, list[str]]:
+    """
+    Returns records of `(source index, check index, start byte, message
+    index)` as packed 64-bit integers. Message index -1 stands for the check's
+    `fixed_message`; other messages embed source text, and are sent once per
+    chunk in the returned table.
+    """
+    check_indices = {check: check_index for check_index, check in enumerate(rules.checks)}
+    records = array('q')
+    messages: dict[str, int] = {}
+
+    with _attach_arena(name) as (offsets, buffer):
+        for i in range(first, last):
+            with buffer[offsets[i]:offsets[i + 1]] as src:
+                tree = get_parser().parse(src)
+
+                for check, visitor in run_visitors(tree, src, rules.checks_for(tree)).items():
+                    fixed = check.fixed_message
+
+                    for message, start_byte in zip(visitor.violations, visitor.start_bytes):
+                        message_index = -1 if message == fixed else messages.setdefault(message, len(messages))
+                        records.extend((i, check_indices[check], start_byte, message_index))
+
+    return records.tobytes(), list(messages)
+
+
+def check_batch_shared_records(sources: Sequence[bytes], rules: Rules | CompiledRules,
+                               workers: int | None = None,
+                               chunk_size: int | None = None) -> list[list[tuple[str, int, str]]]:
+    """
+    Same as `check_batch` in `process` mode, but sources are handed to the
+    workers through a `SourceArena` and results come back as compact records.
+    Returns the `(rule ID, start byte, message)` of every violation of each
+    source; the start byte is -1 for violations without a single location.
+    """
+    compiled = compile_rules(rules)
+    workers = workers or os.cpu_count() or 1
+    results: list[list[tuple[str, int, str]]] = [[] for _ in sources]
+
+    if chunk_size is None:
+        chunk_size = max(1, len(sources) // (workers * 4))
+
+    with SourceArena(sources) as arena, make_executor('process', workers) as executor:
+        firsts = range(0, len(sources), chunk_size)
+        lasts = [min(first + chunk_size, len(sources)) for first in firsts]
+        chunks = executor.map(partial(_check_arena_chunk, arena.name, compiled), firsts, lasts)
+
+        for packed, messages in chunks:
+            records = array('q')
+            records.frombytes(packed)
+
+            for i in range(0, len(records), 4):
+                check = compiled.checks[records[i + 1]]
+                message = check.fixed_message if records[i + 3] < 0 else messages[records[i + 3]]
+                results[records[i]].append((check.rule_id, records[i + 2], message))
+
+    return results
+
+
+def check_batch_shared(sources: Sequence[bytes], rules: Rules | CompiledRules,
+                       workers: int | None = None, chunk_size: int | None = None) -> list[set[str]]:
+    """Same as `check_batch` in `process` mode, using `check_batch_shared_records`"""
+    return [{message for _, _, message in records}
+            for records in check_batch_shared_records(sources, rules, workers, chunk_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks source files against a rules object.')
+    parser.add_argument('rules', help='JSON file with a rules object')
+    parser.add_argument('sources', nargs='+')
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--trace', help='Write a Chrome trace-event JSON file of the batch')
+    parser.add_argument('--trace-rules', action='store_true', help='Also trace each rule on its own')
+    args = parser.parse_args()
+
+    with open(args.rules) as f:
+        rules = Rules.from_dict(json.load(f))
+
+    sources = []
+
+    for path in args.sources:
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+
+    results = check_batch(sources, rules, args.workers, args.mode, trace=args.trace, trace_rules=args.trace_rules)
+
+    for path, violations in zip(args.sources, results):
+        print(json.dumps({'path': path, 'violations': sorted(violations)}))
+
+
+if __name__ == '__main__':
+    main()
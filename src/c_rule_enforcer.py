@@ -1,10 +1,29 @@
 import re
-from typing import Any, Generator
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from functools import cached_property
+from importlib.metadata import PackageNotFoundError, version
+from typing import Any, Callable, ClassVar, Generator, Iterable
+from dataclasses import dataclass, field
 
 import tree_sitter_c as tsc
 from tree_sitter import Language, Parser, Tree, Node
 
+C_LANGUAGE = Language(tsc.language())
+
+
+def _grammar_version() -> str:
+    try:
+        package_version = version('tree-sitter-c')
+    except PackageNotFoundError:  # pragma: no cover
+        package_version = 'unknown'
+
+    return f'tree-sitter-c-{package_version}-abi{C_LANGUAGE.version}'
+
+
+GRAMMAR_VERSION = _grammar_version()
+"""Anything cached from parse trees (snapshots, memoized results) is only valid for this grammar"""
+
 
 @dataclass
 class Rules:
@@ -31,12 +50,21 @@ class Rules:
     - atypical_control_flow
     - braceless_blocks
     - asm
+    - syntax_errors (reports the first `MAX_SYNTAX_ERRORS` error locations)
     """
     disallow: list[str] | None
     disallow_symbols: list[str] | None
     limit_source_bytes: int | None
     # Must be at least size of `require_functions`
     limit_defined_functions: int | None
+    # Sources with more syntax tree nodes are not traversed, and only fail this rule
+    limit_nodes: int | None
+    # Blocks and statements nested inside each other (the body of a function is not a level)
+    limit_nesting_depth: int | None
+    limit_function_statements: int | None
+    limit_cyclomatic_complexity: int | None
+    # With `syntax_errors` disallowed, sources with syntax errors are only checked for those
+    fail_fast: bool | None
 
     @classmethod
     def from_dict(cls, d: dict[str, Any]):
@@ -51,6 +79,11 @@ class Rules:
             disallow_symbols=list_or_none(d.get('disallow_symbols', None)),
             limit_source_bytes=d.get('limit_source_bytes', None),
             limit_defined_functions=d.get('limit_defined_functions', None),
+            limit_nodes=d.get('limit_nodes', None),
+            limit_nesting_depth=d.get('limit_nesting_depth', None),
+            limit_function_statements=d.get('limit_function_statements', None),
+            limit_cyclomatic_complexity=d.get('limit_cyclomatic_complexity', None),
+            fail_fast=d.get('fail_fast', None),
         )
 
 
@@ -70,444 +103,988 @@ def get_rule_violations_str(src: bytes, rules: Rules) -> str | None:
 
 
 def get_rule_violations(src: bytes, rules: Rules) -> Generator[str, None, None]:
-    C_LANGUAGE = Language(tsc.language())
-    parser = Parser(C_LANGUAGE)
-    tree = parser.parse(src)
+    """Every violation of `rules` by `src`, grouped by check; see `run_checks`"""
+    tree = Parser(C_LANGUAGE).parse(src)
 
-    # TODO: Make into rule (temporary default behavior)
-    yield from handle_disallow_dunders(tree, src)
+    for violations in run_checks(tree, src, dict.fromkeys(compile_rules(rules).checks_for(tree))).values():
+        yield from violations
 
-    if rules.require_functions:
-        yield from handle_require_functions(tree, src, rules.require_functions)
 
-    if rules.disallow:
-        yield from handle_disallow(src, tree, rules.disallow, rules.require_functions)
+def get_unique_rule_violations(src: bytes, rules: Rules) -> set[str]:
+    return {*get_rule_violations(src, rules)}
 
-    if rules.disallow_symbols:
-        yield from handle_disallow_symbols(tree, src, rules.disallow_symbols)
 
-    # Must do handling for falsy 0
-    if rules.limit_source_bytes is not None:
-        yield from handle_limit_source_bytes(src, rules.limit_source_bytes)
+NESTING_STATEMENTS = frozenset({'if_statement', 'for_statement', 'while_statement', 'do_statement', 'switch_statement'})
+NESTING_TYPES = NESTING_STATEMENTS | {'compound_statement'}
+"""Node types that open a nesting level, unless they continue their parent's"""
+
+STATEMENT_TYPES = frozenset({
+    'declaration',
+    'expression_statement',
+    'return_statement',
+    'if_statement',
+    'for_statement',
+    'while_statement',
+    'do_statement',
+    'switch_statement',
+    'break_statement',
+    'continue_statement',
+    'goto_statement',
+})
+
+DECISION_TYPES = frozenset({
+    'if_statement',
+    'for_statement',
+    'while_statement',
+    'do_statement',
+    'case_statement',
+    'conditional_expression',
+    '&&',
+    '||',
+})
+"""Node types that add a path to the cyclomatic complexity, except `default:`"""
+
+
+def nesting_continuations(node: Node) -> Generator[int, None, None]:
+    """
+    IDs of the children of `node` that stay at its nesting level rather than
+    opening one: the body of a function or statement, and the `if` of an
+    `else if`.
+    """
+    if node.type in NESTING_STATEMENTS or node.type == 'function_definition':
+        for child in node.children:
+            if child.type == 'compound_statement':
+                yield child.id
 
-    # Must do handling for falsy 0
-    if rules.limit_defined_functions is not None:
-        if rules.require_functions is not None:
-            assert rules.limit_defined_functions >= len(
-                rules.require_functions), \
-                f'Setup error: `limit_defined_functions` ({rules.limit_defined_functions}) must be greater than or equal to `len(rules.require_functions)` ({len(rules.require_functions)})'
+    elif node.type == 'else_clause':
+        for child in node.children:
+            if child.type == 'compound_statement' or child.type == 'if_statement':
+                yield child.id
 
-        yield from handle_limit_defined_functions(tree, rules.limit_defined_functions)
 
-    if rules.require_includes:
-        yield from handle_require_includes(tree, src, rules.require_includes)
+def is_decision_point(node: Node) -> bool:
+    return node.type in DECISION_TYPES and (node.type != 'case_statement' or node.child(0).type != 'default')
 
-    # None means allow all; [] means allow none
-    if rules.allow_includes is not None:
-        yield from handle_allow_includes(tree, src, rules.allow_includes, rules.require_includes or [])
 
+def nodes_message(limit: int) -> str:
+    return f'Source code is too complex; must have at most {limit} syntax tree nodes.'
 
-def get_unique_rule_violations(src: bytes, rules: Rules) -> set[str]:
-    return {*get_rule_violations(src, rules)}
 
+def nesting_depth_message(limit: int) -> str:
+    return f'Code is nested too deeply; blocks and statements can be nested at most {limit} level{"" if limit == 1 else "s"} deep.'
 
-def handle_disallow(src: bytes, tree: Tree, disallowed: list[str],
-                    required_functions: list[str] | None) -> Generator[str, None, None]:
-    if 'main' in disallowed:
-        yield from handle_disallow_main(tree, src)
 
-    if 'assignment' in disallowed:
-        yield from handle_disallow_assignment(tree)
+def function_statements_message(limit: int) -> str:
+    return f'Functions are too long; each function can have at most {limit} statement{"" if limit == 1 else "s"}.'
 
-    if 'reassignment' in disallowed:
-        yield from handle_disallow_reassignment(tree)
 
-    if 'loops' in disallowed:
-        yield from handle_disallow_loops(tree)
+def cyclomatic_complexity_message(limit: int) -> str:
+    return f'Functions are too complex; each function can have a cyclomatic complexity of at most {limit}.'
 
-    if 'if_statements' in disallowed:
-        yield from handle_disallow_if_statements(tree)
 
-    if 'helper_functions' in disallowed:
-        yield from handle_disallow_helper_functions(tree, src, required_functions)
+MAX_SYNTAX_ERRORS = 3
 
-    if 'printing' in disallowed:
-        yield from handle_disallow_printing(tree, src)
 
-    if 'direct_recursion' in disallowed:
-        yield from handle_disallow_direct_recursion(tree, src)
+def find_syntax_errors(root: Node, limit: int = MAX_SYNTAX_ERRORS) -> list[Node]:
+    """
+    Returns the first `limit` `ERROR` and missing nodes under `root` in
+    pre-order. Only nodes whose subtree contains errors are descended into,
+    and not `ERROR` nodes themselves, so this stays cheap on large trees.
+    """
+    errors: list[Node] = []
 
-    if 'arrays' in disallowed:
-        yield from handle_disallow_arrays(tree)
+    if not root.has_error:
+        return errors
 
-    if 'nonnumeric_defines' in disallowed:
-        yield from handle_disallow_nonnumeric_defines(tree, src)
+    for node, _ in walk_tree(root, lambda node: node.has_error and not node.is_error):
+        if node.is_error or node.is_missing:
+            errors.append(node)
 
-    if 'atypical_control_flow' in disallowed:
-        yield from handle_disallow_atypical_control_flow(tree, src)
+            if len(errors) == limit:
+                break
 
-    if 'braceless_blocks' in disallowed:
-        yield from handle_disallow_braceless_blocks(tree)
+    return errors
 
-    if 'asm' in disallowed:
-        yield from handle_disallow_asm(tree)
 
-    # TODO
-    if 'function_pointers' in disallowed:
-        ...
+def syntax_error_message(row: int, column: int, missing: str | None = None) -> str:
+    """The message of a syntax error, also for engines that only keep its location"""
+    location = f'line {row + 1}, column {column + 1}'
 
+    if missing is not None:
+        return f'Syntax error on {location}: missing `{missing}`.'
 
-def handle_disallow_main(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'function_declarator':
-            for child in node.children:
-                if child.type == 'identifier':
-                    identifier = src[child.start_byte:child.end_byte]
-
-                    # Sourced checked is unmangled version; main has no UUID suffix
-                    if identifier == b'main':
-                        yield 'Including a `main` function is disallowed.'
-                        break
-        else:
-            for child in node.children:
-                yield from recurse_on_node(child)
+    return f'Syntax error on {location}.'
 
-    yield from recurse_on_node(tree.root_node)
 
+PRINTING_FUNCTIONS = {
+    b'printf',
+    b'vprintf',
+    b'fprintf',
+    b'vfprintf',
+    b'fputc',
+    b'putc',
+}
 
-def handle_disallow_assignment(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type in {'init_declarator', 'assignment_expression', '++', '--'}:
-            yield 'Assignment statements, incrementing, and decrementing are disallowed.'
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+def walk_tree(node: Node, descend: Callable[[Node], bool] | None = None,
+              max_depth: int | None = None) -> Generator[tuple[Node, int], None, None]:
+    """
+    Yields every node under `node` (inclusive) in pre-order with its depth
+    relative to `node`. The children of a node are skipped if `descend`
+    returns `False` for it or if it is `max_depth` deep. Uses a `TreeCursor`,
+    so deep trees do not hit Python's recursion limit.
+    """
+    cursor = node.walk()
+    depth = 0
 
-    yield from recurse_on_node(tree.root_node)
+    while True:
+        node = cursor.node
+        yield node, depth
 
+        if (max_depth is None or depth < max_depth) and (descend is None or descend(node)) \
+                and cursor.goto_first_child():
+            depth += 1
+            continue
 
-def handle_disallow_reassignment(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type in {'assignment_expression', '++', '--'}:
-            yield 'Reassignment, incrementing, and decrementing are disallowed.'
+        while True:
+            if depth == 0:
+                return
+
+            if cursor.goto_next_sibling():
+                break
+
+            cursor.goto_parent()
+            depth -= 1
+
+
+class RuleVisitor:
+    """
+    A single check of a rule, fed the nodes of a traversal by `run_checks` so
+    that any number of rules share that traversal.
+
+    Only nodes whose type is in `node_types` are passed to `enter`.
+    """
+    node_types: ClassVar[frozenset[str]] = frozenset()
+    version: ClassVar[int] = 1
+    """Bump when the results of the rule change, so that memoized results are not reused"""
+
+    def __init__(self, src: bytes):
+        self.src = src
+        self.violations: list[str] = []
+        self.start_bytes: list[int] = []
+        """Where each violation was found, or -1 if it has no single location"""
+        self.end_bytes: list[int] = []
+        self.pruned = False
+
+    def enter(self, node: Node) -> Callable[[], None] | None:
+        """
+        May return a callback, which is called once the subtree of `node` has
+        been left.
+        """
+        return None
+
+    def finish(self) -> None:
+        pass
+
+    def merge(self, other: 'RuleVisitor') -> None:
+        """
+        Folds in the state of the same check run over a later part of the tree,
+        before `finish`.
+        """
+        self.violations.extend(other.violations)
+        self.start_bytes.extend(other.start_bytes)
+        self.end_bytes.extend(other.end_bytes)
+
+    @classmethod
+    def fixed_message(cls, *params: Any) -> str | None:
+        """The only message the check with `params` can report, if it does not depend on the source"""
+        return None
+
+    def report(self, message: str, node: Node | None = None) -> None:
+        self.violations.append(message)
+        self.start_bytes.append(node.start_byte if node is not None else -1)
+        self.end_bytes.append(node.end_byte if node is not None else -1)
+
+    def rebase(self, base: int) -> None:
+        """Makes the locations found in a slice of the source starting at `base` absolute"""
+        self.start_bytes = [start + base if start >= 0 else start for start in self.start_bytes]
+        self.end_bytes = [end + base if end >= 0 else end for end in self.end_bytes]
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Only the state is sent back from worker processes, not the source
+        return {**self.__dict__, 'src': b''}
+
+    def prune(self) -> Callable[[], None]:
+        # The rest of the current node's subtree is skipped for this visitor
+        self.pruned = True
+
+        return self._unprune
+
+    def _unprune(self) -> None:
+        self.pruned = False
+
+    def text(self, node: Node) -> bytes:
+        # `src` may also be a `memoryview`; `bytes` of `bytes` does not copy
+        return bytes(self.src[node.start_byte:node.end_byte])
+
+
+class _NodeTypeVisitor(RuleVisitor):
+    message: ClassVar[str]
+
+    @classmethod
+    def fixed_message(cls) -> str:
+        return cls.message
+
+    def enter(self, node: Node) -> None:
+        self.report(self.message, node)
+
+
+class DisallowDundersVisitor(RuleVisitor):
+    node_types = frozenset({'identifier'})
+
+    def enter(self, node: Node) -> None:
+        if (s := self.text(node).decode('utf8')).startswith('__'):
+            self.report(f'`{s}` is disallowed.', node)
 
-        for child in node.children:
-            yield from recurse_on_node(child)
 
-    yield from recurse_on_node(tree.root_node)
+class DisallowSymbolsVisitor(RuleVisitor):
+    node_types = frozenset({'identifier'})
 
+    def __init__(self, src: bytes, disallowed_symbols: tuple[str, ...]):
+        super().__init__(src)
+        self.disallowed_symbols = frozenset(disallowed_symbols)
 
-def handle_disallow_loops(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type in {'for_statement', 'while_statement', 'do_statement'}:
-            yield 'Loops are disallowed.'
+    def enter(self, node: Node) -> None:
+        if (s := self.text(node).decode('utf8')) in self.disallowed_symbols:
+            self.report(f'`{s}` is disallowed.', node)
 
+
+class DisallowMainVisitor(RuleVisitor):
+    node_types = frozenset({'function_declarator'})
+
+    def enter(self, node: Node) -> Callable[[], None]:
         for child in node.children:
-            yield from recurse_on_node(child)
+            # Sourced checked is unmangled version; main has no UUID suffix
+            if child.type == 'identifier' and self.text(child) == b'main':
+                self.report('Including a `main` function is disallowed.', child)
+                break
+
+        return self.prune()
+
+
+class DisallowAssignmentVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'init_declarator', 'assignment_expression', '++', '--'})
+    message = 'Assignment statements, incrementing, and decrementing are disallowed.'
+
+
+class DisallowReassignmentVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'assignment_expression', '++', '--'})
+    message = 'Reassignment, incrementing, and decrementing are disallowed.'
+
 
-    yield from recurse_on_node(tree.root_node)
+class DisallowLoopsVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'for_statement', 'while_statement', 'do_statement'})
+    message = 'Loops are disallowed.'
 
 
-def handle_disallow_if_statements(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type in {'if_statement', 'for_statement', 'while_statement', 'do_statement'}:
-            yield '`if` statements and loops are disallowed.'
+class DisallowIfStatementsVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'if_statement', 'for_statement', 'while_statement', 'do_statement'})
+    message = '`if` statements and loops are disallowed.'
 
+
+class DisallowHelperFunctionsVisitor(RuleVisitor):
+    node_types = frozenset({'function_declarator'})
+
+    def __init__(self, src: bytes, required_functions: tuple[str, ...] | None):
+        super().__init__(src)
+        self.required_functions = required_functions
+
+    def enter(self, node: Node) -> Callable[[], None]:
         for child in node.children:
-            yield from recurse_on_node(child)
+            if child.type == 'identifier':
+                identifier = self.text(child).decode('utf8')
 
-    yield from recurse_on_node(tree.root_node)
+                if self.required_functions is None or identifier not in self.required_functions:
+                    self.report('Helper functions are disallowed.', child)
+                    break
 
+        return self.prune()
 
-def handle_disallow_helper_functions(tree: Tree,
-                                     src: bytes,
-                                     required_functions: list[str] | None) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'function_declarator':
-            for child in node.children:
-                if child.type == 'identifier':
-                    identifier = src[child.start_byte:child.end_byte]
 
-                    if required_functions is None or identifier.decode('utf8') not in required_functions:
-                        yield 'Helper functions are disallowed.'
-                        break
-        else:
-            for child in node.children:
-                yield from recurse_on_node(child)
+class DisallowPrintingVisitor(RuleVisitor):
+    node_types = frozenset({'call_expression'})
 
-    yield from recurse_on_node(tree.root_node)
+    def enter(self, node: Node) -> Callable[[], None]:
+        for child in node.children:
+            if child.type == 'identifier' and self.text(child) in PRINTING_FUNCTIONS:
+                self.report('Printing is disallowed.', child)
+                break
 
+        return self.prune()
 
-def handle_disallow_printing(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'call_expression':
-            for child in node.children:
-                if child.type == 'identifier':
-                    identifier = src[child.start_byte:child.end_byte]
-
-                    if identifier in {
-                            b'printf',
-                            b'vprintf',
-                            b'fprintf',
-                            b'vfprintf',
-                            b'fputc',
-                            b'putc',
-                    }:
-                        yield 'Printing is disallowed.'
-                        break
-        else:
-            for child in node.children:
-                yield from recurse_on_node(child)
 
-    yield from recurse_on_node(tree.root_node)
+class DisallowDirectRecursionVisitor(RuleVisitor):
+    node_types = frozenset({'function_definition', 'call_expression'})
 
+    def __init__(self, src: bytes):
+        super().__init__(src)
+        self.inside_function: bytes | None = None
 
-def handle_disallow_direct_recursion(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node,
-                        inside_function: bytes | None) -> Generator[str, None, None]:
+    def enter(self, node: Node) -> Callable[[], None] | None:
         # `function_definition` node also contains body
         if node.type == 'function_definition':
+            outer_function = self.inside_function
+
             for child in node.children:
                 if child.type == 'function_declarator':
                     for grandchild in child.children:
                         if grandchild.type == 'identifier':
-                            inside_function = src[grandchild.start_byte:grandchild.end_byte]
+                            self.inside_function = self.text(grandchild)
 
-        elif node.type == 'call_expression':
-            for child in node.children:
-                if child.type == 'identifier':
-                    called_function = src[child.start_byte:child.end_byte]
+            def leave():
+                self.inside_function = outer_function
 
-                    if called_function == inside_function:
-                        yield 'Direct recursion is not allowed.'
+            return leave
 
         for child in node.children:
-            yield from recurse_on_node(child, inside_function)
+            if child.type == 'identifier' and self.text(child) == self.inside_function:
+                self.report('Direct recursion is not allowed.', child)
 
-    yield from recurse_on_node(tree.root_node, None)
+        return None
 
 
-def handle_disallow_dunders(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'identifier':
-            symbol = src[node.start_byte:node.end_byte]
+class DisallowArraysVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'array_declarator'})
+    message = 'Arrays are disallowed.'
 
-            if (s := symbol.decode('utf8')).startswith('__'):
-                yield f'`{s}` is disallowed.'
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+class DisallowNonnumericDefinesVisitor(RuleVisitor):
+    node_types = frozenset({'preproc_function_def', 'preproc_arg'})
 
-    yield from recurse_on_node(tree.root_node)
+    def enter(self, node: Node) -> None:
+        if node.type == 'preproc_function_def' or \
+                not re.match(r'(\+|-)?\d+(\.\d*)?', self.text(node).decode('utf8')):
+            self.report('`define` preprocessor directives for nonnumeric values are disallowed.', node)
 
 
-def handle_disallow_symbols(tree: Tree, src: bytes,
-                            disallowed_symbols: list[str]) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'identifier':
-            symbol = src[node.start_byte:node.end_byte]
+class DisallowAtypicalControlFlowVisitor(RuleVisitor):
+    node_types = frozenset({'goto_statement', 'call_expression'})
 
-            if (s := symbol.decode('utf8')) in disallowed_symbols:
-                yield f'`{s}` is disallowed.'
+    def enter(self, node: Node) -> None:
+        if node.type == 'goto_statement':
+            self.report('`goto` is disallowed.', node)
+            return
 
         for child in node.children:
-            yield from recurse_on_node(child)
+            if child.type == 'identifier' and self.text(child) == b'longjmp':
+                self.report('`longjmp` is disallowed.', child)
+                break
 
-    yield from recurse_on_node(tree.root_node)
 
+class DisallowBracelessBlocksVisitor(RuleVisitor):
+    node_types = frozenset({
+        'if_statement',
+        'while_statement',
+        'do_statement',
+        'for_statement',
+        'else_clause',
+    })
 
-def handle_limit_source_bytes(src: bytes, limit: int):
-    if len(src) > limit:
-        yield f'Source code is too long; must be at most {limit} bytes.'
+    def enter(self, node: Node) -> None:
+        # Special handling of `else` due to `else if` case
+        braces = {'compound_statement', 'if_statement'} if node.type == 'else_clause' else {'compound_statement'}
 
+        if not [child for child in node.children if child.type in braces]:
+            self.report('Blocks without enclosing braces are disallowed.', node)
 
-def handle_limit_defined_functions(tree: Tree, limit: int) -> Generator[str, None, None]:
-    total = 0
 
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        nonlocal total
+class DisallowAsmVisitor(_NodeTypeVisitor):
+    node_types = frozenset({'gnu_asm_expression'})
+    message = '`asm` is disallowed.'
 
-        if node.type == 'function_definition':
-            total += 1
 
-            if total > limit:
-                yield f'Too many defined functions; at most {limit} function{"" if limit == 1 else "s"} can be defined.'
+def _include_names(visitor: RuleVisitor, node: Node) -> Generator[tuple[str, Node], None, None]:
+    if node.type == 'system_lib_string':
+        yield visitor.text(node).replace(b"<", b"").replace(b">", b"").decode('utf8'), node
 
+    else:
         for child in node.children:
-            yield from recurse_on_node(child)
+            if child.type == 'string_literal':
+                for grandchild in child.children:
+                    if grandchild.type == 'string_content':
+                        yield visitor.text(grandchild).decode('utf8'), grandchild
 
-    yield from recurse_on_node(tree.root_node)
 
+class RequireIncludesVisitor(RuleVisitor):
+    node_types = frozenset({'system_lib_string', 'preproc_include'})
 
-def handle_disallow_arrays(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'array_declarator':
-            yield 'Arrays are disallowed.'
+    def __init__(self, src: bytes, required_includes: tuple[str, ...]):
+        super().__init__(src)
+        self.includes_left = set(required_includes)
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+    def enter(self, node: Node) -> None:
+        for s, _ in _include_names(self, node):
+            self.includes_left.discard(s)
 
-    yield from recurse_on_node(tree.root_node)
+    def merge(self, other: 'RequireIncludesVisitor') -> None:
+        super().merge(other)
+        # In place, so that the message lists names in the same order
+        self.includes_left.difference_update(self.includes_left - other.includes_left)
 
+    def finish(self) -> None:
+        if self.includes_left:
+            self.report(f'Must include: {", ".join(self.includes_left)}')
 
-def handle_disallow_nonnumeric_defines(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'preproc_function_def':
-            yield '`define` preprocessor directives for nonnumeric values are disallowed.'
 
-        elif node.type == 'preproc_arg':
-            value = src[node.start_byte:node.end_byte]
+class AllowIncludesVisitor(RuleVisitor):
+    node_types = frozenset({'system_lib_string', 'preproc_include'})
 
-            if not re.match(r'(\+|-)?\d+(\.\d*)?', value.decode('utf8')):
-                yield '`define` preprocessor directives for nonnumeric values are disallowed.'
+    def __init__(self, src: bytes, allowed_includes: tuple[str, ...],
+                 required_includes: tuple[str, ...]):
+        super().__init__(src)
+        self.allowed_includes = frozenset(allowed_includes) | frozenset(required_includes)
 
+    def enter(self, node: Node) -> None:
+        for s, name_node in _include_names(self, node):
+            if s not in self.allowed_includes:
+                self.report(f'Including {s} is disallowed.', name_node)
+
+
+class RequireFunctionsVisitor(RuleVisitor):
+    node_types = frozenset({'function_declarator'})
+
+    def __init__(self, src: bytes, required_functions: tuple[str, ...]):
+        super().__init__(src)
+        self.required_functions = required_functions
+        self.functions_left = set(required_functions)
+
+    def enter(self, node: Node) -> Callable[[], None]:
         for child in node.children:
-            yield from recurse_on_node(child)
+            if child.type == 'identifier':
+                self.functions_left.discard(self.text(child).decode('utf8'))
 
-    yield from recurse_on_node(tree.root_node)
+        return self.prune()
 
+    def merge(self, other: 'RequireFunctionsVisitor') -> None:
+        super().merge(other)
+        self.functions_left.difference_update(self.functions_left - other.functions_left)
 
-def handle_require_includes(tree: Tree, src: bytes,
-                            required_includes: list[str]) -> Generator[str, None, None]:
-    includes_left = set(required_includes)
+    def finish(self) -> None:
+        for function_name in set(self.required_functions):
+            if function_name in self.functions_left:
+                self.report(f'The function `{function_name}` must be defined.')
 
-    def recurse_on_node(node: Node):
-        nonlocal includes_left
 
-        if node.type == 'system_lib_string':
-            identifier = src[node.start_byte:node.end_byte].replace(
-                b"<", b"").replace(b">", b"")
+class DisallowSyntaxErrorsVisitor(RuleVisitor):
+    # Errors are searched from the root, which is the first node entered
+    node_types = frozenset({'translation_unit'})
 
-            if (s := identifier.decode('utf8')) in includes_left:
-                includes_left.remove(s)
+    def enter(self, node: Node) -> None:
+        for error in find_syntax_errors(node):
+            self.report(syntax_error_message(*error.start_point, error.type if error.is_missing else None), error)
 
-        elif node.type == 'preproc_include':
-            for child in node.children:
-                if child.type == 'string_literal':
-                    for grandchild in child.children:
-                        if grandchild.type == 'string_content':
-                            identifier = src[grandchild.start_byte:grandchild.end_byte]
 
-                            if (s := identifier.decode('utf8')) in includes_left:
-                                includes_left.remove(s)
+def syntax_error_messages(root: Node) -> list[str]:
+    """The messages `DisallowSyntaxErrorsVisitor` reports for `root`, without locations"""
+    visitor = DisallowSyntaxErrorsVisitor(b'')
+    visitor.enter(root)
 
-        for child in node.children:
-            recurse_on_node(child)
+    return visitor.violations
 
-    recurse_on_node(tree.root_node)
 
-    if includes_left:
-        yield f'Must include: {", ".join(includes_left)}'
+class LimitSourceBytesVisitor(RuleVisitor):
+    def __init__(self, src: bytes, limit: int):
+        super().__init__(src)
+        self.limit = limit
 
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return f'Source code is too long; must be at most {limit} bytes.'
 
-def handle_allow_includes(tree: Tree, src: bytes, allowed_includes: list[str],
-                          required_includes: list[str]) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'system_lib_string':
-            identifier = src[node.start_byte:node.end_byte].replace(
-                b"<", b"").replace(b">", b"")
+    def finish(self) -> None:
+        if len(self.src) > self.limit:
+            self.report(self.fixed_message(self.limit))
 
-            s = identifier.decode('utf8')
-            if s not in allowed_includes and s not in required_includes:
-                yield f'Including {s} is disallowed.'
 
-        elif node.type == 'preproc_include':
-            for child in node.children:
-                if child.type == 'string_literal':
-                    for grandchild in child.children:
-                        if grandchild.type == 'string_content':
-                            identifier = src[grandchild.start_byte:grandchild.end_byte]
+class LimitNodesVisitor(RuleVisitor):
+    node_types = frozenset({'translation_unit'})
 
-                            s = identifier.decode('utf8')
-                            if s not in allowed_includes and s not in required_includes:
-                                yield f'Including {s} is disallowed.'
+    def __init__(self, src: bytes, limit: int):
+        super().__init__(src)
+        self.limit = limit
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return nodes_message(limit)
 
-    yield from recurse_on_node(tree.root_node)
+    def enter(self, node: Node) -> None:
+        if node.descendant_count > self.limit:
+            self.report(nodes_message(self.limit), node)
 
 
-def handle_disallow_atypical_control_flow(tree: Tree, src: bytes) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'goto_statement':
-            yield '`goto` is disallowed.'
+class LimitNestingDepthVisitor(RuleVisitor):
+    node_types = NESTING_TYPES | {'function_definition', 'else_clause'}
 
-        if node.type == 'call_expression':
-            for child in node.children:
-                if child.type == 'identifier':
-                    identifier = src[child.start_byte:child.end_byte]
+    def __init__(self, src: bytes, limit: int):
+        super().__init__(src)
+        self.limit = limit
+        self.level = 0
+        self.continued: set[int] = set()
 
-                    if identifier == b'longjmp':
-                        yield '`longjmp` is disallowed.'
-                        break
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return nesting_depth_message(limit)
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+    def enter(self, node: Node) -> Callable[[], None] | None:
+        opens = node.type in NESTING_TYPES and node.id not in self.continued
+        self.continued.discard(node.id)
+        self.continued.update(nesting_continuations(node))
 
-    yield from recurse_on_node(tree.root_node)
+        if not opens:
+            return None
 
+        self.level += 1
 
-def handle_disallow_braceless_blocks(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type in {
-                'if_statement',
-                'while_statement',
-                'do_statement',
-                'for_statement',
-        }:
-            if not [child for child in node.children if child.type == 'compound_statement']:
-                yield 'Blocks without enclosing braces are disallowed.'
+        if self.level > self.limit and not self.violations:
+            self.report(nesting_depth_message(self.limit), node)
 
-        # Special handling of `else` due to `else if` case
-        if node.type == 'else_clause':
-            if not [child for child in node.children if child.type in {
-                'compound_statement',
-                'if_statement',
-            }]:
-                yield 'Blocks without enclosing braces are disallowed.'
+        return self._leave
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+    def _leave(self) -> None:
+        self.level -= 1
 
-    yield from recurse_on_node(tree.root_node)
 
+class _PerFunctionVisitor(RuleVisitor, ABC):
+    """Reports every function in which `counts` is true for more than `limit` nodes"""
+    initial: ClassVar[int] = 0
 
-def handle_require_functions(tree: Tree, src: bytes,
-                             required_functions: list[str] | None) -> Generator[str, None, None]:
-    if required_functions is None:
-        return
+    def __init__(self, src: bytes, limit: int):
+        super().__init__(src)
+        self.limit = limit
+        self.count: int | None = None
 
-    functions_left = set(required_functions)
+    @abstractmethod
+    def counts(self, node: Node) -> bool:
+        ...
 
-    def recurse_on_node(node: Node):
-        if node.type == 'function_declarator':
-            for child in node.children:
-                if child.type == 'identifier':
-                    identifier = src[child.start_byte:child.end_byte].decode(
-                        'utf8')
-                    if identifier in functions_left:
-                        functions_left.remove(identifier)
-        else:
-            for child in node.children:
-                recurse_on_node(child)
+    @classmethod
+    @abstractmethod
+    def fixed_message(cls, limit: int) -> str:
+        ...
+
+    def enter(self, node: Node) -> Callable[[], None] | None:
+        if node.type == 'function_definition':
+            self.count = self.initial
 
-    recurse_on_node(tree.root_node)
+            return lambda: self._leave_function(node)
 
-    for function_name in set(required_functions):
-        if function_name in functions_left:
-            yield f'The function `{function_name}` must be defined.'
+        if self.count is not None and self.counts(node):
+            self.count += 1
 
+        return None
 
-def handle_disallow_asm(tree: Tree) -> Generator[str, None, None]:
-    def recurse_on_node(node: Node) -> Generator[str, None, None]:
-        if node.type == 'gnu_asm_expression':
-            yield '`asm` is disallowed.'
+    def _leave_function(self, node: Node) -> None:
+        if self.count > self.limit:
+            self.report(self.fixed_message(self.limit), node)
 
-        for child in node.children:
-            yield from recurse_on_node(child)
+        self.count = None
+
+
+class LimitFunctionStatementsVisitor(_PerFunctionVisitor):
+    node_types = STATEMENT_TYPES | {'function_definition'}
+
+    def counts(self, node: Node) -> bool:
+        return True
+
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return function_statements_message(limit)
+
+
+class LimitCyclomaticComplexityVisitor(_PerFunctionVisitor):
+    node_types = DECISION_TYPES | {'function_definition'}
+    initial = 1
+
+    def counts(self, node: Node) -> bool:
+        return is_decision_point(node)
+
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return cyclomatic_complexity_message(limit)
+
+
+class LimitDefinedFunctionsVisitor(RuleVisitor):
+    node_types = frozenset({'function_definition'})
+
+    def __init__(self, src: bytes, limit: int):
+        super().__init__(src)
+        self.limit = limit
+        self.total = 0
+
+    def enter(self, node: Node) -> None:
+        self.total += 1
+
+    def merge(self, other: 'LimitDefinedFunctionsVisitor') -> None:
+        super().merge(other)
+        self.total += other.total
+
+    @classmethod
+    def fixed_message(cls, limit: int) -> str:
+        return f'Too many defined functions; at most {limit} function{"" if limit == 1 else "s"} can be defined.'
+
+    def finish(self) -> None:
+        if self.total > self.limit:
+            self.report(self.fixed_message(self.limit))
+
+
+RULE_VISITORS: dict[str, type[RuleVisitor]] = {
+    'dunders': DisallowDundersVisitor,
+    'require_functions': RequireFunctionsVisitor,
+    'main': DisallowMainVisitor,
+    'assignment': DisallowAssignmentVisitor,
+    'reassignment': DisallowReassignmentVisitor,
+    'loops': DisallowLoopsVisitor,
+    'if_statements': DisallowIfStatementsVisitor,
+    'helper_functions': DisallowHelperFunctionsVisitor,
+    'printing': DisallowPrintingVisitor,
+    'direct_recursion': DisallowDirectRecursionVisitor,
+    'arrays': DisallowArraysVisitor,
+    'nonnumeric_defines': DisallowNonnumericDefinesVisitor,
+    'atypical_control_flow': DisallowAtypicalControlFlowVisitor,
+    'braceless_blocks': DisallowBracelessBlocksVisitor,
+    'asm': DisallowAsmVisitor,
+    'syntax_errors': DisallowSyntaxErrorsVisitor,
+    'disallow_symbols': DisallowSymbolsVisitor,
+    'limit_source_bytes': LimitSourceBytesVisitor,
+    'limit_defined_functions': LimitDefinedFunctionsVisitor,
+    'limit_nodes': LimitNodesVisitor,
+    'limit_nesting_depth': LimitNestingDepthVisitor,
+    'limit_function_statements': LimitFunctionStatementsVisitor,
+    'limit_cyclomatic_complexity': LimitCyclomaticComplexityVisitor,
+    'require_includes': RequireIncludesVisitor,
+    'allow_includes': AllowIncludesVisitor,
+}
+"""
+Rule IDs are the entries of `Rules.disallow` or the name of the `Rules` field
+for everything else; `dunders` is always checked.
+"""
+
+
+DISALLOW_RULE_IDS = frozenset({
+    'main',
+    'assignment',
+    'reassignment',
+    'loops',
+    'if_statements',
+    'helper_functions',
+    'printing',
+    'direct_recursion',
+    'arrays',
+    'nonnumeric_defines',
+    'atypical_control_flow',
+    'braceless_blocks',
+    'asm',
+    'syntax_errors',
+})
+
+
+@dataclass(frozen=True)
+class RuleCheck:
+    rule_id: str
+    params: tuple[Any, ...] = ()
+
+    def make_visitor(self, src: bytes) -> RuleVisitor:
+        return RULE_VISITORS[self.rule_id](src, *self.params)
+
+    @property
+    def fixed_message(self) -> str | None:
+        return RULE_VISITORS[self.rule_id].fixed_message(*self.params)
+
+
+@dataclass(frozen=True)
+class CompiledRules:
+    """
+    Hashable, immutable form of `Rules` as the list of individual checks to
+    run; see `compile_rules`.
+    """
+    checks: tuple[RuleCheck, ...]
+    fail_fast: bool = False
+    """Whether sources with syntax errors are only checked by `syntax_errors`"""
+    limit_nodes: int | None = None
+    """Sources with more nodes are only checked by `limit_nodes`"""
+
+    @property
+    def gates(self) -> tuple[RuleCheck, ...]:
+        """
+        Checks that, when violated, are the only ones run, in the order they
+        are decided.
+        """
+        gates = []
+
+        if self.limit_nodes is not None:
+            gates.append(RuleCheck('limit_nodes', (self.limit_nodes,)))
+
+        if self.fail_fast:
+            gates.append(SYNTAX_ERRORS_CHECK)
+
+        return tuple(gates)
+
+    def checks_for(self, tree: Tree) -> tuple[RuleCheck, ...]:
+        """
+        The checks to run on `tree`, which is only a violated gate if any. Both
+        gates are decided from the root without a traversal.
+        """
+        if self.limit_nodes is not None and tree.root_node.descendant_count > self.limit_nodes:
+            return (RuleCheck('limit_nodes', (self.limit_nodes,)),)
+
+        if self.fail_fast and tree.root_node.has_error:
+            return (SYNTAX_ERRORS_CHECK,)
+
+        return self.checks
+
+
+SYNTAX_ERRORS_CHECK = RuleCheck('syntax_errors')
+
+
+def compile_rules(rules: Rules | CompiledRules) -> CompiledRules:
+    if isinstance(rules, CompiledRules):
+        return rules
+
+    def tuple_or_none(value: list[str] | None):
+        return tuple(value) if value is not None else None
+
+    required_functions = tuple_or_none(rules.require_functions)
+    checks = [RuleCheck('dunders')]
+
+    if rules.require_functions:
+        checks.append(RuleCheck('require_functions', (required_functions,)))
+
+    if rules.disallow:
+        for rule_id in dict.fromkeys(rules.disallow):
+            if rule_id == 'helper_functions':
+                checks.append(RuleCheck(rule_id, (required_functions,)))
+
+            # TODO: `function_pointers`
+            elif rule_id in DISALLOW_RULE_IDS:
+                checks.append(RuleCheck(rule_id))
+
+    if rules.disallow_symbols:
+        checks.append(RuleCheck('disallow_symbols', (tuple(rules.disallow_symbols),)))
+
+    # Must do handling for falsy 0
+    if rules.limit_source_bytes is not None:
+        checks.append(RuleCheck('limit_source_bytes', (rules.limit_source_bytes,)))
+
+    # Must do handling for falsy 0
+    if rules.limit_defined_functions is not None:
+        if rules.require_functions is not None:
+            assert rules.limit_defined_functions >= len(
+                rules.require_functions), \
+                f'Setup error: `limit_defined_functions` ({rules.limit_defined_functions}) must be greater than or equal to `len(rules.require_functions)` ({len(rules.require_functions)})'
+
+        checks.append(RuleCheck('limit_defined_functions', (rules.limit_defined_functions,)))
+
+    # Must do handling for falsy 0
+    if rules.limit_nodes is not None:
+        checks.append(RuleCheck('limit_nodes', (rules.limit_nodes,)))
+
+    if rules.limit_nesting_depth is not None:
+        checks.append(RuleCheck('limit_nesting_depth', (rules.limit_nesting_depth,)))
+
+    if rules.limit_function_statements is not None:
+        checks.append(RuleCheck('limit_function_statements', (rules.limit_function_statements,)))
+
+    if rules.limit_cyclomatic_complexity is not None:
+        checks.append(RuleCheck('limit_cyclomatic_complexity', (rules.limit_cyclomatic_complexity,)))
+
+    if rules.require_includes:
+        checks.append(RuleCheck('require_includes', (tuple(rules.require_includes),)))
+
+    # None means allow all; [] means allow none
+    if rules.allow_includes is not None:
+        checks.append(RuleCheck('allow_includes',
+                                (tuple(rules.allow_includes), tuple(rules.require_includes or []))))
+
+    return CompiledRules(tuple(checks), bool(rules.fail_fast) and SYNTAX_ERRORS_CHECK in checks, rules.limit_nodes)
+
+
+def run_checks(tree: Tree, src: bytes, checks: Iterable[RuleCheck]) -> dict[RuleCheck, list[str]]:
+    """
+    Runs all `checks` over a single traversal of `tree`; identical checks are
+    only run once.
+    """
+    return {check: visitor.violations for check, visitor in run_visitors(tree, src, checks).items()}
+
+
+def run_visitors(tree: Tree, src: bytes, checks: Iterable[RuleCheck]) -> dict[RuleCheck, RuleVisitor]:
+    """Same as `run_checks`, returning the finished visitors"""
+    visitors = {check: check.make_visitor(src) for check in checks}
+
+    if by_type := index_by_node_type(visitors.values()):
+        visit_tree(tree.root_node, by_type)
+
+    for visitor in visitors.values():
+        visitor.finish()
+
+    return visitors
+
+
+def index_by_node_type(visitors: Iterable[RuleVisitor]) -> dict[str, list[RuleVisitor]]:
+    by_type: dict[str, list[RuleVisitor]] = {}
+
+    for visitor in visitors:
+        for node_type in visitor.node_types:
+            by_type.setdefault(node_type, []).append(visitor)
+
+    return by_type
+
+
+def visit_tree(node: Node, by_type: dict[str, list[RuleVisitor]]) -> None:
+    leave_callbacks: list[tuple[int, Callable[[], None]]] = []
+    # Only the root can be a `translation_unit`, e.g. with only `syntax_errors`
+    nodes = [(node, 0)] if by_type.keys() == {'translation_unit'} else walk_tree(node)
+
+    for child, depth in nodes:
+        # Pre-order: anything at the same depth or above is outside the subtree
+        while leave_callbacks and leave_callbacks[-1][0] >= depth:
+            leave_callbacks.pop()[1]()
+
+        if visitors := by_type.get(child.type):
+            for visitor in visitors:
+                if not visitor.pruned and (leave := visitor.enter(child)) is not None:
+                    leave_callbacks.append((depth, leave))
+
+    while leave_callbacks:
+        leave_callbacks.pop()[1]()
+
+
+def check_against(src: bytes, rule_sets: Iterable[Rules | CompiledRules]) -> list[set[str]]:
+    """
+    Checks `src` against several rule sets at once, parsing and traversing it
+    only once. Returns the unique violations of each rule set, in order.
+    """
+    compiled = [compile_rules(rules) for rules in rule_sets]
+    tree = Parser(C_LANGUAGE).parse(src)
+    checks = dict.fromkeys(check for rules in compiled for check in rules.checks_for(tree))
+    results = run_checks(tree, src, checks)
+
+    return [{violation for check in rules.checks_for(tree) for violation in results[check]}
+            for rules in compiled]
+
+
+def group_by_rule(results: dict[RuleCheck, list[str]]) -> dict[str, set[str]]:
+    """
+    Unique violations of `run_checks` results grouped by rule ID; rules
+    without violations are omitted.
+    """
+    by_rule: dict[str, set[str]] = {}
+
+    for check, violations in results.items():
+        if violations:
+            by_rule.setdefault(check.rule_id, set()).update(violations)
+
+    return by_rule
+
+
+def get_violations_by_rule(src: bytes, rules: Rules | CompiledRules) -> dict[str, set[str]]:
+    """Unique violations grouped by rule ID; see `group_by_rule`"""
+    tree = Parser(C_LANGUAGE).parse(src)
+
+    return group_by_rule(run_checks(tree, src, dict.fromkeys(compile_rules(rules).checks_for(tree))))
+
+
+class LineIndex:
+    """
+    Rows and columns of byte offsets in `src`, found by bisecting the offsets
+    of its line starts. The index is built on first use and shared by every
+    lookup, which is much cheaper than `Node.start_point` per node.
+    """
+
+    def __init__(self, src: bytes):
+        self.src = src
+        self.row = 0
+
+    @cached_property
+    def line_starts(self) -> list[int]:
+        line_starts = [0]
+        line_starts.extend(match.end() for match in re.finditer(b'\n', self.src))
+
+        return line_starts
+
+    def point(self, offset: int) -> tuple[int, int]:
+        """Zero-based row and byte column of `offset`, like `Node.start_point`"""
+        # Consecutive lookups are mostly on the same line
+        starts = self.line_starts
+        row = self.row
+
+        if not (starts[row] <= offset and (row + 1 == len(starts) or offset < starts[row + 1])):
+            row = self.row = bisect_right(starts, offset) - 1
+
+        return row, offset - starts[row]
+
+
+@dataclass(frozen=True)
+class Violation:
+    rule_id: str
+    message: str
+    start_byte: int
+    """-1 if the violation has no single location, e.g. a missing include"""
+    end_byte: int
+    lines: LineIndex = field(compare=False, repr=False)
+
+    @property
+    def start_point(self) -> tuple[int, int] | None:
+        return self.lines.point(self.start_byte) if self.start_byte >= 0 else None
+
+    @property
+    def end_point(self) -> tuple[int, int] | None:
+        return self.lines.point(self.end_byte) if self.end_byte >= 0 else None
+
+    @property
+    def line(self) -> int | None:
+        """One-based, like in editors and compiler messages"""
+        return self.start_point[0] + 1 if self.start_byte >= 0 else None
+
+    @property
+    def column(self) -> int | None:
+        """One-based, counted in bytes"""
+        return self.start_point[1] + 1 if self.start_byte >= 0 else None
+
+    def to_dict(self) -> dict[str, Any]:
+        result: dict[str, Any] = {'rule': self.rule_id, 'message': self.message}
+
+        if self.start_byte >= 0:
+            (start_row, start_column), (end_row, end_column) = self.start_point, self.end_point
+            result.update(start_byte=self.start_byte, end_byte=self.end_byte,
+                          line=start_row + 1, column=start_column + 1, end_line=end_row + 1, end_column=end_column + 1)
+
+        return result
+
+
+def collect_violations(src: bytes, visitors: dict[RuleCheck, RuleVisitor]) -> list[Violation]:
+    """
+    Every violation found by `visitors`, ordered by location; violations
+    without one come last.
+    """
+    lines = LineIndex(src)
+    violations = [Violation(check.rule_id, message, start_byte, end_byte, lines)
+                  for check, visitor in visitors.items()
+                  for message, start_byte, end_byte in zip(visitor.violations, visitor.start_bytes,
+                                                           visitor.end_bytes)]
+    violations.sort(key=lambda violation: (violation.start_byte < 0, violation.start_byte))
+
+    return violations
+
+
+def get_violations(src: bytes, rules: Rules | CompiledRules) -> list[Violation]:
+    """
+    The violations of `get_unique_rule_violations` as `Violation` records,
+    with the rule and location of every occurrence. Lines are only resolved
+    when asked for.
+    """
+    tree = Parser(C_LANGUAGE).parse(src)
 
-    yield from recurse_on_node(tree.root_node)
+    return collect_violations(src, run_visitors(tree, src, dict.fromkeys(compile_rules(rules).checks_for(tree))))
 
 
 def main():
@@ -0,0 +1,179 @@
+"""
+Columnar batch results for corpus-wide statistics.
+
+Instead of a set of message strings per submission, `check_batch_columnar`
+returns one row per (submission, violated rule) in parallel NumPy arrays:
+submission index, rule code, number of violations and the first byte offset.
+Rules are coded by their position in `RULE_IDS`. Workers send rows back as
+packed integers, so nothing per-violation is pickled, and aggregates per rule
+and problem are computed with `np.bincount` rather than Python loops.
+
+`ViolationTable.to_arrow` and `write_parquet` additionally need PyArrow.
+
+Requires NumPy (`pip install c-rule-enforcer[numpy]`).
+"""
+import os
+from array import array
+from dataclasses import dataclass
+from functools import partial
+from typing import Mapping, Sequence
+
+from c_rule_enforcer import RULE_VISITORS, CompiledRules, Rules, compile_rules, run_visitors
+from batch import Mode, get_parser, make_executor
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+RULE_IDS = tuple(RULE_VISITORS)
+"""Rule IDs by rule code"""
+
+_RULE_CODES = {rule_id: code for code, rule_id in enumerate(RULE_IDS)}
+
+_FIELDS = 4
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required for columnar results; install c-rule-enforcer[numpy]')
+
+
+@dataclass(eq=False)
+class ViolationTable:
+    """
+    One row per violated rule of each submission, sorted by submission. Clean
+    submissions have no rows; `problem` and `problems` still count them.
+    """
+    submission: 'np.ndarray'
+    rule: 'np.ndarray'
+    count: 'np.ndarray'
+    first_byte: 'np.ndarray'
+    """-1 when none of the violations has a location"""
+    problem: 'np.ndarray'
+    """Problem code of every submission (not row)"""
+    problems: list[str]
+    """Problem names by problem code"""
+
+    def __len__(self) -> int:
+        return len(self.submission)
+
+    @property
+    def submissions(self) -> int:
+        return len(self.problem)
+
+    def per_rule(self) -> dict[str, tuple[int, int]]:
+        """Number of violating submissions and of violations of every violated rule"""
+        submissions = np.bincount(self.rule, minlength=len(RULE_IDS))
+        violations = np.bincount(self.rule, weights=self.count, minlength=len(RULE_IDS))
+
+        return {RULE_IDS[code]: (int(submissions[code]), int(violations[code]))
+                for code in np.flatnonzero(submissions)}
+
+    def submissions_by_problem_and_rule(self) -> 'np.ndarray':
+        """Matrix of the number of submissions violating each rule (columns) per problem (rows)"""
+        cells = self.problem[self.submission].astype(np.int64) * len(RULE_IDS) + self.rule
+
+        return np.bincount(cells, minlength=len(self.problems) * len(RULE_IDS)).reshape(len(self.problems), -1)
+
+    def rejection_rates(self) -> dict[str, float]:
+        """Share of the submissions of each problem with at least one violation"""
+        rejected = np.bincount(self.problem[np.unique(self.submission)], minlength=len(self.problems))
+        totals = np.bincount(self.problem, minlength=len(self.problems))
+
+        return {name: float(rejected[code] / totals[code]) if totals[code] else 0.0
+                for code, name in enumerate(self.problems)}
+
+    def to_arrow(self) -> 'pyarrow.Table':
+        if pyarrow is None:
+            raise ImportError('PyArrow is required for Arrow and Parquet output')
+
+        rules = pyarrow.DictionaryArray.from_arrays(self.rule.astype(np.int32), list(RULE_IDS))
+        problems = pyarrow.DictionaryArray.from_arrays(self.problem[self.submission].astype(np.int32), self.problems)
+
+        return pyarrow.table({
+            'submission': self.submission,
+            'problem': problems,
+            'rule': rules,
+            'count': self.count,
+            'first_byte': self.first_byte,
+        })
+
+    def write_parquet(self, path: str | os.PathLike) -> None:
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(self.to_arrow(), path)
+
+
+def _columnar_chunk(rules: tuple[CompiledRules, ...], items: list[tuple[int, int, bytes]]) -> bytes:
+    records = array('q')
+
+    for i, rules_index, src in items:
+        tree = get_parser().parse(src)
+
+        for check, visitor in run_visitors(tree, src, rules[rules_index].checks_for(tree)).items():
+            if visitor.violations:
+                located = [start_byte for start_byte in visitor.start_bytes if start_byte >= 0]
+                records.extend((i, _RULE_CODES[check.rule_id], len(visitor.violations), min(located, default=-1)))
+
+    return records.tobytes()
+
+
+def check_batch_columnar(sources: Sequence[bytes],
+                         rules: Rules | CompiledRules | Mapping[str, Rules | CompiledRules],
+                         problems: Sequence[str] | None = None, workers: int | None = None,
+                         mode: Mode = 'thread', chunk_size: int | None = None) -> ViolationTable:
+    """
+    Checks every source like `check_batch`, returning a `ViolationTable`.
+    `rules` may map problem names to rules, in which case `problems` gives the
+    problem of each source.
+    """
+    _require_numpy()
+
+    if isinstance(rules, Mapping):
+        if problems is None:
+            raise ValueError('problems must give the problem of each source when rules is a mapping')
+
+        if len(problems) != len(sources):
+            raise ValueError(f'Got {len(problems)} problems for {len(sources)} sources')
+
+        if unknown := set(problems) - rules.keys():
+            raise ValueError(f'No rules for problems: {", ".join(sorted(unknown))}')
+
+        names = list(rules)
+        compiled = tuple(compile_rules(problem_rules) for problem_rules in rules.values())
+        codes = {name: code for code, name in enumerate(names)}
+        problem = np.array([codes[name] for name in problems], dtype=np.int32)
+    else:
+        names = ['default']
+        compiled = (compile_rules(rules),)
+        problem = np.zeros(len(sources), dtype=np.int32)
+
+    workers = workers or os.cpu_count() or 1
+
+    if chunk_size is None:
+        chunk_size = max(1, len(sources) // (workers * 4))
+    elif chunk_size < 1:
+        raise ValueError(f'chunk_size must be at least 1, not {chunk_size}')
+
+    items = [(i, int(problem[i]), src) for i, src in enumerate(sources)]
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    with make_executor(mode, workers) as executor:
+        packed = b''.join(executor.map(partial(_columnar_chunk, compiled), chunks))
+
+    rows = np.frombuffer(packed, dtype=np.int64).reshape(-1, _FIELDS)
+
+    return ViolationTable(
+        submission=rows[:, 0].astype(np.int32),
+        rule=rows[:, 1].astype(np.int16),
+        count=rows[:, 2].astype(np.int32),
+        first_byte=rows[:, 3].copy(),
+        problem=problem,
+        problems=names,
+    )
@@ -0,0 +1,322 @@
+"""
+Resumable, shardable corpus runner.
+
+A manifest lists submissions, either one path per line or JSON lines with
+`id`, `path` and optionally `problem`. Relative paths are relative to the
+manifest. The rules file maps problem names to `Rules.from_dict` dicts; entries
+without a problem use `default`.
+
+Submissions are assigned to N shards by a stable hash of their ID, so every
+shard can run as an independent process (or on another machine sharing the
+output directory). Each shard appends its results to its own JSONL file and
+skips submissions already in it when restarted. `merge` combines the shard
+files in manifest order.
+
+With `--trace`, every shard records spans for reading, parsing, checking and
+serializing every submission (see `tracing.py`), and the shards' traces are
+merged into one Chrome trace-event file. `--trace-rules` adds a span per rule.
+
+With `--sqlite`, results are also written to a SQLite database with the
+violations grouped by rule (see `sinks.py`), for queries such as which rules
+reject most submissions of a problem. Shards write to it concurrently. Results
+are held in memory between checkpoints and only written to the results files
+once the database has committed them, so a resumed run never skips a
+submission the database lacks, and the rows it checks again are replaced:
+resumed runs neither lose nor duplicate rows.
+
+With `--memory` or `--memory-budget`, each result records the check's memory
+use, and checks over budget are abandoned with an `over_budget` result instead
+of violations (see `memory.py`).
+
+Usage:
+    python corpus.py run MANIFEST RULES OUT_DIR --shards N [--shard I] [--trace TRACE]
+                         [--trace-rules] [--sqlite DB] [--memory] [--memory-budget BYTES]
+    python corpus.py merge MANIFEST OUT_DIR MERGED
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+from c_rule_enforcer import CompiledRules, Rules, compile_rules
+from batch import check_source, check_source_by_rule
+from memory import check_with_budget
+from sinks import SqliteSink, connect
+from tracing import Tracer, merge_traces, traced_check, traced_check_by_rule
+
+
+@dataclass(frozen=True)
+class Submission:
+    id: str
+    path: Path
+    problem: str = 'default'
+
+
+def read_manifest(manifest: str | os.PathLike) -> list[Submission]:
+    manifest = Path(manifest)
+    submissions = []
+
+    for line in manifest.read_text().splitlines():
+        if not (line := line.strip()):
+            continue
+
+        if line.startswith('{'):
+            entry = json.loads(line)
+            path = entry['path']
+            submission_id = str(entry.get('id', path))
+            problem = entry.get('problem', 'default')
+        else:
+            path = submission_id = line
+            problem = 'default'
+
+        submissions.append(Submission(submission_id, manifest.parent / path, problem))
+
+    return submissions
+
+
+def read_rules(path: str | os.PathLike) -> dict[str, CompiledRules]:
+    with open(path) as f:
+        return {problem: compile_rules(Rules.from_dict(d)) for problem, d in json.load(f).items()}
+
+
+def shard_of(submission_id: str, shards: int) -> int:
+    # Unlike `hash`, stable across processes and runs
+    return int.from_bytes(hashlib.sha1(submission_id.encode()).digest()[:8], 'big') % shards
+
+
+def shard_path(out_dir: str | os.PathLike, shard: int, shards: int) -> Path:
+    return Path(out_dir) / f'shard-{shard:04d}-of-{shards:04d}.jsonl'
+
+
+def read_results(path: Path) -> dict[str, dict[str, Any]]:
+    """
+    Reads complete lines of a results file, truncating a partially written
+    last line left by a crash.
+    """
+    results = {}
+
+    if not path.exists():
+        return results
+
+    with open(path, 'rb+') as f:
+        valid = 0
+
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+
+            results[result['id']] = result
+            valid += len(line)
+
+        f.truncate(valid)
+
+    return results
+
+
+def _sink_error(result: dict[str, Any]) -> str | None:
+    if 'over_budget' in result:
+        return f'Over the memory budget at the {result["over_budget"]} stage'
+
+    return result.get('error')
+
+
+def run_shard(submissions: Iterable[Submission], rules: dict[str, CompiledRules],
+              out_dir: str | os.PathLike, shard: int, shards: int, checkpoint_every: int = 100,
+              trace: str | os.PathLike | None = None, memory: bool = False,
+              memory_budget: int | None = None, trace_rules: bool = False,
+              sqlite: str | os.PathLike | None = None) -> int:
+    """
+    Checks the submissions of `shard` that are not in its results file yet.
+    Results are written and flushed to disk every `checkpoint_every`
+    submissions. Returns the number of submissions checked.
+
+    If `trace` is given, a Chrome trace of the shard is written there, with
+    per-rule spans if `trace_rules`. With `memory` or a `memory_budget`, checks
+    are accounted by `check_with_budget`. If `sqlite` is given, results are
+    also added to that database, with the violations grouped by rule.
+    """
+    path = shard_path(out_dir, shard, shards)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    done = read_results(path)
+    checked = 0
+    lines: list[str] = []
+    tracer = Tracer(f'shard {shard}') if trace is not None else None
+    sink = SqliteSink(sqlite, checkpoint_every) if sqlite is not None else None
+
+    def span(name: str, category: str = 'check', **args: Any):
+        return tracer.span(name, category, **args) if tracer else nullcontext()
+
+    def checkpoint(f) -> None:
+        # The database first, so that every result the file keeps is in it
+        if sink is not None:
+            sink.flush()
+
+        f.write(''.join(lines))
+        lines.clear()
+        f.flush()
+        os.fsync(f.fileno())
+
+    with open(path, 'a') as f:
+        for submission in submissions:
+            if shard_of(submission.id, shards) != shard or submission.id in done:
+                continue
+
+            result: dict[str, Any] = {'id': submission.id, 'problem': submission.problem}
+            by_rule: dict[str, set[str]] = {}
+
+            with span(submission.id, 'submission'):
+                try:
+                    with span('read'):
+                        src = submission.path.read_bytes()
+
+                    problem_rules = rules[submission.problem]
+
+                    # With a sink, the generic engine runs instead, since its results can be grouped by rule
+                    if memory or memory_budget is not None:
+                        with span('check'):
+                            budgeted = check_with_budget(src, problem_rules, memory_budget)
+
+                        result.update(budgeted.to_dict())
+                        by_rule = budgeted.by_rule or {}
+                    elif sink is not None:
+                        by_rule = traced_check_by_rule(tracer, src, problem_rules, trace_rules) if tracer else \
+                            check_source_by_rule(src, problem_rules)
+                        result['violations'] = sorted(set().union(*by_rule.values()))
+                    elif tracer:
+                        result['violations'] = sorted(traced_check(tracer, src, problem_rules, trace_rules))
+                    else:
+                        result['violations'] = sorted(check_source(src, problem_rules))
+
+                # Anything else would abort the shard, and every resume with it
+                except Exception as e:
+                    result['error'] = f'{type(e).__name__}: {e}'
+
+                with span('serialize'):
+                    lines.append(json.dumps(result) + '\n')
+
+                    if sink is not None:
+                        sink.add(submission.id, submission.problem, by_rule, _sink_error(result))
+
+            checked += 1
+
+            if checked % checkpoint_every == 0:
+                with span('checkpoint'):
+                    checkpoint(f)
+
+        checkpoint(f)
+
+        if sink is not None:
+            sink.close()
+
+    if tracer:
+        tracer.write(trace)
+
+    return checked
+
+
+def run_shards(manifest: str | os.PathLike, rules: str | os.PathLike, out_dir: str | os.PathLike,
+               shards: int, only: Iterable[int] | None = None, trace: str | os.PathLike | None = None,
+               memory: bool = False, memory_budget: int | None = None, trace_rules: bool = False,
+               sqlite: str | os.PathLike | None = None) -> None:
+    """
+    Runs each shard in `only` (default: all) as its own local process. If
+    `trace` is given, the shards' traces are merged into it.
+    """
+    submissions = read_manifest(manifest)
+    compiled = read_rules(rules)
+    selected = list(only if only is not None else range(shards))
+    traces = [Path(out_dir) / f'trace-{shard:04d}-of-{shards:04d}.json' if trace is not None else None
+              for shard in selected]
+
+    if sqlite is not None:
+        # Creates the schema once rather than in every shard at the same time
+        connect(sqlite).close()
+
+    processes = [
+        multiprocessing.Process(target=run_shard,
+                                args=(submissions, compiled, out_dir, shard, shards),
+                                kwargs={'trace': shard_trace, 'memory': memory, 'memory_budget': memory_budget,
+                                        'trace_rules': trace_rules, 'sqlite': sqlite})
+        for shard, shard_trace in zip(selected, traces)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+        if process.exitcode:
+            raise RuntimeError(f'Shard process exited with {process.exitcode}; rerun to resume')
+
+    if trace is not None:
+        merge_traces(traces, trace)
+
+
+def merge(manifest: str | os.PathLike, out_dir: str | os.PathLike, merged: str | os.PathLike) -> int:
+    """
+    Writes the results of all shards in manifest order. Returns the number of
+    submissions that have no result yet.
+    """
+    results = {}
+
+    for path in sorted(Path(out_dir).glob('shard-*.jsonl')):
+        results.update(read_results(path))
+
+    missing = 0
+
+    with open(merged, 'w') as f:
+        for submission in read_manifest(manifest):
+            if (result := results.get(submission.id)) is None:
+                missing += 1
+            else:
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks a corpus of submissions in resumable shards.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run')
+    run.add_argument('manifest')
+    run.add_argument('rules')
+    run.add_argument('out_dir')
+    run.add_argument('--shards', type=int, default=1)
+    run.add_argument('--shard', type=int, action='append',
+                     help='Shard to run; repeatable. Default: all, each in its own process.')
+    run.add_argument('--trace', help='Write a Chrome trace-event JSON file of the run')
+    run.add_argument('--trace-rules', action='store_true', help='Also trace each rule on its own')
+    run.add_argument('--sqlite', help='Also write results to this SQLite database')
+    run.add_argument('--memory', action='store_true', help='Record the memory use of every check')
+    run.add_argument('--memory-budget', type=int, help='Abandon checks estimated to use more bytes')
+
+    merge_command = commands.add_parser('merge')
+    merge_command.add_argument('manifest')
+    merge_command.add_argument('out_dir')
+    merge_command.add_argument('merged')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_shards(args.manifest, args.rules, args.out_dir, args.shards, args.shard, args.trace,
+                   args.memory, args.memory_budget, args.trace_rules, args.sqlite)
+
+    elif missing := merge(args.manifest, args.out_dir, args.merged):
+        print(f'{missing} submissions have no result yet')
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
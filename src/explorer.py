@@ -1,12 +1,22 @@
+import argparse
+import json
+import os
 import sys
-from typing import Generator
+import tarfile
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Generator, Iterable, Literal, TextIO
 
-import tree_sitter_c as tsc
-from tree_sitter import Language, Parser, Node
+from tree_sitter import Parser, Node, Tree
+
+from c_rule_enforcer import (C_LANGUAGE, DISALLOW_RULE_IDS, RULE_VISITORS, CompiledRules, LineIndex, Rules,
+                             compile_rules, run_visitors, walk_tree)
 
 
 def explore(path: str) -> Generator[str, None, None]:
-    C_LANGUAGE = Language(tsc.language())
     parser = Parser(C_LANGUAGE)
 
     with open(path, 'rb') as f:
@@ -14,18 +24,404 @@ def explore(path: str) -> Generator[str, None, None]:
 
     tree = parser.parse(src)
 
-    def recurse_on_node(node: Node, level: int) -> Generator[str, None, None]:
-        print(f'{"-" * (level * 2)}{node.type}')
+    for node, level in walk_tree(tree.root_node):
+        yield f'{"-" * (level * 2)}{node.type}'
 
-        for child in node.children:
-            yield from recurse_on_node(child, level + 1)
 
-    yield from recurse_on_node(tree.root_node, 0)
+DumpFormat = Literal['tree', 'sexp', 'json']
 
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Usage: python3 explorer.py <path_to_c_file>')
-        exit(-1)
+def walk_fields(node: Node, include: Callable[[Node], bool] | None = None,
+                max_depth: int | None = None) -> Generator[tuple[Node, int, str | None], None, None]:
+    """
+    Like `walk_tree`, also yielding the field name of every node, which only
+    the cursor knows. Nodes for which `include` returns `False` are skipped
+    with their subtrees, as is everything deeper than `max_depth`; `node`
+    itself is always included.
+    """
+    cursor = node.walk()
+    depth = 0
+
+    while True:
+        if depth == 0 or include is None or include(cursor.node):
+            yield cursor.node, depth, cursor.field_name
+
+            if (max_depth is None or depth < max_depth) and cursor.goto_first_child():
+                depth += 1
+                continue
+
+        while True:
+            if depth == 0:
+                return
+
+            if cursor.goto_next_sibling():
+                break
+
+            cursor.goto_parent()
+            depth -= 1
+
+
+class _BufferedWriter:
+    def __init__(self, out: TextIO, size: int = 4096):
+        self.out = out
+        self.size = size
+        self.parts: list[str] = []
+
+    def write(self, part: str) -> None:
+        self.parts.append(part)
+
+        if len(self.parts) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        self.out.write(''.join(self.parts))
+        self.parts.clear()
+
+
+Nodes = Iterable[tuple[Node, int, str | None]]
+Points = Callable[[int], tuple[int, int]]
+
+
+def _dump_tree(nodes: Nodes, points: Points, out: _BufferedWriter) -> None:
+    for node, depth, _ in nodes:
+        out.write(f'{"-" * (depth * 2)}{node.type}\n')
+
+
+def _dump_sexp(nodes: Nodes, points: Points, out: _BufferedWriter) -> None:
+    names: dict[tuple[str, bool], str] = {}
+    open_nodes = 0
+
+    for node, depth, field_name in nodes:
+        # Pre-order: anything at the same depth or above is closed
+        closing = ')' * (open_nodes - depth)
+        open_nodes = depth + 1
+
+        if (name := names.get(key := (node.type, node.is_named))) is None:
+            # Anonymous nodes are quoted, as in `tree-sitter parse`
+            name = names[key] = key[0] if key[1] else json.dumps(key[0])
+
+        start_byte, end_byte = node.start_byte, node.end_byte
+        (start_row, start_column), (end_row, end_column) = points(start_byte), points(end_byte)
+        line_start = '\n' + '  ' * depth if depth else ''
+        field_prefix = f'{field_name}: ' if field_name else ''
+        out.write(f'{closing}{line_start}{field_prefix}({name} [{start_row}, {start_column}] - [{end_row}, {end_column}] '
+                  f'{start_byte}..{end_byte}')
+
+    out.write(')' * open_nodes + '\n')
+
+
+def _dump_json(nodes: Nodes, points: Points, out: _BufferedWriter) -> None:
+    quoted: dict[str | None, str] = {None: 'null'}
+    open_nodes = 0
+
+    for node, depth, field_name in nodes:
+        # A node following closed ones is their sibling
+        closing = ']}' * (open_nodes - depth) + ',' if open_nodes > depth else ''
+        open_nodes = depth + 1
+
+        if (node_type := quoted.get(node.type)) is None:
+            node_type = quoted[node.type] = json.dumps(node.type)
+
+        if (field := quoted.get(field_name)) is None:
+            field = quoted[field_name] = json.dumps(field_name)
+
+        start_byte, end_byte = node.start_byte, node.end_byte
+        (start_row, start_column), (end_row, end_column) = points(start_byte), points(end_byte)
+        out.write(f'{closing}{{"type": {node_type}, "field": {field}, "start_byte": {start_byte}, "end_byte": {end_byte}, '
+                  f'"start_point": [{start_row}, {start_column}], "end_point": [{end_row}, {end_column}], '
+                  f'"children": [')
+
+    out.write(']}' * open_nodes + '\n')
+
+
+_DUMPERS: dict[str, Callable[[Nodes, Points, _BufferedWriter], None]] = {
+    'tree': _dump_tree,
+    'sexp': _dump_sexp,
+    'json': _dump_json,
+}
+
+
+def dump(tree: Tree, src: bytes, out: TextIO, fmt: DumpFormat = 'sexp', node_types: Iterable[str] | None = None,
+         byte_range: tuple[int, int] | None = None, max_depth: int | None = None,
+         named_only: bool = False) -> None:
+    """
+    Writes `tree` to `out` as an indented list of node types (`tree`), an
+    S-expression or JSON, with the byte and point ranges and field names of
+    every node. JSON is written as one document per line.
+
+    With `node_types`, only the subtrees rooted at nodes of those types are
+    written, each as its own document. `byte_range` limits the output to nodes
+    overlapping `[start, end)`, and `max_depth` to nodes at most that deep
+    below each written root.
+    """
+    start, end = byte_range or (0, tree.root_node.end_byte)
+    node_types = frozenset(node_types) if node_types is not None else None
+    writer = _BufferedWriter(out)
+    points = LineIndex(src).point
+
+    def include(node: Node) -> bool:
+        return node.end_byte > start and node.start_byte < end and (node.is_named or not named_only)
+
+    include_all = byte_range is None and not named_only
+
+    if node_types is None:
+        roots: Iterable[Node] = [tree.root_node]
+    else:
+        # Matches are not searched for again inside a written subtree
+        def descend(node: Node) -> bool:
+            return node.type not in node_types and include(node)
+
+        roots = (node for node, _ in walk_tree(tree.root_node, descend) if node.type in node_types and include(node))
+
+    for root in roots:
+        _DUMPERS[fmt](walk_fields(root, None if include_all else include, max_depth), points, writer)
+
+    writer.flush()
+
+
+@dataclass
+class NodeTypeStats:
+    count: int = 0
+    files: int = 0
+    """Number of files with at least one node of this type"""
+    bytes: int = 0
+    """Source bytes covered, counting nested nodes of the same type again"""
+    depths: Counter[int] = field(default_factory=Counter)
+
+    def merge(self, other: 'NodeTypeStats') -> None:
+        self.count += other.count
+        self.files += other.files
+        self.bytes += other.bytes
+        self.depths.update(other.depths)
+
+    def depth_quantile(self, q: float) -> int:
+        rank = q * self.count
+        seen = 0
+
+        for depth in sorted(self.depths):
+            seen += self.depths[depth]
+
+            if seen >= rank:
+                return depth
+
+        return 0
+
+
+@dataclass
+class CorpusStats:
+    files: int = 0
+    bytes: int = 0
+    node_types: dict[str, NodeTypeStats] = field(default_factory=dict)
+    candidate_files: Counter[str] = field(default_factory=Counter)
+    """Number of files containing a node type each checked rule looks at"""
+    violating_files: Counter[str] = field(default_factory=Counter)
+    """Number of files violating each checked rule"""
+
+    def merge(self, other: 'CorpusStats') -> None:
+        self.files += other.files
+        self.bytes += other.bytes
+        self.candidate_files.update(other.candidate_files)
+        self.violating_files.update(other.violating_files)
+
+        for node_type, stats in other.node_types.items():
+            self.node_types.setdefault(node_type, NodeTypeStats()).merge(stats)
+
+    def rule_selectivity(self) -> list[dict[str, Any]]:
+        """
+        Per rule: the share of files containing a node type the rule looks at
+        (what a node-type prefilter would let through), the share of files
+        violating it, and the number of nodes it is entered for. Sorted by
+        violations per entered node, the best order for failing fast.
+        """
+        rules = []
 
-    print(*explore(sys.argv[1]))
+        for rule_id in sorted(self.violating_files):
+            entered = sum(self.node_types[t].count for t in RULE_VISITORS[rule_id].node_types if t in self.node_types)
+
+            rules.append({
+                'rule': rule_id,
+                'candidate_files': self.candidate_files[rule_id] / self.files if self.files else 0.0,
+                'violating_files': self.violating_files[rule_id] / self.files if self.files else 0.0,
+                'entered_nodes': entered,
+            })
+
+        return sorted(rules, key=lambda rule: -rule['violating_files'] / (rule['entered_nodes'] or 1))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'node_types': {
+                node_type: {
+                    'count': stats.count,
+                    'files': stats.files,
+                    'bytes': stats.bytes,
+                    'depths': dict(sorted(stats.depths.items())),
+                } for node_type, stats in sorted(self.node_types.items(), key=lambda item: -item[1].count)
+            },
+            'rules': self.rule_selectivity(),
+        }
+
+
+def file_stats(src: bytes, rules: Rules | CompiledRules) -> CorpusStats:
+    tree = Parser(C_LANGUAGE).parse(src)
+    checks = compile_rules(rules).checks_for(tree)
+    node_types: dict[str, NodeTypeStats] = {}
+
+    for node, depth in walk_tree(tree.root_node):
+        if (stats := node_types.get(node.type)) is None:
+            stats = node_types[node.type] = NodeTypeStats(files=1)
+
+        stats.count += 1
+        stats.bytes += node.end_byte - node.start_byte
+        stats.depths[depth] += 1
+
+    # Rules are kept with a count of 0, so that they are still reported
+    candidates = Counter({check.rule_id: int(not (types := RULE_VISITORS[check.rule_id].node_types)
+                                             or not types.isdisjoint(node_types))
+                          for check in checks})
+    violating = Counter({check.rule_id: int(bool(visitor.violations))
+                         for check, visitor in run_visitors(tree, src, checks).items()})
+
+    return CorpusStats(1, len(src), node_types, candidates, violating)
+
+
+def _chunk_stats(rules: CompiledRules, sources: list[bytes]) -> CorpusStats:
+    stats = CorpusStats()
+
+    for src in sources:
+        stats.merge(file_stats(src, rules))
+
+    return stats
+
+
+def iter_sources(path: str | os.PathLike, extensions: Iterable[str] = ('.c',)) -> Generator[bytes, None, None]:
+    """Yields the matching files in a file, directory or zip/tar archive"""
+    path = Path(path)
+
+    if path.is_dir():
+        for file in sorted(path.rglob('*')):
+            if file.is_file() and file.suffix.lower() in extensions:
+                yield file.read_bytes()
+
+    elif zipfile.is_zipfile(path) or tarfile.is_tarfile(path):
+        from archives import iter_archive
+
+        for _, src in iter_archive(path, extensions):
+            yield src
+
+    else:
+        yield path.read_bytes()
+
+
+def corpus_stats(paths: Iterable[str | os.PathLike], rules: Rules | CompiledRules | None = None,
+                 workers: int | None = None, chunk_size: int = 32) -> CorpusStats:
+    """
+    Node type statistics and rule violation counts of every source under
+    `paths`, computed in `workers` processes. Rules default to all `disallow`
+    rules.
+    """
+    rules = compile_rules(rules or Rules.from_dict({'disallow': sorted(DISALLOW_RULE_IDS)}))
+    workers = workers or os.cpu_count() or 1
+    total = CorpusStats()
+
+    def chunks() -> Generator[list[bytes], None, None]:
+        chunk = []
+
+        for path in paths:
+            for src in iter_sources(path):
+                chunk.append(src)
+
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+
+        if chunk:
+            yield chunk
+
+    with ProcessPoolExecutor(workers) as executor:
+        # Bounded, so that a huge corpus is not read into memory at once
+        in_flight: set[Future] = set()
+
+        for chunk in chunks():
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    total.merge(future.result())
+
+            in_flight.add(executor.submit(_chunk_stats, rules, chunk))
+
+        for future in in_flight:
+            total.merge(future.result())
+
+    return total
+
+
+def format_stats(stats: CorpusStats, top: int | None = None) -> Generator[str, None, None]:
+    yield f'{stats.files} files, {stats.bytes} bytes'
+    yield ''
+    yield f'{"node type":<32} {"count":>10} {"files":>7} {"bytes":>7} {"depth p50/p90/max":>18}'
+
+    ordered = sorted(stats.node_types.items(), key=lambda item: -item[1].count)
+
+    for node_type, node_stats in ordered[:top]:
+        depths = f'{node_stats.depth_quantile(0.5)}/{node_stats.depth_quantile(0.9)}/{max(node_stats.depths)}'
+        yield (f'{node_type:<32} {node_stats.count:>10} {node_stats.files / stats.files:>7.1%} '
+               f'{node_stats.bytes / stats.bytes if stats.bytes else 0:>7.1%} {depths:>18}')
+
+    yield ''
+    yield f'{"rule":<24} {"candidates":>10} {"violating":>10} {"entered nodes":>14}'
+
+    for rule in stats.rule_selectivity():
+        yield (f'{rule["rule"]:<24} {rule["candidate_files"]:>10.1%} {rule["violating_files"]:>10.1%} '
+               f'{rule["entered_nodes"]:>14}')
+
+
+def _byte_range(value: str) -> tuple[int, int]:
+    start, _, end = value.partition(':')
+
+    return int(start or 0), int(end) if end else sys.maxsize
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Explores the syntax trees of C sources.')
+    parser.add_argument('paths', nargs='+', help='C file, or with --stats, directories and zip/tar archives')
+    parser.add_argument('--format', choices=['tree', 'sexp', 'json'], default='tree')
+    parser.add_argument('--type', action='append', dest='node_types', help='Only dump subtrees of this node type')
+    parser.add_argument('--bytes', type=_byte_range, help='Only dump nodes overlapping START:END')
+    parser.add_argument('--max-depth', type=int)
+    parser.add_argument('--named', action='store_true', help='Skip anonymous nodes such as punctuation')
+    parser.add_argument('--stats', action='store_true', help='Report node type and rule statistics of a corpus')
+    parser.add_argument('--rules', help='JSON rules (`Rules.from_dict`) to estimate selectivity with')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, help='Only list the most frequent node types')
+    args = parser.parse_args()
+
+    if not args.stats:
+        if len(args.paths) != 1:
+            print('Usage: python3 explorer.py <path_to_c_file>')
+            exit(-1)
+
+        with open(args.paths[0], 'rb') as f:
+            src = f.read()
+
+        dump(Parser(C_LANGUAGE).parse(src), src, sys.stdout, args.format, args.node_types, args.bytes, args.max_depth, args.named)
+        return
+
+    rules = None
+
+    if args.rules:
+        with open(args.rules) as f:
+            rules = Rules.from_dict(json.load(f))
+
+    stats = corpus_stats(args.paths, rules, args.workers)
+
+    if args.format == 'json':
+        json.dump(stats.to_dict(), sys.stdout, indent=2)
+    else:
+        print(*format_stats(stats, args.top), sep='\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Memoization of violations per (source hash, individual rule, rule parameters).
+
+Unlike caching whole results per `Rules`, changing one field of a problem's
+rules only recomputes the checks that changed; every other check reuses its
+stored result.
+
+Keys also carry the grammar version and the version of the rule's
+implementation (`RuleVisitor.version`), so a persistent memo never serves
+results computed by an older grammar or an older rule.
+"""
+import fcntl
+import hashlib
+import json
+import shelve
+from collections.abc import MutableMapping
+from typing import IO, TYPE_CHECKING, Iterable
+
+from tree_sitter import Parser
+
+from c_rule_enforcer import (C_LANGUAGE, GRAMMAR_VERSION, RULE_VISITORS, CompiledRules,
+                             RuleCheck, Rules, compile_rules, run_checks)
+
+if TYPE_CHECKING:
+    from snapshot import SnapshotCache
+
+
+def memo_key(digest: str, check: RuleCheck) -> str:
+    params = json.dumps(check.params, separators=(",", ":"))
+
+    return f'{GRAMMAR_VERSION}:{digest}:{check.rule_id}@{RULE_VISITORS[check.rule_id].version}:{params}'
+
+
+class RuleMemo:
+    """
+    `store` maps `memo_key`s to violation lists and defaults to a `dict`; use
+    `RuleMemo.open` for one that persists on disk. If `snapshots` is given,
+    missing checks are evaluated on cached AST snapshots instead of parsing.
+
+    A persistent memo may only be open in one process at a time, since
+    `shelve` does not support concurrent writers; `open` takes an exclusive
+    lock on `path + '.lock'` and fails if another process holds it.
+    """
+
+    def __init__(self, store: MutableMapping[str, list[str]] | None = None,
+                 snapshots: 'SnapshotCache | None' = None):
+        self.store = store if store is not None else {}
+        self.snapshots = snapshots
+        self.hits = 0
+        self.misses = 0
+        self._lock: IO | None = None
+
+    @classmethod
+    def open(cls, path: str, snapshots: 'SnapshotCache | None' = None) -> 'RuleMemo':
+        lock = open(path + '.lock', 'w')
+
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise RuntimeError(f'Memo {path} is already open in another process') from None
+
+        try:
+            memo = cls(shelve.open(path), snapshots)
+        except BaseException:
+            # e.g. a corrupt database; closing the file releases the lock
+            lock.close()
+            raise
+
+        memo._lock = lock
+
+        return memo
+
+    def close(self) -> None:
+        if isinstance(self.store, shelve.Shelf):
+            self.store.close()
+
+        if self._lock is not None:
+            # Closing the file releases the lock
+            self._lock.close()
+            self._lock = None
+
+    def __enter__(self) -> 'RuleMemo':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def check(self, src: bytes, rules: Rules | CompiledRules) -> set[str]:
+        digest = hashlib.sha256(src).hexdigest()
+        compiled = compile_rules(rules)
+        checks = dict.fromkeys(compiled.checks)
+
+        # Gates decide whether anything else is checked, so they come first
+        for gate in compiled.gates:
+            checks.pop(gate, None)
+
+            if violations := self._check(src, digest, [gate]):
+                return violations
+
+        return self._check(src, digest, checks)
+
+    def _check(self, src: bytes, digest: str, checks: Iterable[RuleCheck]) -> set[str]:
+        violations: set[str] = set()
+        missing: list[RuleCheck] = []
+
+        for check in checks:
+            if (stored := self.store.get(memo_key(digest, check))) is not None:
+                violations.update(stored)
+                self.hits += 1
+            else:
+                missing.append(check)
+                self.misses += 1
+
+        if missing:
+            for check, check_violations in self._run(src, missing).items():
+                self.store[memo_key(digest, check)] = check_violations
+                violations.update(check_violations)
+
+        return violations
+
+    def _run(self, src: bytes, checks: list[RuleCheck]) -> dict[RuleCheck, list[str]]:
+        if self.snapshots is not None:
+            from snapshot import SNAPSHOT_RULES
+
+            snapshot = self.snapshots.get(src)
+
+            return {check: SNAPSHOT_RULES[check.rule_id](snapshot, *check.params) for check in checks}
+
+        return run_checks(Parser(C_LANGUAGE).parse(src), src, checks)
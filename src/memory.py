@@ -0,0 +1,145 @@
+"""
+Per-check memory accounting and budgets.
+
+`check_with_budget` reports what a check cost: the source size, the number of
+tree nodes, and the peak of Python allocations traced by `tracemalloc` while
+the rules ran. With a `budget`, the check is abandoned as soon as its estimated
+footprint exceeds it, and an `over_budget` result comes back rather than the
+worker growing until it is OOM-killed. The footprint is checked at three
+stages:
+
+- `source`: the source alone exceeds the budget, so it is not parsed;
+- `tree`: the source plus the tree (`NODE_BYTES` per node) exceed it, so no
+  rule runs;
+- `rules`: the tree plus the traced allocations exceed it while rules run,
+  checked every `POLL_NODES` nodes.
+
+The tree is allocated by tree-sitter in C and is not traced, hence the
+estimate. `tracemalloc` is process-wide, so peaks are only per check when
+checks do not run concurrently in threads of the same process (e.g. in
+`process` mode or a `WarmPool`).
+"""
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any
+
+from tree_sitter import Node
+
+from c_rule_enforcer import (C_LANGUAGE, CompiledRules, RuleVisitor, Rules, compile_rules,
+                             group_by_rule, index_by_node_type, visit_tree)
+from batch import get_parser
+
+NODE_BYTES = 96
+"""Approximate memory used per node of a tree-sitter tree"""
+
+POLL_NODES = 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    def __init__(self, stage: str, used: int, budget: int):
+        super().__init__(f'{stage}: {used} bytes exceeds the budget of {budget} bytes')
+        self.stage = stage
+        self.used = used
+        self.budget = budget
+
+
+@dataclass(frozen=True)
+class MemoryUsage:
+    source_bytes: int
+    nodes: int
+    """0 if the source was not parsed"""
+    peak_traced_bytes: int
+    """Peak of traced Python allocations while the rules ran"""
+
+    @property
+    def estimated_bytes(self) -> int:
+        return self.source_bytes + self.nodes * NODE_BYTES + self.peak_traced_bytes
+
+
+@dataclass(frozen=True)
+class BudgetedResult:
+    violations: set[str] | None
+    """`None` if the check was abandoned"""
+    usage: MemoryUsage
+    over_budget: str | None = None
+    """Stage at which the budget was exceeded: `source`, `tree` or `rules`"""
+    by_rule: dict[str, set[str]] | None = None
+    """The violations grouped by rule ID, as by `get_violations_by_rule`"""
+
+    def to_dict(self) -> dict[str, Any]:
+        result: dict[str, Any] = {'memory': {
+            'source_bytes': self.usage.source_bytes,
+            'nodes': self.usage.nodes,
+            'peak_traced_bytes': self.usage.peak_traced_bytes,
+        }}
+
+        if self.over_budget is not None:
+            result['over_budget'] = self.over_budget
+        else:
+            result['violations'] = sorted(self.violations)
+
+        return result
+
+
+class _BudgetVisitor(RuleVisitor):
+    node_types = frozenset(C_LANGUAGE.node_kind_for_id(kind_id) for kind_id in range(C_LANGUAGE.node_kind_count))
+
+    def __init__(self, src: bytes, base: int, budget: int):
+        super().__init__(src)
+        self.base = base
+        self.budget = budget
+        self.seen = 0
+
+    def enter(self, node: Node) -> None:
+        self.seen += 1
+
+        if self.seen % POLL_NODES == 0 and (used := self.base + tracemalloc.get_traced_memory()[1]) > self.budget:
+            raise MemoryBudgetExceeded('rules', used, self.budget)
+
+
+def check_with_budget(src: bytes, rules: Rules | CompiledRules, budget: int | None = None) -> BudgetedResult:
+    """Same as `check_source`, with memory accounting and an optional budget in bytes"""
+    if budget is not None and len(src) > budget:
+        return BudgetedResult(None, MemoryUsage(len(src), 0, 0), 'source')
+
+    tree = get_parser().parse(src)
+    nodes = tree.root_node.descendant_count
+    base = len(src) + nodes * NODE_BYTES
+
+    if budget is not None and base > budget:
+        return BudgetedResult(None, MemoryUsage(len(src), nodes, 0), 'tree')
+
+    started = not tracemalloc.is_tracing()
+
+    if started:
+        tracemalloc.start()
+
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    visitors = {check: check.make_visitor(src) for check in compile_rules(rules).checks_for(tree)}
+    visiting = list(visitors.values())
+
+    if budget is not None:
+        visiting.append(_BudgetVisitor(src, base - start, budget))
+
+    try:
+        visit_tree(tree.root_node, index_by_node_type(visiting))
+
+        for visitor in visitors.values():
+            visitor.finish()
+
+        by_rule = group_by_rule({check: visitor.violations for check, visitor in visitors.items()})
+        violations = {violation for rule_violations in by_rule.values() for violation in rule_violations}
+        over_budget = None
+
+    except MemoryBudgetExceeded:
+        violations = by_rule = None
+        over_budget = 'rules'
+
+    finally:
+        peak = max(0, tracemalloc.get_traced_memory()[1] - start)
+
+        if started:
+            tracemalloc.stop()
+
+    return BudgetedResult(violations, MemoryUsage(len(src), nodes, peak), over_budget, by_rule)
@@ -0,0 +1,312 @@
+"""
+Runtime metrics for the long-running modes (`pipeline.py`, `WarmPool`).
+
+`measure_source` runs the same specialized checker as `batch.check_source` and
+returns a `Measured` result carrying the parse time, rule time, source size
+and violations per rule. Since it is a plain function returning a picklable value,
+it runs in worker threads, processes or warm workers alike; the consuming side
+folds results into a `Metrics` registry with `record`, which costs a lock and a
+few additions per check.
+
+Cache hits and misses are reported per cache. Each `Measured` carries its
+process's running totals of the checker cache (`specialize.get_checker`), so
+the registry sums the latest totals of every worker process. Caches living in
+the consuming process, such as a `SnapshotCache` or `RuleMemo`, are registered
+with `track_cache` and read whenever metrics are exported.
+
+Metrics are exposed in the Prometheus text format, either as a file for the
+node exporter's textfile collector (`write_textfile`) or over HTTP
+(`serve_metrics`), and as JSON (`Metrics.to_dict`). `PeriodicWriter` rewrites
+the files every few seconds.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable
+
+from c_rule_enforcer import CompiledRules, Rules, compile_rules, run_visitors
+from batch import get_parser
+from specialize import checker_cache_counts, get_checker
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(9))
+
+
+@dataclass(frozen=True)
+class Measured:
+    violations: set[str]
+    source_bytes: int
+    parse_seconds: float
+    rule_seconds: float
+    rule_violations: dict[str, int]
+    """Number of violations of each violated rule"""
+    pid: int
+    checker_cache: tuple[int, int]
+    """Hits and misses so far of the checker cache of process `pid`"""
+
+
+def measure_source(src: bytes, rules: Rules | CompiledRules) -> Measured:
+    """
+    Same as `check_source`, also returning measurements of the check. Rejected
+    submissions are checked again by the shared traversal, off the clock, to
+    attribute their violations to rules.
+    """
+    compiled = compile_rules(rules)
+    checker = get_checker(compiled)
+    start = time.perf_counter()
+    tree = get_parser().parse(src)
+    parsed = time.perf_counter()
+    violations = checker(tree, src)
+    checked = time.perf_counter()
+    rule_violations = {}
+
+    if violations:
+        visitors = run_visitors(tree, src, compiled.checks_for(tree))
+        rule_violations = {check.rule_id: len(visitor.violations)
+                           for check, visitor in visitors.items() if visitor.violations}
+
+    return Measured(
+        violations=violations,
+        source_bytes=len(src),
+        parse_seconds=parsed - start,
+        rule_seconds=checked - parsed,
+        rule_violations=rule_violations,
+        pid=os.getpid(),
+        checker_cache=checker_cache_counts(),
+    )
+
+
+class Histogram:
+    """Prometheus-style histogram; `counts[i]` counts values up to `buckets[i]`"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile (`inf` past the last bucket)"""
+        rank = q * self.count
+        cumulative = 0
+
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+
+            if cumulative >= rank:
+                return bound
+
+        return float('inf')
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'buckets': dict(zip(map(str, self.buckets + (float('inf'),)), self.counts)),
+            'sum': self.sum,
+            'count': self.count,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """Thread-safe registry of the enforcer's counters and histograms"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.checks = 0
+        self.rejected = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rule_violations: Counter[str] = Counter()
+        self.parse_seconds = Histogram(SECONDS_BUCKETS)
+        self.rule_seconds = Histogram(SECONDS_BUCKETS)
+        self.source_bytes = Histogram(BYTES_BUCKETS)
+        self.checker_caches: dict[int, tuple[int, int]] = {}
+        self.caches: dict[str, Any] = {}
+
+    def record(self, measured: Measured) -> None:
+        with self.lock:
+            self.checks += 1
+            self.rejected += bool(measured.violations)
+            self.rule_violations.update(measured.rule_violations)
+            self.parse_seconds.observe(measured.parse_seconds)
+            self.rule_seconds.observe(measured.rule_seconds)
+            self.source_bytes.observe(measured.source_bytes)
+            # Results of one process may be recorded out of order; its totals only grow
+            hits, misses = self.checker_caches.get(measured.pid, (0, 0))
+            self.checker_caches[measured.pid] = (max(hits, measured.checker_cache[0]),
+                                                 max(misses, measured.checker_cache[1]))
+
+    def record_error(self) -> None:
+        with self.lock:
+            self.errors += 1
+
+    def record_timeout(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def track_cache(self, name: str, cache: Any) -> None:
+        """Reports the `hits` and `misses` of a cache of this process, e.g. a `SnapshotCache` or `RuleMemo`"""
+        with self.lock:
+            self.caches[name] = cache
+
+    def _cache_counts(self) -> dict[str, tuple[int, int]]:
+        counts = {'checker': (sum(hits for hits, _ in self.checker_caches.values()),
+                              sum(misses for _, misses in self.checker_caches.values()))}
+
+        for name, cache in self.caches.items():
+            counts[name] = cache.hits, cache.misses
+
+        return counts
+
+    def to_dict(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'checks': self.checks,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'rule_violations': dict(self.rule_violations),
+                'parse_seconds': self.parse_seconds.to_dict(),
+                'rule_seconds': self.rule_seconds.to_dict(),
+                'source_bytes': self.source_bytes.to_dict(),
+                'caches': {name: {'hits': hits, 'misses': misses}
+                           for name, (hits, misses) in self._cache_counts().items()},
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f'# HELP c_rule_enforcer_{name} {help_text}')
+            lines.append(f'# TYPE c_rule_enforcer_{name} {kind}')
+
+        def histogram(name: str, help_text: str, h: Histogram) -> None:
+            metric(name, 'histogram', help_text)
+            cumulative = 0
+
+            for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'c_rule_enforcer_{name}_bucket{{le="{le}"}} {cumulative}')
+
+            lines.append(f'c_rule_enforcer_{name}_sum {h.sum!r}')
+            lines.append(f'c_rule_enforcer_{name}_count {h.count}')
+
+        with self.lock:
+            for name, value, help_text in [
+                ('checks_total', self.checks, 'Submissions checked'),
+                ('rejected_total', self.rejected, 'Submissions with at least one violation'),
+                ('errors_total', self.errors, 'Submissions that could not be checked'),
+                ('timeouts_total', self.timeouts, 'Checks that exceeded their deadline'),
+            ]:
+                metric(name, 'counter', help_text)
+                lines.append(f'c_rule_enforcer_{name} {value}')
+
+            metric('violations_total', 'counter', 'Violations by rule')
+
+            for rule_id, count in sorted(self.rule_violations.items()):
+                lines.append(f'c_rule_enforcer_violations_total{{rule="{rule_id}"}} {count}')
+
+            histogram('parse_seconds', 'Time spent parsing a submission', self.parse_seconds)
+            histogram('rule_seconds', 'Time spent running the rules on a submission', self.rule_seconds)
+            histogram('source_bytes', 'Size of checked submissions', self.source_bytes)
+            caches = sorted(self._cache_counts().items())
+
+            for i, kind in enumerate(['hits', 'misses']):
+                metric(f'cache_{kind}_total', 'counter', f'Cache {kind} by cache')
+
+                for name, counts in caches:
+                    lines.append(f'c_rule_enforcer_cache_{kind}_total{{cache="{name}"}} {counts[i]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path: str | os.PathLike, text: str) -> None:
+    # Readers must never see a partially written file
+    directory = os.path.dirname(os.path.abspath(path))
+
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+        f.write(text)
+
+    os.replace(f.name, path)
+
+
+def write_textfile(metrics: Metrics, path: str | os.PathLike) -> None:
+    _write_atomic(path, metrics.to_prometheus())
+
+
+def write_json(metrics: Metrics, path: str | os.PathLike) -> None:
+    _write_atomic(path, json.dumps(metrics.to_dict(), indent=2) + '\n')
+
+
+def serve_metrics(metrics: Metrics, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Serves `/metrics` (Prometheus) and `/metrics.json` from a daemon thread.
+    Call `shutdown` on the returned server to stop it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(metrics.to_dict()), 'application/json'
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+class PeriodicWriter:
+    """Calls `write(metrics, path)` every `interval` seconds and once more on `close`"""
+
+    def __init__(self, metrics: Metrics, path: str | os.PathLike,
+                 write: Callable[[Metrics, str | os.PathLike], None] = write_json, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.write = write
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write(self.metrics, self.path)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.write(self.metrics, self.path)
+
+    def __enter__(self) -> 'PeriodicWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
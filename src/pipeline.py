@@ -0,0 +1,247 @@
+"""
+Long-lived JSON lines pipeline for queue consumers.
+
+Each input line is an object with an `id`, a `rules` ID from the rules file,
+and either `source` (base64) or `path`. Each output line has the `id` and
+either the sorted `violations` or an `error`, in completion order. At most
+`window` submissions are in flight, so memory stays bounded however fast input
+arrives; reading stdin simply pauses while the window is full.
+
+With any of the `--metrics-*` options, checks are measured and the metrics
+(see `metrics.py`) are served over HTTP and/or periodically written to files.
+A check still running `--timeout` seconds after a worker started it is
+reported as an error right away, and its eventual result is dropped. The start
+is when the executor marks the future running: exact for threads and warm
+workers, while a process pool marks the few calls it queues ahead as running.
+
+Usage: python pipeline.py RULES [--mode thread|process|warm] [--workers N] [--window N]
+           [--timeout SECONDS] [--metrics-port PORT] [--metrics-file PATH] [--metrics-json PATH]
+"""
+import argparse
+import base64
+import binascii
+import json
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import ExitStack
+from typing import Any, Callable, Iterable, TextIO
+
+from c_rule_enforcer import CompiledRules
+from batch import check_source, make_executor
+from corpus import read_rules
+from metrics import (Measured, Metrics, PeriodicWriter, measure_source, serve_metrics,
+                     write_json, write_textfile)
+
+Submit = Callable[[bytes, CompiledRules], 'Future[set[str] | Measured]']
+
+
+class _Writer:
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.lock = threading.Lock()
+
+    def write(self, result: dict) -> None:
+        line = json.dumps(result) + '\n'
+
+        with self.lock:
+            self.out.write(line)
+            self.out.flush()
+
+
+def _field(request: dict, key: str) -> str:
+    if not isinstance(value := request[key], str):
+        raise TypeError(f'{key} must be a string, not {type(value).__name__}')
+
+    return value
+
+
+def _read_source(request: dict) -> bytes:
+    if 'source' in request:
+        return base64.b64decode(_field(request, 'source'), validate=True)
+
+    with open(_field(request, 'path'), 'rb') as f:
+        return f.read()
+
+
+def serve(lines: Iterable[str], out: TextIO, rules: dict[str, CompiledRules],
+          submit: Submit, window: int = 64, metrics: Metrics | None = None,
+          timeout: float | None = None) -> int:
+    """
+    Checks the requests in `lines`, writing results to `out` as they complete.
+    Returns the number of requests read.
+
+    `submit` may return `Measured` results, which are recorded in `metrics`.
+    """
+    writer = _Writer(out)
+    in_flight = threading.BoundedSemaphore(window)
+    idle = threading.Condition()
+    pending = 0
+    count = 0
+    # Request ID of each future whose result is still wanted, and when its check started
+    tracked: dict[Future, tuple[Any, float | None]] = {}
+    stop = threading.Event()
+
+    def release() -> None:
+        nonlocal pending
+
+        in_flight.release()
+
+        with idle:
+            pending -= 1
+            idle.notify_all()
+
+    def settle(future: Future) -> bool:
+        """Releases the slot of `future`; False if that already happened"""
+        with idle:
+            if tracked.pop(future, None) is None:
+                return False
+
+        release()
+
+        return True
+
+    def done(request_id, future: Future) -> None:
+        if not settle(future):
+            # Already reported as timed out
+            return
+
+        try:
+            if isinstance(result := future.result(), Measured):
+                if metrics:
+                    metrics.record(result)
+
+                result = result.violations
+
+            writer.write({'id': request_id, 'violations': sorted(result)})
+
+        except Exception as e:
+            if metrics:
+                metrics.record_error()
+
+            writer.write({'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+
+    def watch() -> None:
+        # Deadlines run from when a worker starts the check, not from submission,
+        # so time spent queued in the executor does not count
+        interval = min(max(timeout / 4, 0.001), 0.05)
+
+        while not stop.wait(interval):
+            now = time.perf_counter()
+            expired = []
+
+            with idle:
+                for future, (request_id, started) in tracked.items():
+                    if started is None:
+                        if future.running():
+                            tracked[future] = request_id, now
+                    elif now - started > timeout:
+                        expired.append((future, request_id))
+
+            for future, request_id in expired:
+                if settle(future):
+                    if metrics:
+                        metrics.record_timeout()
+
+                    writer.write({'id': request_id,
+                                  'error': f'TimeoutError: Check took longer than {timeout} seconds'})
+
+    if timeout is not None:
+        threading.Thread(target=watch, daemon=True).start()
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        count += 1
+        request_id = None
+
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            src = _read_source(request)
+            request_rules = rules[_field(request, 'rules')]
+
+        except (ValueError, KeyError, TypeError, OSError, binascii.Error, AttributeError) as e:
+            if metrics:
+                metrics.record_error()
+
+            writer.write({'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+            continue
+
+        in_flight.acquire()
+
+        with idle:
+            pending += 1
+
+        try:
+            future = submit(src, request_rules)
+
+        except Exception as e:
+            # e.g. a broken or closed pool
+            release()
+
+            if metrics:
+                metrics.record_error()
+
+            writer.write({'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+            continue
+
+        with idle:
+            tracked[future] = request_id, None
+
+        future.add_done_callback(lambda future, request_id=request_id: done(request_id, future))
+
+    with idle:
+        idle.wait_for(lambda: not pending)
+
+    stop.set()
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks JSON lines from stdin, writing results to stdout.')
+    parser.add_argument('rules', help='JSON file mapping rules IDs to rules')
+    parser.add_argument('--mode', choices=['thread', 'process', 'warm'], default='warm')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--window', type=int, default=64, help='Maximum submissions in flight')
+    parser.add_argument('--timeout', type=float, help='Seconds after which a check is reported as timed out')
+    parser.add_argument('--metrics-port', type=int, help='Serve /metrics and /metrics.json on this local port')
+    parser.add_argument('--metrics-file', help='Prometheus textfile to rewrite periodically')
+    parser.add_argument('--metrics-json', help='JSON metrics snapshot to rewrite periodically')
+    parser.add_argument('--metrics-interval', type=float, default=10.0)
+    args = parser.parse_args()
+
+    rules = read_rules(args.rules)
+    metrics = None
+    check = check_source
+
+    with ExitStack() as stack:
+        if args.metrics_port is not None or args.metrics_file or args.metrics_json:
+            metrics = Metrics()
+            check = measure_source
+
+            if args.metrics_port is not None:
+                stack.callback(serve_metrics(metrics, args.metrics_port).shutdown)
+
+            for path, write in [(args.metrics_file, write_textfile), (args.metrics_json, write_json)]:
+                if path:
+                    stack.enter_context(PeriodicWriter(metrics, path, write, args.metrics_interval))
+
+        if args.mode == 'warm':
+            from warm_pool import WarmPool
+
+            pool = stack.enter_context(WarmPool(rules.values(), args.workers, check=check))
+            submit = pool.submit
+
+        else:
+            executor = stack.enter_context(make_executor(args.mode, args.workers))
+            submit = lambda src, compiled: executor.submit(check, src, compiled)  # noqa: E731
+
+        serve(sys.stdin, sys.stdout, rules, submit, args.window, metrics, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Intra-file parallelism for very large sources.
+
+After a single parse, the children of `translation_unit` are split into
+contiguous shards of similar size. Each shard is traversed by its own set of
+visitors, and the partial results are merged with `RuleVisitor.merge`, which
+sums or intersects the state of the cross-declaration rules
+(`limit_defined_functions`, `require_functions`, `require_includes`). Direct
+recursion only looks at the enclosing function, which never spans shards.
+
+In `thread` mode the workers traverse the shared tree; this only runs in
+parallel on free-threaded builds. In `process` mode each worker parses only the
+bytes of its shard, which gives the same tree for top-level declarations as
+long as the source has no syntax errors.
+"""
+import os
+from functools import partial
+
+from tree_sitter import Node, Parser
+
+from c_rule_enforcer import (C_LANGUAGE, CompiledRules, RuleCheck,
+                             RuleVisitor, Rules, Violation, collect_violations,
+                             compile_rules, index_by_node_type, visit_tree)
+from batch import Mode, get_parser, make_executor
+
+
+def split_declarations(root: Node, shards: int) -> list[list[Node]]:
+    """
+    Splits the children of `root` into at most `shards` contiguous groups of
+    roughly equal byte size.
+    """
+    children = root.children
+    target = max(1, (root.end_byte - root.start_byte) // max(1, shards))
+    groups: list[list[Node]] = []
+    group_size = 0
+
+    for child in children:
+        if not groups or (group_size >= target and len(groups) < shards):
+            groups.append([])
+            group_size = 0
+
+        groups[-1].append(child)
+        group_size += child.end_byte - child.start_byte
+
+    return groups
+
+
+def _visit_nodes(checks: tuple[RuleCheck, ...], src: bytes, nodes: list[Node]) -> list[RuleVisitor]:
+    visitors = [check.make_visitor(src) for check in checks]
+
+    if by_type := index_by_node_type(visitors):
+        for node in nodes:
+            visit_tree(node, by_type)
+
+    return visitors
+
+
+def _visit_slice(checks: tuple[RuleCheck, ...], base: int, src: bytes) -> list[RuleVisitor]:
+    visitors = _visit_nodes(checks, src, get_parser().parse(src).root_node.children)
+
+    for visitor in visitors:
+        visitor.rebase(base)
+
+    return visitors
+
+
+def visit_sharded(src: bytes, rules: Rules | CompiledRules, workers: int | None = None,
+                  mode: Mode = 'thread', shards: int | None = None) -> dict[RuleCheck, RuleVisitor]:
+    """
+    Same as `run_visitors`, with the top-level declarations of `src` checked
+    by `workers` threads or processes.
+    """
+    workers = workers or os.cpu_count() or 1
+    tree = Parser(C_LANGUAGE).parse(src)
+    checks = tuple(dict.fromkeys(compile_rules(rules).checks_for(tree)))
+    groups = split_declarations(tree.root_node, shards or workers * 4)
+
+    with make_executor(mode, workers) as executor:
+        if mode == 'process':
+            # Locations in a slice are relative to its start until rebased
+            results = executor.map(partial(_visit_slice, checks), [group[0].start_byte for group in groups],
+                                   [src[group[0].start_byte:group[-1].end_byte] for group in groups])
+        else:
+            results = executor.map(partial(_visit_nodes, checks, src), groups)
+
+        # Rules that only need the source itself (e.g. `limit_source_bytes`) report on `finish`
+        merged = {check: check.make_visitor(src) for check in checks}
+
+        for visitors in results:
+            for visitor, partial_visitor in zip(merged.values(), visitors):
+                visitor.merge(partial_visitor)
+
+    for visitor in merged.values():
+        # The root is in no shard; `syntax_errors` searches from it
+        if tree.root_node.type in visitor.node_types:
+            visitor.enter(tree.root_node)
+
+        visitor.finish()
+
+    return merged
+
+
+def check_sharded(src: bytes, rules: Rules | CompiledRules, workers: int | None = None,
+                  mode: Mode = 'thread', shards: int | None = None) -> set[str]:
+    """Same as `get_unique_rule_violations`, checked like `visit_sharded`"""
+    return {violation for visitor in visit_sharded(src, rules, workers, mode, shards).values()
+            for violation in visitor.violations}
+
+
+def get_violations_sharded(src: bytes, rules: Rules | CompiledRules, workers: int | None = None,
+                           mode: Mode = 'thread', shards: int | None = None) -> list[Violation]:
+    """Same as `get_violations`, checked like `visit_sharded`"""
+    return collect_violations(src, visit_sharded(src, rules, workers, mode, shards))
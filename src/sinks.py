@@ -0,0 +1,134 @@
+"""
+Result sinks for large runs.
+
+`SqliteSink` buffers results and writes them to a local SQLite database in
+one transaction per batch, so a corpus of many thousands of submissions costs
+a few hundred commits instead of one per submission. The database is in WAL
+mode, so readers (e.g. `violation_summary`) can query it while a run is still
+writing.
+
+Schema:
+
+    results(submission_id, problem, passed, error)
+    violations(submission_id, problem, rule, message)
+
+Violations are indexed by problem and rule, and by submission.
+"""
+import os
+import sqlite3
+import threading
+from typing import Iterable, Mapping
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    submission_id TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    error TEXT,
+    PRIMARY KEY (submission_id, problem)
+);
+CREATE TABLE IF NOT EXISTS violations (
+    submission_id TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS violations_by_problem_rule ON violations (problem, rule);
+CREATE INDEX IF NOT EXISTS violations_by_submission ON violations (submission_id, problem);
+CREATE INDEX IF NOT EXISTS results_by_problem ON results (problem);
+"""
+
+
+def connect(path: str | os.PathLike) -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    # Safe in WAL mode: a crash may lose the last batches, never corrupt the database
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(_SCHEMA)
+
+    return db
+
+
+class SqliteSink:
+    """
+    Collects results and writes them `batch_size` at a time. Adding a result
+    for a submission and problem that is already stored replaces it, so reruns
+    are idempotent. `add` may be called from several threads.
+    """
+
+    def __init__(self, path: str | os.PathLike, batch_size: int = 500):
+        self.db = connect(path)
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending: list[tuple[str, str, Mapping[str, Iterable[str]], str | None]] = []
+        self.written = 0
+
+    def add(self, submission_id: str, problem: str,
+            violations: Mapping[str, Iterable[str]] | None = None, error: str | None = None) -> None:
+        """
+        Adds the violations of a submission grouped by rule ID (see
+        `get_violations_by_rule`), or the error that prevented checking it.
+        """
+        with self.lock:
+            self.pending.append((submission_id, problem, violations or {}, error))
+
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.pending:
+            return
+
+        keys = [(submission_id, problem) for submission_id, problem, _, _ in self.pending]
+        results = [
+            (submission_id, problem, error is None and not any(violations.values()), error)
+            for submission_id, problem, violations, error in self.pending
+        ]
+        violations = [
+            (submission_id, problem, rule, message)
+            for submission_id, problem, by_rule, _ in self.pending
+            for rule, messages in by_rule.items()
+            for message in messages
+        ]
+
+        with self.db:
+            self.db.executemany('DELETE FROM violations WHERE submission_id = ? AND problem = ?', keys)
+            self.db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', results)
+            self.db.executemany('INSERT INTO violations VALUES (?, ?, ?, ?)', violations)
+
+        self.written += len(self.pending)
+        self.pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+    def __enter__(self) -> 'SqliteSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def violation_summary(db: sqlite3.Connection, problem: str) -> dict[str, int]:
+    """Number of submissions violating each rule of `problem`, most violated first"""
+    rows = db.execute("""
+        SELECT rule, COUNT(DISTINCT submission_id) AS submissions
+        FROM violations WHERE problem = ?
+        GROUP BY rule ORDER BY submissions DESC, rule
+    """, (problem,))
+
+    return dict(rows)
+
+
+def failing_submissions(db: sqlite3.Connection, problem: str, rule: str) -> list[str]:
+    rows = db.execute("""
+        SELECT DISTINCT submission_id FROM violations
+        WHERE problem = ? AND rule = ? ORDER BY submission_id
+    """, (problem, rule))
+
+    return [submission_id for (submission_id,) in rows]
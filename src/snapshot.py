@@ -0,0 +1,617 @@
+"""
+Array-backed AST snapshots and a NumPy engine that evaluates rules on them.
+
+`snapshot_tree` flattens a tree in one cursor pass into parallel arrays in
+pre-order, so a node is just an index and its subtree is the index range
+`[i, i + size[i])`. Rules are then evaluated as masks and counts over these
+arrays instead of walking `Node` objects, which pays off for large files and
+batch corpora. Results are the same as `get_unique_rule_violations`.
+
+Snapshots can be persisted with `SnapshotCache`, keyed by source hash and
+grammar version, so that replaying changed rules over a corpus memory-maps the
+cached arrays instead of parsing again.
+
+Requires NumPy (`pip install c-rule-enforcer[numpy]`).
+"""
+import hashlib
+import mmap
+import os
+import re
+import struct
+import tempfile
+from array import array
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable
+
+from tree_sitter import Parser, Tree
+
+from c_rule_enforcer import (C_LANGUAGE, DECISION_TYPES, GRAMMAR_VERSION, NESTING_STATEMENTS,
+                             PRINTING_FUNCTIONS, STATEMENT_TYPES, SYNTAX_ERRORS_CHECK,
+                             CompiledRules, RuleCheck, Rules, compile_rules,
+                             cyclomatic_complexity_message, find_syntax_errors,
+                             function_statements_message, nesting_depth_message,
+                             nodes_message, run_checks, syntax_error_message)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+TEXT_NODE_TYPES = frozenset({'identifier', 'system_lib_string', 'string_content', 'preproc_arg'})
+"""Node types whose source text is kept in the snapshot's text table"""
+
+KIND_NAMES = [C_LANGUAGE.node_kind_for_id(kind_id) for kind_id in range(C_LANGUAGE.node_kind_count)]
+
+# Several kind IDs can share one name (e.g. aliases), like `Node.type` does
+_KIND_IDS: dict[str, list[int]] = {}
+for _kind_id, _name in enumerate(KIND_NAMES):
+    _KIND_IDS.setdefault(_name, []).append(_kind_id)
+
+_TEXT_KINDS = frozenset(kind_id for name in TEXT_NODE_TYPES for kind_id in _KIND_IDS[name])
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required for AST snapshots; install c-rule-enforcer[numpy]')
+
+
+@dataclass(eq=False)
+class AstSnapshot:
+    """
+    Parallel arrays of a tree in pre-order. `parent` is -1 for the root and
+    `text_id` is -1 for nodes that are not in `TEXT_NODE_TYPES`; other nodes
+    index into `texts`.
+
+    `syntax_errors` holds the `(row, column, kind)` of the first
+    `MAX_SYNTAX_ERRORS` syntax errors, where `kind` is the kind ID of a missing
+    node or -1 for an `ERROR` node.
+    """
+    kind: Any
+    parent: Any
+    depth: Any
+    size: Any
+    """Number of nodes in the subtree, including the node itself"""
+    start_byte: Any
+    end_byte: Any
+    field_id: Any
+    text_id: Any
+    texts: list[bytes]
+    src_len: int
+    syntax_errors: Any
+    _masks: dict[frozenset[str], Any] = field(default_factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def of_type(self, *node_types: str) -> Any:
+        """Boolean mask of the nodes with any of `node_types`"""
+        key = frozenset(node_types)
+
+        if (mask := self._masks.get(key)) is None:
+            kind_ids = [kind_id for node_type in key for kind_id in _KIND_IDS.get(node_type, [])]
+            mask = self._masks[key] = np.isin(self.kind, kind_ids)
+
+        return mask
+
+    def parent_in(self, mask: Any) -> Any:
+        """Boolean mask of the nodes whose parent is in `mask`"""
+        # Index -1 (root) lands on the padding
+        return np.append(mask, False)[self.parent]
+
+    def has_child_in(self, mask: Any) -> Any:
+        """Boolean mask of the nodes with at least one child in `mask`"""
+        result = np.zeros(len(self) + 1, dtype=bool)
+        result[self.parent[mask]] = True
+
+        return result[:-1]
+
+    def strictly_inside(self, mask: Any) -> Any:
+        """Boolean mask of the nodes with a proper ancestor in `mask`"""
+        (indices,) = np.nonzero(mask)
+        coverage = np.zeros(len(self) + 1, dtype=np.int64)
+        np.add.at(coverage, indices + 1, 1)
+        np.add.at(coverage, indices + self.size[indices], -1)
+
+        return np.cumsum(coverage[:-1]) > 0
+
+    def inside_count(self, mask: Any) -> Any:
+        """Number of nodes in `mask` that are each node or one of its ancestors"""
+        (indices,) = np.nonzero(mask)
+        coverage = np.zeros(len(self) + 1, dtype=np.int64)
+        np.add.at(coverage, indices, 1)
+        np.add.at(coverage, indices + self.size[indices], -1)
+
+        return np.cumsum(coverage[:-1])
+
+    def per_subtree_count(self, roots: Any, mask: Any) -> Any:
+        """Number of nodes in `mask` in the subtree of each node in `roots`"""
+        (indices,) = np.nonzero(roots)
+        counts = np.concatenate(([0], np.cumsum(mask)))
+
+        return counts[indices + self.size[indices]] - counts[indices]
+
+    def texts_of(self, mask: Any) -> list[bytes]:
+        """Unique texts of the nodes in `mask`"""
+        return [self.texts[text_id] for text_id in np.unique(self.text_id[mask]) if text_id >= 0]
+
+    @cached_property
+    def identifiers(self) -> Any:
+        return self.of_type('identifier')
+
+
+def snapshot_tree(tree: Tree, src: bytes) -> AstSnapshot:
+    _require_numpy()
+
+    kind = array('H')
+    parent = array('i')
+    depth = array('I')
+    size = array('I')
+    start_byte = array('I')
+    end_byte = array('I')
+    field_id = array('H')
+    text_id = array('i')
+    text_table: dict[bytes, int] = {}
+
+    cursor = tree.walk()
+    ancestors: list[int] = []
+    level = 0
+
+    while True:
+        node = cursor.node
+        index = len(kind)
+        del ancestors[level:]
+
+        kind.append(node.kind_id)
+        parent.append(ancestors[-1] if ancestors else -1)
+        depth.append(level)
+        size.append(node.descendant_count)
+        start_byte.append(node.start_byte)
+        end_byte.append(node.end_byte)
+        field_id.append(cursor.field_id or 0)
+
+        if node.kind_id in _TEXT_KINDS:
+            text = src[node.start_byte:node.end_byte]
+            text_id.append(text_table.setdefault(text, len(text_table)))
+        else:
+            text_id.append(-1)
+
+        ancestors.append(index)
+
+        if cursor.goto_first_child():
+            level += 1
+            continue
+
+        while level and not cursor.goto_next_sibling():
+            cursor.goto_parent()
+            level -= 1
+
+        if not level:
+            break
+
+    syntax_errors = [(*node.start_point, node.kind_id if node.is_missing else -1)
+                     for node in find_syntax_errors(tree.root_node)]
+
+    return AstSnapshot(
+        kind=np.frombuffer(kind, dtype=np.uint16),
+        parent=np.frombuffer(parent, dtype=np.int32),
+        depth=np.frombuffer(depth, dtype=np.uint32),
+        size=np.frombuffer(size, dtype=np.uint32),
+        start_byte=np.frombuffer(start_byte, dtype=np.uint32),
+        end_byte=np.frombuffer(end_byte, dtype=np.uint32),
+        field_id=np.frombuffer(field_id, dtype=np.uint16),
+        text_id=np.frombuffer(text_id, dtype=np.int32),
+        texts=list(text_table),
+        src_len=len(src),
+        syntax_errors=np.array(syntax_errors, dtype=np.int64).reshape(-1, 3),
+    )
+
+
+def snapshot_source(src: bytes) -> AstSnapshot:
+    return snapshot_tree(Parser(C_LANGUAGE).parse(src), src)
+
+
+_MAGIC = b'CRESNAP2'
+_HEADER = struct.Struct('<8sQQQQQ')
+# (field, dtype) in file order; every array starts 8-byte aligned
+_ARRAYS = [
+    ('kind', 'u2'),
+    ('parent', 'i4'),
+    ('depth', 'u4'),
+    ('size', 'u4'),
+    ('start_byte', 'u4'),
+    ('end_byte', 'u4'),
+    ('field_id', 'u2'),
+    ('text_id', 'i4'),
+]
+
+
+def _padding(offset: int) -> int:
+    return -offset % 8
+
+
+def save_snapshot(snapshot: AstSnapshot, path: str | os.PathLike) -> None:
+    """
+    Writes `snapshot` in a memory-mappable layout: header, the node arrays,
+    the syntax errors, then the text table as offsets plus one blob. The write
+    is atomic.
+    """
+    path = Path(path)
+    blob = b''.join(snapshot.texts)
+    text_offsets = np.cumsum([0, *map(len, snapshot.texts)], dtype=np.uint64)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(snapshot), len(snapshot.texts), snapshot.src_len, len(blob),
+                                 len(snapshot.syntax_errors)))
+
+            for name, dtype in _ARRAYS:
+                f.write(b'\0' * _padding(f.tell()))
+                f.write(np.ascontiguousarray(getattr(snapshot, name), dtype=dtype).tobytes())
+
+            f.write(b'\0' * _padding(f.tell()))
+            f.write(np.ascontiguousarray(snapshot.syntax_errors, dtype=np.int64).tobytes())
+
+            f.write(b'\0' * _padding(f.tell()))
+            f.write(text_offsets.tobytes())
+            f.write(blob)
+
+        os.replace(tmp_path, path)
+
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_snapshot(path: str | os.PathLike) -> AstSnapshot:
+    """
+    Memory-maps a snapshot written by `save_snapshot`; node arrays are
+    read-only views of the file.
+    """
+    _require_numpy()
+
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, node_count, text_count, src_len, blob_len, error_count = _HEADER.unpack_from(buffer)
+
+    if magic != _MAGIC:
+        raise ValueError(f'{path} is not an AST snapshot')
+
+    offset = _HEADER.size
+    arrays = {}
+
+    for name, dtype in _ARRAYS:
+        offset += _padding(offset)
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=node_count, offset=offset)
+        offset += arrays[name].nbytes
+
+    offset += _padding(offset)
+    syntax_errors = np.frombuffer(buffer, dtype=np.int64, count=error_count * 3, offset=offset).reshape(-1, 3)
+    offset += syntax_errors.nbytes
+    text_offsets = np.frombuffer(buffer, dtype=np.uint64, count=text_count + 1, offset=offset).tolist()
+    offset += (text_count + 1) * 8
+    blob = buffer[offset:offset + blob_len]
+
+    return AstSnapshot(
+        **arrays,
+        texts=[blob[start:end] for start, end in zip(text_offsets, text_offsets[1:])],
+        src_len=src_len,
+        syntax_errors=syntax_errors,
+    )
+
+
+class SnapshotCache:
+    """
+    On-disk snapshots under `directory/GRAMMAR_VERSION/`, keyed by the
+    SHA-256 of the source.
+    """
+
+    def __init__(self, directory: str | os.PathLike):
+        self.directory = Path(directory) / GRAMMAR_VERSION
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, src: bytes) -> Path:
+        digest = hashlib.sha256(src).hexdigest()
+
+        return self.directory / digest[:2] / f'{digest}.ast'
+
+    def get(self, src: bytes) -> AstSnapshot:
+        """Loads the snapshot of `src`, parsing and storing it on a miss"""
+        path = self.path_for(src)
+
+        try:
+            snapshot = load_snapshot(path)
+            self.hits += 1
+
+            return snapshot
+
+        except (FileNotFoundError, ValueError, struct.error):
+            self.misses += 1
+
+        snapshot = snapshot_source(src)
+        save_snapshot(snapshot, path)
+
+        return snapshot
+
+    def check(self, src: bytes, rules: Rules | CompiledRules) -> set[str]:
+        return check_snapshot(self.get(src), rules)
+
+
+def _node_type_rule(node_types: list[str], message: str) -> Callable[[AstSnapshot], list[str]]:
+    def rule(s: AstSnapshot) -> list[str]:
+        return [message] if s.of_type(*node_types).any() else []
+
+    return rule
+
+
+def _function_declarator_names(s: AstSnapshot) -> list[bytes]:
+    # Nodes inside a `function_declarator` are never visited by these rules
+    declarators = s.of_type('function_declarator')
+    visited = declarators & ~s.strictly_inside(declarators)
+
+    return s.texts_of(s.identifiers & s.parent_in(visited))
+
+
+def _include_names(s: AstSnapshot) -> set[str]:
+    contents = s.of_type('string_content') & s.parent_in(
+        s.of_type('string_literal') & s.parent_in(s.of_type('preproc_include')))
+
+    return {
+        *(text.replace(b"<", b"").replace(b">", b"").decode('utf8') for text in s.texts_of(s.of_type('system_lib_string'))),
+        *(text.decode('utf8') for text in s.texts_of(contents)),
+    }
+
+
+def _disallow_dunders(s: AstSnapshot) -> list[str]:
+    return [f'`{text}` is disallowed.' for text in map(bytes.decode, s.texts_of(s.identifiers))
+            if text.startswith('__')]
+
+
+def _disallow_symbols(s: AstSnapshot, disallowed_symbols: tuple[str, ...]) -> list[str]:
+    disallowed = frozenset(disallowed_symbols)
+
+    return [f'`{text}` is disallowed.' for text in map(bytes.decode, s.texts_of(s.identifiers))
+            if text in disallowed]
+
+
+def _disallow_main(s: AstSnapshot) -> list[str]:
+    # Sourced checked is unmangled version; main has no UUID suffix
+    if b'main' in _function_declarator_names(s):
+        return ['Including a `main` function is disallowed.']
+
+    return []
+
+
+def _disallow_helper_functions(s: AstSnapshot, required_functions: tuple[str, ...] | None) -> list[str]:
+    for name in _function_declarator_names(s):
+        if required_functions is None or name.decode('utf8') not in required_functions:
+            return ['Helper functions are disallowed.']
+
+    return []
+
+
+def _require_functions(s: AstSnapshot, required_functions: tuple[str, ...]) -> list[str]:
+    functions_left = set(required_functions).difference(
+        name.decode('utf8') for name in _function_declarator_names(s))
+
+    return [f'The function `{function_name}` must be defined.' for function_name in functions_left]
+
+
+def _disallow_printing(s: AstSnapshot) -> list[str]:
+    calls = s.of_type('call_expression')
+    visited = calls & ~s.strictly_inside(calls)
+
+    if not PRINTING_FUNCTIONS.isdisjoint(s.texts_of(s.identifiers & s.parent_in(visited))):
+        return ['Printing is disallowed.']
+
+    return []
+
+
+def _disallow_direct_recursion(s: AstSnapshot) -> list[str]:
+    definitions = s.of_type('function_definition')
+    names = s.identifiers & s.parent_in(s.of_type('function_declarator') & s.parent_in(definitions))
+    (name_nodes,) = np.nonzero(names)
+
+    # Last name in the definition wins; definitions without one keep the enclosing name
+    named = {}
+    for name_node in name_nodes:
+        named[int(s.parent[s.parent[name_node]])] = s.text_id[name_node]
+
+    if not named:
+        return []
+
+    starts = np.array(sorted(named), dtype=np.int64)
+    ends = starts + s.size[starts]
+    function_names = np.array([named[start] for start in starts], dtype=np.int64)
+
+    # Nearest enclosing named definition of each definition, for nested ones
+    enclosing = np.full(len(starts), -1)
+    stack: list[int] = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        while stack and ends[stack[-1]] <= start:
+            stack.pop()
+
+        enclosing[i] = stack[-1] if stack else -1
+        stack.append(i)
+
+    (callees,) = np.nonzero(s.identifiers & s.parent_in(s.of_type('call_expression')))
+    calls = s.parent[callees]
+    inside = np.searchsorted(starts, calls, side='right') - 1
+
+    while (outside := (inside >= 0) & (ends[inside] <= calls)).any():
+        inside[outside] = enclosing[inside[outside]]
+
+    found = inside >= 0
+    if (function_names[inside[found]] == s.text_id[callees[found]]).any():
+        return ['Direct recursion is not allowed.']
+
+    return []
+
+
+def _disallow_nonnumeric_defines(s: AstSnapshot) -> list[str]:
+    if s.of_type('preproc_function_def').any() or any(
+            not re.match(r'(\+|-)?\d+(\.\d*)?', text.decode('utf8'))
+            for text in s.texts_of(s.of_type('preproc_arg'))):
+        return ['`define` preprocessor directives for nonnumeric values are disallowed.']
+
+    return []
+
+
+def _disallow_atypical_control_flow(s: AstSnapshot) -> list[str]:
+    violations = []
+
+    if s.of_type('goto_statement').any():
+        violations.append('`goto` is disallowed.')
+
+    if b'longjmp' in s.texts_of(s.identifiers & s.parent_in(s.of_type('call_expression'))):
+        violations.append('`longjmp` is disallowed.')
+
+    return violations
+
+
+def _disallow_braceless_blocks(s: AstSnapshot) -> list[str]:
+    compound = s.of_type('compound_statement')
+    blocks = s.of_type('if_statement', 'while_statement', 'do_statement', 'for_statement')
+    # Special handling of `else` due to `else if` case
+    else_clauses = s.of_type('else_clause')
+
+    if (blocks & ~s.has_child_in(compound)).any() or \
+            (else_clauses & ~s.has_child_in(compound | s.of_type('if_statement'))).any():
+        return ['Blocks without enclosing braces are disallowed.']
+
+    return []
+
+
+def _require_includes(s: AstSnapshot, required_includes: tuple[str, ...]) -> list[str]:
+    includes_left = set(required_includes)
+    includes_left.difference_update(_include_names(s))
+
+    if includes_left:
+        return [f'Must include: {", ".join(includes_left)}']
+
+    return []
+
+
+def _allow_includes(s: AstSnapshot, allowed_includes: tuple[str, ...],
+                    required_includes: tuple[str, ...]) -> list[str]:
+    return [f'Including {name} is disallowed.' for name in _include_names(s)
+            if name not in allowed_includes and name not in required_includes]
+
+
+def _disallow_syntax_errors(s: AstSnapshot) -> list[str]:
+    return [syntax_error_message(row, column, KIND_NAMES[kind] if kind >= 0 else None)
+            for row, column, kind in s.syntax_errors.tolist()]
+
+
+def _limit_nodes(s: AstSnapshot, limit: int) -> list[str]:
+    return [nodes_message(limit)] if len(s) > limit else []
+
+
+def _limit_nesting_depth(s: AstSnapshot, limit: int) -> list[str]:
+    statements = s.of_type(*NESTING_STATEMENTS)
+    compound = s.of_type('compound_statement')
+    else_clauses = s.of_type('else_clause')
+    # The body of a function or statement, and the `if` of an `else if`, stay at their parent's level
+    continued = (compound & s.parent_in(statements | s.of_type('function_definition') | else_clauses)) | \
+        (s.of_type('if_statement') & s.parent_in(else_clauses))
+
+    if s.inside_count((statements | compound) & ~continued).max(initial=0) > limit:
+        return [nesting_depth_message(limit)]
+
+    return []
+
+
+def _limit_function_statements(s: AstSnapshot, limit: int) -> list[str]:
+    if (s.per_subtree_count(s.of_type('function_definition'), s.of_type(*STATEMENT_TYPES)) > limit).any():
+        return [function_statements_message(limit)]
+
+    return []
+
+
+def _limit_cyclomatic_complexity(s: AstSnapshot, limit: int) -> list[str]:
+    cases = s.of_type('case_statement')
+    decisions = s.of_type(*DECISION_TYPES) & ~(cases & s.has_child_in(s.of_type('default')))
+
+    if (1 + s.per_subtree_count(s.of_type('function_definition'), decisions) > limit).any():
+        return [cyclomatic_complexity_message(limit)]
+
+    return []
+
+
+def _limit_source_bytes(s: AstSnapshot, limit: int) -> list[str]:
+    if s.src_len > limit:
+        return [f'Source code is too long; must be at most {limit} bytes.']
+
+    return []
+
+
+def _limit_defined_functions(s: AstSnapshot, limit: int) -> list[str]:
+    if np.count_nonzero(s.of_type('function_definition')) > limit:
+        return [f'Too many defined functions; at most {limit} function{"" if limit == 1 else "s"} can be defined.']
+
+    return []
+
+
+SNAPSHOT_RULES: dict[str, Callable[..., list[str]]] = {
+    'dunders': _disallow_dunders,
+    'require_functions': _require_functions,
+    'main': _disallow_main,
+    'assignment': _node_type_rule(['init_declarator', 'assignment_expression', '++', '--'],
+                                  'Assignment statements, incrementing, and decrementing are disallowed.'),
+    'reassignment': _node_type_rule(['assignment_expression', '++', '--'],
+                                    'Reassignment, incrementing, and decrementing are disallowed.'),
+    'loops': _node_type_rule(['for_statement', 'while_statement', 'do_statement'],
+                             'Loops are disallowed.'),
+    'if_statements': _node_type_rule(['if_statement', 'for_statement', 'while_statement', 'do_statement'],
+                                     '`if` statements and loops are disallowed.'),
+    'helper_functions': _disallow_helper_functions,
+    'printing': _disallow_printing,
+    'direct_recursion': _disallow_direct_recursion,
+    'arrays': _node_type_rule(['array_declarator'], 'Arrays are disallowed.'),
+    'nonnumeric_defines': _disallow_nonnumeric_defines,
+    'atypical_control_flow': _disallow_atypical_control_flow,
+    'braceless_blocks': _disallow_braceless_blocks,
+    'asm': _node_type_rule(['gnu_asm_expression'], '`asm` is disallowed.'),
+    'syntax_errors': _disallow_syntax_errors,
+    'disallow_symbols': _disallow_symbols,
+    'limit_source_bytes': _limit_source_bytes,
+    'limit_defined_functions': _limit_defined_functions,
+    'limit_nodes': _limit_nodes,
+    'limit_nesting_depth': _limit_nesting_depth,
+    'limit_function_statements': _limit_function_statements,
+    'limit_cyclomatic_complexity': _limit_cyclomatic_complexity,
+    'require_includes': _require_includes,
+    'allow_includes': _allow_includes,
+}
+
+
+def check_snapshot(snapshot: AstSnapshot, rules: Rules | CompiledRules) -> set[str]:
+    compiled = compile_rules(rules)
+    checks = compiled.checks
+
+    if compiled.limit_nodes is not None and len(snapshot) > compiled.limit_nodes:
+        checks = (RuleCheck('limit_nodes', (compiled.limit_nodes,)),)
+
+    elif compiled.fail_fast and len(snapshot.syntax_errors):
+        checks = (SYNTAX_ERRORS_CHECK,)
+
+    return {violation
+            for check in dict.fromkeys(checks)
+            for violation in SNAPSHOT_RULES[check.rule_id](snapshot, *check.params)}
+
+
+def get_unique_rule_violations_vectorized(src: bytes, rules: Rules | CompiledRules) -> set[str]:
+    compiled = compile_rules(rules)
+    tree = Parser(C_LANGUAGE).parse(src)
+
+    # A violated gate only needs the root, so the tree is not snapshotted
+    if (checks := compiled.checks_for(tree)) is not compiled.checks:
+        return {violation for violations in run_checks(tree, src, checks).values() for violation in violations}
+
+    return check_snapshot(snapshot_tree(tree, src), compiled)
@@ -0,0 +1,443 @@
+"""
+Generates a checker function specialized to one `CompiledRules`.
+
+The generated function does a single cursor traversal with the code of every
+enabled rule inlined and grouped by node type, so disabled rules cost nothing
+and there are no per-node visitor calls. Results are the same as
+`get_unique_rule_violations`.
+"""
+import linecache
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable
+
+from tree_sitter import Parser, Tree
+
+from c_rule_enforcer import (C_LANGUAGE, DECISION_TYPES, NESTING_STATEMENTS, NESTING_TYPES,
+                             PRINTING_FUNCTIONS, STATEMENT_TYPES, CompiledRules,
+                             RuleCheck, Rules, compile_rules,
+                             cyclomatic_complexity_message,
+                             function_statements_message,
+                             nesting_continuations, nesting_depth_message,
+                             nodes_message, syntax_error_messages)
+
+Checker = Callable[[Tree, bytes], set[str]]
+
+
+@dataclass
+class _Fragment:
+    """
+    Code of one rule. `_I` in names is replaced by the index of the check so
+    that several checks can be inlined into the same function.
+    """
+    enter: dict[str, str] = field(default_factory=dict)
+    init: str = ''
+    reset: str = ''
+    finish: str = ''
+    constants: dict[str, Any] = field(default_factory=dict)
+
+
+def _text(name: str) -> str:
+    return f'src[{name}.start_byte:{name}.end_byte]'
+
+
+def _node_type_fragment(node_types: list[str], message: str) -> _Fragment:
+    return _Fragment(enter={node_type: f'add({message!r})' for node_type in node_types})
+
+
+def _pruning_fragment(node_type: str, code: str, init: str = '', **kwargs: Any) -> _Fragment:
+    # Same as `RuleVisitor.prune`: the rest of the subtree is skipped
+    return _Fragment(
+        enter={node_type: f'if skip_I < 0:\n{_indent(code)}\n    skip_I = depth'},
+        init=f'skip_I = -1\n{init}'.strip(),
+        reset='if skip_I >= depth:\n    skip_I = -1',
+        **kwargs,
+    )
+
+
+def _function_declarator_fragment(condition: str, message: str, **kwargs: Any) -> _Fragment:
+    return _pruning_fragment('function_declarator', f'''
+for child in node.children:
+    if child.type == 'identifier' and {condition}:
+        add({message!r})
+        break
+'''.strip(), **kwargs)
+
+
+_INCLUDE_NAMES = f'''
+if t == 'system_lib_string':
+    names = ({_text('node')}.replace(b"<", b"").replace(b">", b"").decode('utf8'),)
+else:
+    names = [{_text('grandchild')}.decode('utf8')
+             for child in node.children if child.type == 'string_literal'
+             for grandchild in child.children if grandchild.type == 'string_content']
+'''.strip()
+
+
+def _fragment(check: RuleCheck) -> _Fragment:
+    rule_id, params = check.rule_id, check.params
+
+    if rule_id == 'dunders':
+        return _Fragment(enter={'identifier': f'''
+s = {_text('node')}.decode('utf8')
+if s.startswith('__'):
+    add(f'`{{s}}` is disallowed.')
+'''.strip()})
+
+    if rule_id == 'disallow_symbols':
+        return _Fragment(enter={'identifier': f'''
+s = {_text('node')}.decode('utf8')
+if s in SYMBOLS_I:
+    add(f'`{{s}}` is disallowed.')
+'''.strip()}, constants={'SYMBOLS_I': frozenset(params[0])})
+
+    if rule_id == 'main':
+        return _function_declarator_fragment(f"{_text('child')} == b'main'",
+                                             'Including a `main` function is disallowed.')
+
+    if rule_id == 'helper_functions':
+        return _function_declarator_fragment(
+            f"(REQUIRED_I is None or {_text('child')}.decode('utf8') not in REQUIRED_I)",
+            'Helper functions are disallowed.',
+            constants={'REQUIRED_I': params[0]})
+
+    if rule_id == 'printing':
+        return _pruning_fragment('call_expression', f'''
+for child in node.children:
+    if child.type == 'identifier' and {_text('child')} in PRINTING_FUNCTIONS:
+        add('Printing is disallowed.')
+        break
+'''.strip())
+
+    if rule_id == 'require_functions':
+        return _pruning_fragment('function_declarator', f'''
+for child in node.children:
+    if child.type == 'identifier':
+        functions_left_I.discard({_text('child')}.decode('utf8'))
+'''.strip(), init='functions_left_I = set(REQUIRED_I)', finish='''
+for function_name in set(REQUIRED_I):
+    if function_name in functions_left_I:
+        add(f'The function `{function_name}` must be defined.')
+'''.strip(), constants={'REQUIRED_I': params[0]})
+
+    if rule_id == 'direct_recursion':
+        # Stack of (depth, name) of enclosing `function_definition` nodes
+        return _Fragment(enter={
+            'function_definition': f'''
+name = functions_I[-1][1] if functions_I else None
+for child in node.children:
+    if child.type == 'function_declarator':
+        for grandchild in child.children:
+            if grandchild.type == 'identifier':
+                name = {_text('grandchild')}
+functions_I.append((depth, name))
+'''.strip(),
+            'call_expression': f'''
+if functions_I:
+    name = functions_I[-1][1]
+    for child in node.children:
+        if child.type == 'identifier' and {_text('child')} == name:
+            add('Direct recursion is not allowed.')
+'''.strip(),
+        }, init='functions_I = []', reset='''
+while functions_I and functions_I[-1][0] >= depth:
+    functions_I.pop()
+'''.strip())
+
+    if rule_id == 'assignment':
+        return _node_type_fragment(['init_declarator', 'assignment_expression', '++', '--'],
+                                   'Assignment statements, incrementing, and decrementing are disallowed.')
+
+    if rule_id == 'reassignment':
+        return _node_type_fragment(['assignment_expression', '++', '--'],
+                                   'Reassignment, incrementing, and decrementing are disallowed.')
+
+    if rule_id == 'loops':
+        return _node_type_fragment(['for_statement', 'while_statement', 'do_statement'],
+                                   'Loops are disallowed.')
+
+    if rule_id == 'if_statements':
+        return _node_type_fragment(['if_statement', 'for_statement', 'while_statement', 'do_statement'],
+                                   '`if` statements and loops are disallowed.')
+
+    if rule_id == 'arrays':
+        return _node_type_fragment(['array_declarator'], 'Arrays are disallowed.')
+
+    if rule_id == 'asm':
+        return _node_type_fragment(['gnu_asm_expression'], '`asm` is disallowed.')
+
+    if rule_id == 'nonnumeric_defines':
+        message = '`define` preprocessor directives for nonnumeric values are disallowed.'
+
+        return _Fragment(enter={
+            'preproc_function_def': f'add({message!r})',
+            'preproc_arg': f'''
+if not NUMERIC.match({_text('node')}.decode('utf8')):
+    add({message!r})
+'''.strip(),
+        })
+
+    if rule_id == 'atypical_control_flow':
+        return _Fragment(enter={
+            'goto_statement': "add('`goto` is disallowed.')",
+            'call_expression': f'''
+for child in node.children:
+    if child.type == 'identifier' and {_text('child')} == b'longjmp':
+        add('`longjmp` is disallowed.')
+        break
+'''.strip(),
+        })
+
+    if rule_id == 'braceless_blocks':
+        code = '''
+for child in node.children:
+    if child.type in {braces}:
+        break
+else:
+    add('Blocks without enclosing braces are disallowed.')
+'''.strip()
+        enter = {node_type: code.format(braces="('compound_statement',)")
+                 for node_type in ['if_statement', 'while_statement', 'do_statement', 'for_statement']}
+        # Special handling of `else` due to `else if` case
+        enter['else_clause'] = code.format(braces="('compound_statement', 'if_statement')")
+
+        return _Fragment(enter=enter)
+
+    if rule_id == 'require_includes':
+        code = f'{_INCLUDE_NAMES}\nincludes_left_I.difference_update(names)'
+
+        return _Fragment(
+            enter={'system_lib_string': code, 'preproc_include': code},
+            init='includes_left_I = set(REQUIRED_I)',
+            finish='''
+if includes_left_I:
+    add(f'Must include: {", ".join(includes_left_I)}')
+'''.strip(),
+            constants={'REQUIRED_I': params[0]})
+
+    if rule_id == 'allow_includes':
+        code = f'''
+{_INCLUDE_NAMES}
+for s in names:
+    if s not in ALLOWED_I:
+        add(f'Including {{s}} is disallowed.')
+'''.strip()
+
+        return _Fragment(enter={'system_lib_string': code, 'preproc_include': code},
+                         constants={'ALLOWED_I': frozenset(params[0]) | frozenset(params[1])})
+
+    if rule_id == 'syntax_errors':
+        # Only looks at the subtrees with errors, not a traversal of its own
+        return _Fragment(init='violations.update(SYNTAX_ERRORS(tree.root_node))')
+
+    if rule_id == 'limit_source_bytes':
+        limit, = params
+
+        return _Fragment(finish=f'''
+if len(src) > {limit!r}:
+    add({f'Source code is too long; must be at most {limit} bytes.'!r})
+'''.strip())
+
+    if rule_id == 'limit_defined_functions':
+        limit, = params
+        message = f'Too many defined functions; at most {limit} function{"" if limit == 1 else "s"} can be defined.'
+
+        return _Fragment(enter={'function_definition': 'total_I += 1'}, init='total_I = 0', finish=f'''
+if total_I > {limit!r}:
+    add({message!r})
+'''.strip())
+
+    if rule_id == 'limit_nodes':
+        limit, = params
+
+        # Counted by tree-sitter while parsing, so this needs no traversal
+        return _Fragment(init=f'''
+if tree.root_node.descendant_count > {limit!r}:
+    add({nodes_message(limit)!r})
+'''.strip())
+
+    if rule_id == 'limit_nesting_depth':
+        limit, = params
+        # Stack of the depths of the nodes that opened each nesting level
+        code = f'''
+if node.id in continued_I:
+    continued_I.remove(node.id)
+else:
+    levels_I.append(depth)
+    if len(levels_I) > {limit!r}:
+        add({nesting_depth_message(limit)!r})
+'''.strip()
+        enter = {node_type: code for node_type in NESTING_TYPES}
+
+        for node_type in [*NESTING_STATEMENTS, 'function_definition', 'else_clause']:
+            enter[node_type] = f'{enter.get(node_type, "")}\ncontinued_I.update(CONTINUATIONS(node))'.strip()
+
+        return _Fragment(enter=enter, init='levels_I = []\ncontinued_I = set()', reset='''
+while levels_I and levels_I[-1] >= depth:
+    levels_I.pop()
+'''.strip())
+
+    if rule_id == 'limit_function_statements':
+        limit, = params
+
+        return _per_function_fragment(dict.fromkeys(STATEMENT_TYPES, ''), limit, function_statements_message(limit))
+
+    if rule_id == 'limit_cyclomatic_complexity':
+        limit, = params
+        counted = dict.fromkeys(DECISION_TYPES, '')
+        counted['case_statement'] = " and node.child(0).type != 'default'"
+
+        return _per_function_fragment(counted, limit, cyclomatic_complexity_message(limit), initial=1)
+
+    raise ValueError(f'Unknown rule: {rule_id}')
+
+
+def _per_function_fragment(counted: dict[str, str], limit: int, message: str, initial: int = 0) -> _Fragment:
+    # Stack of [depth, count] of enclosing `function_definition` nodes; `counted`
+    # maps node types to the condition under which they count
+    check = f'''
+if count > {limit!r}:
+    add({message!r})
+'''.strip()
+
+    return _Fragment(
+        enter={
+            'function_definition': f'functions_I.append([depth, {initial}])',
+            **{node_type: f'if functions_I{condition}:\n    functions_I[-1][1] += 1'
+               for node_type, condition in counted.items()},
+        },
+        init='functions_I = []',
+        reset=f'''
+while functions_I and functions_I[-1][0] >= depth:
+    count = functions_I.pop()[1]
+{_indent(check)}
+'''.strip(),
+        finish=f'''
+for _, count in functions_I:
+{_indent(check)}
+'''.strip(),
+    )
+
+
+def _indent(code: str, level: int = 1) -> str:
+    return '\n'.join(('    ' * level + line) if line else line for line in code.splitlines())
+
+
+def generate_checker_source(rules: Rules | CompiledRules) -> tuple[str, dict[str, Any]]:
+    """
+    Returns the source of the specialized `check(tree, src)` function and the
+    globals it must be executed with.
+    """
+    compiled = compile_rules(rules)
+    namespace: dict[str, Any] = {
+        'NUMERIC': re.compile(r'(\+|-)?\d+(\.\d*)?'),
+        'PRINTING_FUNCTIONS': PRINTING_FUNCTIONS,
+        'SYNTAX_ERRORS': syntax_error_messages,
+        'CONTINUATIONS': nesting_continuations,
+    }
+    init: list[str] = []
+    reset: list[str] = []
+    finish: list[str] = []
+    enter: dict[str, list[str]] = {}
+
+    for i, check in enumerate(dict.fromkeys(compiled.checks)):
+        fragment = _fragment(check)
+        suffix = f'_{i}'
+
+        def specialize(code: str) -> str:
+            return code.replace('_I', suffix)
+
+        for name, value in fragment.constants.items():
+            namespace[specialize(name)] = value
+
+        for codes, code in [(init, fragment.init), (reset, fragment.reset), (finish, fragment.finish)]:
+            if code:
+                codes.append(specialize(code))
+
+        for node_type, code in fragment.enter.items():
+            enter.setdefault(node_type, []).append(specialize(code))
+
+    lines = ['def check(tree, src):']
+
+    if compiled.limit_nodes is not None:
+        lines.extend([
+            f'    if tree.root_node.descendant_count > {compiled.limit_nodes!r}:',
+            f'        return {{{nodes_message(compiled.limit_nodes)!r}}}',
+        ])
+
+    if compiled.fail_fast:
+        lines.extend([
+            '    if tree.root_node.has_error:',
+            '        return set(SYNTAX_ERRORS(tree.root_node))',
+        ])
+
+    lines.extend([
+        '    violations = set()',
+        '    add = violations.add',
+        *[_indent(code) for code in init],
+    ])
+
+    if enter:
+        namespace['NODE_TYPES'] = frozenset(enter)
+        branches = []
+
+        for node_type, codes in enter.items():
+            branches.append(f'{"elif" if branches else "if"} t == {node_type!r}:')
+            branches.extend(_indent(code) for code in codes)
+
+        lines.extend([
+            '    cursor = tree.walk()',
+            '    depth = 0',
+            '    while True:',
+            '        node = cursor.node',
+            *[_indent(code, 2) for code in reset],
+            '        t = node.type',
+            '        if t in NODE_TYPES:',
+            *[_indent(branch, 3) for branch in branches],
+            '        if cursor.goto_first_child():',
+            '            depth += 1',
+            '            continue',
+            '        while depth and not cursor.goto_next_sibling():',
+            '            cursor.goto_parent()',
+            '            depth -= 1',
+            '        if not depth:',
+            '            break',
+        ])
+
+    lines.extend([
+        *[_indent(code) for code in finish],
+        '    return violations',
+    ])
+
+    return '\n'.join(lines) + '\n', namespace
+
+
+@lru_cache(maxsize=256)
+def _get_checker(compiled: CompiledRules) -> Checker:
+    source, namespace = generate_checker_source(compiled)
+    filename = f'<specialized checker {hash(compiled):x}>'
+
+    # Makes tracebacks through the generated code readable
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    exec(compile(source, filename, 'exec'), namespace)
+
+    return namespace['check']
+
+
+def get_checker(rules: Rules | CompiledRules) -> Checker:
+    """
+    Returns the specialized checker of `rules`, generating it on first use.
+    """
+    return _get_checker(compile_rules(rules))
+
+
+def checker_cache_counts() -> tuple[int, int]:
+    """Hits and misses of the calling process's `get_checker` cache"""
+    info = _get_checker.cache_info()
+
+    return info.hits, info.misses
+
+
+def get_unique_rule_violations_specialized(src: bytes, rules: Rules | CompiledRules) -> set[str]:
+    return get_checker(rules)(Parser(C_LANGUAGE).parse(src), src)
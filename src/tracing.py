@@ -0,0 +1,136 @@
+"""
+Chrome trace-event recording, viewable in Perfetto or `chrome://tracing`.
+
+A `Tracer` buffers complete (`"ph": "X"`) events of one worker in memory and
+writes them once at the end, so tracing costs two clock reads and a tuple per
+span. Timestamps come from `time.perf_counter_ns`, which is system-wide on
+Linux, so traces of several worker processes line up after `merge_traces`.
+
+`traced_check` traces the same specialized checker that `check_source` runs,
+with one span for parsing and one for the check. Per-rule spans are opt-in:
+they come from rerunning each rule alone on the generic engine after the real
+check, so they show which rules are expensive, not where the real check's
+time went. `traced_check_by_rule` instead traces the generic engine, whose
+results can be grouped by rule.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Generator, Iterable, TypeVar
+
+from tree_sitter import Tree
+
+from c_rule_enforcer import CompiledRules, Rules, compile_rules, group_by_rule, run_checks, run_visitors
+from batch import get_parser
+from specialize import get_checker
+
+T = TypeVar('T')
+
+
+class Tracer:
+    def __init__(self, name: str | None = None):
+        self.pid = os.getpid()
+        self.name = name
+        self.events: list[tuple[str, str, int, int, int, dict[str, Any] | None]] = []
+
+    @contextmanager
+    def span(self, name: str, category: str = 'check', **args: Any) -> Generator[None, None, None]:
+        start = time.perf_counter_ns()
+
+        try:
+            yield
+        finally:
+            self.events.append((name, category, threading.get_native_id(), start,
+                                time.perf_counter_ns() - start, args or None))
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        events: list[dict[str, Any]] = []
+
+        if self.name is not None:
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': self.name}})
+
+        for name, category, tid, start, duration, args in self.events:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                     'ts': start / 1000, 'dur': duration / 1000}
+
+            if args:
+                event['args'] = args
+
+            events.append(event)
+
+        return events
+
+    def write(self, path: str | os.PathLike) -> None:
+        write_trace(self.trace_events(), path)
+
+
+def write_trace(events: Iterable[dict[str, Any]], path: str | os.PathLike) -> None:
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': list(events), 'displayTimeUnit': 'ms'}, f)
+
+
+def merge_traces(paths: Iterable[str | os.PathLike], merged: str | os.PathLike) -> None:
+    events = []
+
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.load(f)['traceEvents'])
+
+    write_trace(events, merged)
+
+
+def traced_check(tracer: Tracer, src: bytes, rules: Rules | CompiledRules, per_rule: bool = False) -> set[str]:
+    """
+    Same as `check_source`, with a span for parsing and one for the check.
+    With `per_rule`, each rule is then also run and traced on its own; see the
+    module docstring.
+    """
+    compiled = compile_rules(rules)
+
+    return _traced(tracer, src, compiled, per_rule, get_checker(compiled))
+
+
+def traced_check_by_rule(tracer: Tracer, src: bytes, rules: Rules | CompiledRules,
+                         per_rule: bool = False) -> dict[str, set[str]]:
+    """Same as `traced_check`, returning the violations grouped by rule ID"""
+    compiled = compile_rules(rules)
+
+    def check(tree, src):
+        return group_by_rule(run_checks(tree, src, dict.fromkeys(compiled.checks_for(tree))))
+
+    return _traced(tracer, src, compiled, per_rule, check)
+
+
+def _traced(tracer: Tracer, src: bytes, compiled: CompiledRules, per_rule: bool,
+            check: Callable[[Tree, bytes], T]) -> T:
+    with tracer.span('parse', bytes=len(src)):
+        tree = get_parser().parse(src)
+
+    with tracer.span('check'):
+        result = check(tree, src)
+
+    if per_rule:
+        for rule_check in compiled.checks_for(tree):
+            with tracer.span(rule_check.rule_id, 'rule'):
+                run_visitors(tree, src, (rule_check,))
+
+    return result
+
+
+def traced_chunk(rules: CompiledRules, per_rule: bool, first: int,
+                 sources: list[bytes]) -> tuple[list[set[str]], list[dict[str, Any]]]:
+    """
+    Checks a chunk of `batch.check_batch` with `traced_check`, returning the
+    results and the worker's trace events. Sources are numbered from `first`.
+    """
+    tracer = Tracer(f'worker {os.getpid()}')
+    results = []
+
+    with tracer.span('chunk', 'chunk', first=first, size=len(sources)):
+        for i, src in enumerate(sources, first):
+            with tracer.span(str(i), 'submission'):
+                results.append(traced_check(tracer, src, rules, per_rule))
+
+    return results, tracer.trace_events()
@@ -0,0 +1,379 @@
+"""
+Pre-forked pool of warm worker processes (POSIX only).
+
+A fork server process imports the grammar, compiles the given rules and
+generates their specialized checkers, does a dummy parse and calls
+`gc.freeze()`, and only then forks the workers. Workers therefore start
+instantly and share those pages copy-on-write instead of each one rebuilding
+them.
+
+Workers are recycled (a fresh one is forked from the still-warm server) after
+`max_tasks` tasks or once their resident set exceeds `max_rss` bytes.
+
+The server hands the pool a pipe to each worker it forks, and the pool sends
+every task to one idle worker, recording the assignment as it does. Results
+come back through a shared `SimpleQueue`. The server reports every child it
+reaps; the task assigned to a worker that died (killed by a signal or the OOM
+killer), whether or not the worker had started it, fails with `WorkerError`,
+and the worker is replaced.
+"""
+import gc
+import itertools
+import multiprocessing
+import os
+import resource
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Iterable
+
+from c_rule_enforcer import CompiledRules, Rules, compile_rules
+from batch import check_source, get_parser
+from specialize import get_checker
+
+_WARMUP_SOURCE = b'#include <stdio.h>\nint main() { for (int i = 0; i < 1; i++) printf("%d", i); }\n'
+
+
+def warm(rules: Iterable[Rules | CompiledRules] = ()) -> list[CompiledRules]:
+    """
+    Loads everything a check needs in the current process, so that forked
+    children inherit it.
+    """
+    compiled = [compile_rules(r) for r in rules]
+
+    for r in compiled:
+        get_checker(r)(get_parser().parse(_WARMUP_SOURCE), _WARMUP_SOURCE)
+
+    gc.collect()
+    gc.freeze()
+
+    return compiled
+
+
+def current_rss() -> int:
+    """Resident set size of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except OSError:
+        # Peak rather than current, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkerError(Exception):
+    """A check raised in a worker, or its worker died while assigned it"""
+
+
+def _work(tasks: Connection, results: Any, max_tasks: int | None, max_rss: int | None, check: Callable) -> None:
+    server = os.getppid()
+    pid = os.getpid()
+    completed = 0
+
+    while True:
+        if not tasks.poll(1.0):
+            # Orphaned when the pool was never closed
+            if os.getppid() != server:
+                return
+
+            continue
+
+        try:
+            task = tasks.recv()
+        except EOFError:
+            # The pool is gone
+            return
+
+        if task is None:
+            results.put(('exit', pid, None, 'shutdown'))
+            return
+
+        task_id, src, rules = task
+
+        try:
+            message = ('done', pid, task_id, check(src, rules))
+        except Exception as e:
+            # The exception itself need not be picklable
+            message = ('error', pid, task_id, repr(e))
+
+        completed += 1
+        reason = None
+
+        if max_tasks is not None and completed >= max_tasks:
+            reason = 'max_tasks'
+        elif max_rss is not None and current_rss() > max_rss:
+            reason = 'max_rss'
+
+        # Before the result, so that the pool does not hand this worker another task
+        if reason is not None:
+            results.put(('exit', pid, None, reason))
+
+        results.put(message)
+
+        if reason is not None:
+            return
+
+
+def _fork_worker(tasks: Connection, sender: Connection, results: Any, max_tasks: int | None,
+                 max_rss: int | None, check: Callable) -> int:
+    if pid := os.fork():
+        return pid
+
+    status = 1
+
+    try:
+        # Only the pool may hold the sending end, so that the worker sees EOF once it is gone
+        sender.close()
+        _work(tasks, results, max_tasks, max_rss, check)
+        status = 0
+
+    finally:
+        os._exit(status)
+
+
+def _reap(block: bool, results: Any = None) -> None:
+    while True:
+        try:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if not pid:
+            return
+
+        if results is not None:
+            results.put(('reaped', pid, None, os.waitstatus_to_exitcode(status)))
+
+
+def _serve(control: Connection, pool: int, rules: list[CompiledRules], results: Any,
+           max_tasks: int | None, max_rss: int | None, check: Callable) -> None:
+    warm(rules)
+
+    while True:
+        if control.poll(1.0):
+            if control.recv() is None:
+                break
+
+            tasks, sender = multiprocessing.Pipe(duplex=False)
+            control.send(_fork_worker(tasks, sender, results, max_tasks, max_rss, check))
+            reduction.send_handle(control, sender.fileno(), pool)
+            tasks.close()
+            sender.close()
+
+        _reap(block=False, results=results)
+
+    # Nobody reads the results anymore
+    _reap(block=True)
+
+
+class WarmPool:
+    """
+    `concurrent.futures`-like pool of warm worker processes; see the module
+    docstring. `rules` are warmed up in the server before forking; other rules
+    can still be submitted, but their checkers are generated per worker.
+
+    Workers run `check(src, rules)`, `check_source` by default; with fork it
+    need not be picklable.
+    """
+
+    def __init__(self, rules: Iterable[Rules | CompiledRules] = (), workers: int | None = None,
+                 max_tasks: int | None = None, max_rss: int | None = None, check: Callable = check_source):
+        context = multiprocessing.get_context('fork')
+        self.workers = workers or os.cpu_count() or 1
+        self.recycled = 0
+        self.died = 0
+        self._results = context.SimpleQueue()
+        self._futures: dict[int, Future] = {}
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Guarded by `_lock`: the pipe to each live worker, the idle ones, the
+        # tasks waiting for one, and the task each busy worker was handed
+        self._workers: dict[int, Connection] = {}
+        self._idle: deque[int] = deque()
+        self._pending: deque[tuple[int, bytes, CompiledRules]] = deque()
+        self._assigned: dict[int, int] = {}
+        self._stopping = False
+
+        self._control_lock = threading.Lock()
+        self._control, server_control = context.Pipe()
+        self._server = context.Process(
+            target=_serve,
+            args=(server_control, os.getpid(), [compile_rules(r) for r in rules], self._results, max_tasks,
+                  max_rss, check),
+            daemon=True,
+        )
+        self._server.start()
+
+        for _ in range(self.workers):
+            self._spawn()
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _spawn(self) -> None:
+        with self._control_lock:
+            self._control.send('spawn')
+            pid = self._control.recv()
+            tasks = Connection(reduction.recv_handle(self._control), readable=False)
+
+        with self._lock:
+            self._workers[pid] = tasks
+
+            if self._stopping:
+                # Replaces a worker while the others are already being stopped
+                self._stop(tasks)
+            else:
+                self._idle.append(pid)
+                self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands pending tasks to idle workers; called with `_lock` held"""
+        while self._pending and self._idle:
+            task = self._pending.popleft()
+
+            if not self._futures[task[0]].set_running_or_notify_cancel():
+                del self._futures[task[0]]
+                continue
+
+            pid = self._idle.popleft()
+            self._assigned[pid] = task[0]
+
+            try:
+                self._workers[pid].send(task)
+            except OSError:
+                # Dead already; the task fails once the server reaps it
+                pass
+
+        if self._closed and not self._stopping and not self._pending and not self._assigned:
+            self._stopping = True
+
+            for tasks in self._workers.values():
+                self._stop(tasks)
+
+    @staticmethod
+    def _stop(tasks: Connection) -> None:
+        try:
+            tasks.send(None)
+        except OSError:
+            # Dead already; the server reaps it
+            pass
+
+    def _remove(self, pid: int) -> None:
+        with self._lock:
+            self._workers.pop(pid).close()
+
+            if pid in self._idle:
+                self._idle.remove(pid)
+
+    def _collect(self) -> None:
+        # Workers that exited on their own
+        exited: set[int] = set()
+
+        while True:
+            with self._lock:
+                if self._stopping and not self._workers:
+                    return
+
+            kind, pid, task_id, value = self._results.get()
+
+            if kind == 'exit':
+                exited.add(pid)
+                self._remove(pid)
+
+                if value != 'shutdown':
+                    self.recycled += 1
+                    self._spawn()
+
+                continue
+
+            if kind == 'reaped':
+                with self._lock:
+                    task_id = self._assigned.pop(pid, None)
+
+                if task_id is not None:
+                    self._settle(task_id, WorkerError(f'Worker {pid} died with exit code {value}'))
+
+                if pid in exited:
+                    exited.remove(pid)
+                    continue
+
+                self.died += 1
+                self._remove(pid)
+
+                with self._lock:
+                    replace = not self._stopping
+
+                if replace:
+                    self._spawn()
+                else:
+                    with self._lock:
+                        self._dispatch()
+
+                continue
+
+            with self._lock:
+                del self._assigned[pid]
+
+                if pid in self._workers:
+                    self._idle.append(pid)
+
+            if kind == 'done':
+                self._settle(task_id, result=value)
+            else:
+                self._settle(task_id, WorkerError(value))
+
+            with self._lock:
+                self._dispatch()
+
+    def _settle(self, task_id: int, error: Exception | None = None, result: Any = None) -> None:
+        with self._lock:
+            future = self._futures.pop(task_id)
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def submit(self, src: bytes, rules: Rules | CompiledRules) -> 'Future[set[str]]':
+        if self._closed:
+            raise RuntimeError('Pool is closed')
+
+        future: Future = Future()
+        task_id = next(self._task_ids)
+
+        with self._lock:
+            self._futures[task_id] = future
+            self._pending.append((task_id, src, compile_rules(rules)))
+            self._dispatch()
+
+        return future
+
+    def map(self, sources: Iterable[bytes], rules: Rules | CompiledRules) -> list[set[str]]:
+        compiled = compile_rules(rules)
+
+        return [future.result() for future in [self.submit(src, compiled) for src in sources]]
+
+    def close(self) -> None:
+        """Waits for submitted tasks, then stops the workers and the server"""
+        if self._closed:
+            return
+
+        with self._lock:
+            self._closed = True
+            self._dispatch()
+
+        self._collector.join()
+
+        with self._control_lock:
+            self._control.send(None)
+
+        self._server.join()
+
+    def __enter__(self) -> 'WarmPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
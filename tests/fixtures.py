@@ -0,0 +1,111 @@
+import base64
+import json
+
+from c_rule_enforcer import Rules, compile_rules
+
+RULE_SETS = [
+    Rules.from_dict({}),
+    Rules.from_dict({'disallow': [
+        'main',
+        'assignment',
+        'reassignment',
+        'loops',
+        'if_statements',
+        'helper_functions',
+        'printing',
+        'direct_recursion',
+        'arrays',
+        'nonnumeric_defines',
+        'function_pointers',
+        'atypical_control_flow',
+        'braceless_blocks',
+        'asm',
+    ]}),
+    Rules.from_dict({'require_functions': ['f', 'g'], 'disallow': ['helper_functions', 'main']}),
+    Rules.from_dict({'disallow_symbols': ['x', 'g'], 'limit_source_bytes': 64, 'limit_defined_functions': 1}),
+    Rules.from_dict({'require_includes': ['stdio.h', 'a.h', 'math.h'], 'allow_includes': ['stdlib.h']}),
+    Rules.from_dict({'allow_includes': []}),
+    Rules.from_dict({'disallow': ['syntax_errors', 'loops'], 'disallow_symbols': ['x']}),
+    Rules.from_dict({'disallow': ['syntax_errors', 'loops'], 'disallow_symbols': ['x'], 'fail_fast': True}),
+    Rules.from_dict({'limit_nesting_depth': 1, 'limit_function_statements': 3, 'limit_cyclomatic_complexity': 3}),
+    Rules.from_dict({'limit_nodes': 100, 'limit_nesting_depth': 2, 'disallow': ['loops']}),
+]
+
+SOURCES = [
+    b'',
+    b'''
+#include <stdio.h>
+#include "a.h"
+#include <stdlib.h>
+#define N 10
+#define S "str"
+#define F(x) x
+
+int f(int x) {
+    for (int i = 0; i < x; i++)
+        printf("%d", __i);
+
+    return f(x - 1);
+}
+''',
+    b'''
+int g(int (*main)(void), int a[]) {
+    h(printf("nested"));
+    if (a) {
+        goto end;
+    } else if (a) {
+        longjmp(0);
+    } else
+        a = 1;
+end:
+    asm("nop");
+    do x--; while (x);
+    while (1) ++x;
+    return g(main, a);
+}
+
+int *p() {
+    return p();
+}
+''',
+    b'''
+int main() {
+    int x = {
+''',
+    b'''
+int f(int x) {
+    int y = x
+    while (x) x--;
+    return y;
+}
+
+int g( {
+}
+''',
+    b'''
+int f(int x) {
+    switch (x) {
+    case 1:
+        return x > 0 && x < 10 ? 1 : 0;
+    default: {
+        if (x) {
+        } else if (x || !x) {
+            x--;
+        } else {
+            while (x) {
+                {
+                    x--;
+                }
+            }
+        }
+    }
+    }
+}
+''',
+]
+
+RULES = {str(i): compile_rules(rules) for i, rules in enumerate(RULE_SETS)}
+
+
+def request(request_id, src, rules_id):
+    return json.dumps({'id': request_id, 'source': base64.b64encode(src).decode(), 'rules': rules_id})
@@ -0,0 +1,82 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from c_rule_enforcer import get_unique_rule_violations
+from archives import EntryTooLarge, check_archive, iter_archive, read_ahead
+
+from fixtures import RULE_SETS, SOURCES
+
+
+def make_archives(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'submissions.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, src in enumerate(SOURCES):
+            archive.writestr(f'student{i}/main.c', src)
+
+        archive.writestr('README.txt', b'not a submission')
+
+    with tarfile.open(tmp_path / 'submissions.tar.gz', 'w:gz') as archive:
+        for i, src in enumerate(SOURCES):
+            info = tarfile.TarInfo(f'student{i}/main.C')
+            info.size = len(src)
+            archive.addfile(info, io.BytesIO(src))
+
+    return tmp_path / 'submissions.zip', tmp_path / 'submissions.tar.gz'
+
+
+def test_iter_archive(tmp_path):
+    zip_path, tar_path = make_archives(tmp_path)
+
+    assert list(iter_archive(zip_path)) == [(f'student{i}/main.c', src) for i, src in enumerate(SOURCES)]
+    assert list(iter_archive(tar_path)) == [(f'student{i}/main.C', src) for i, src in enumerate(SOURCES)]
+    assert [name for name, _ in iter_archive(zip_path, ['.txt'])] == ['README.txt']
+
+
+def test_check_archive(tmp_path):
+    rules = RULE_SETS[1]
+
+    for path in make_archives(tmp_path):
+        results = check_archive(path, rules, workers=2, queue_size=2)
+
+        assert [violations for _, violations in results] == [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+
+def test_check_archive_duplicate_names(tmp_path):
+    rules = RULE_SETS[1]
+
+    with zipfile.ZipFile(tmp_path / 'resubmitted.zip', 'w') as archive:
+        archive.writestr('student/main.c', SOURCES[0])
+
+        with pytest.warns(UserWarning, match='Duplicate name'):
+            archive.writestr('student/main.c', SOURCES[1])
+
+    assert check_archive(tmp_path / 'resubmitted.zip', rules) == \
+        [('student/main.c', get_unique_rule_violations(src, rules)) for src in SOURCES[:2]]
+
+
+def test_iter_archive_max_entry_bytes(tmp_path):
+    zip_path, tar_path = make_archives(tmp_path)
+    limit = max(map(len, SOURCES)) - 1
+
+    for path in [zip_path, tar_path]:
+        assert len(list(iter_archive(path, max_entry_bytes=limit + 1))) == len(SOURCES)
+
+        with pytest.raises(EntryTooLarge, match=f'larger than {limit} bytes'):
+            list(iter_archive(path, max_entry_bytes=limit))
+
+
+def test_read_ahead():
+    assert list(read_ahead(range(100), 3)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError
+
+    entries = read_ahead(failing(), 1)
+
+    assert next(entries) == 1
+
+    with pytest.raises(ValueError):
+        next(entries)
@@ -0,0 +1,106 @@
+import json
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+import batch
+from c_rule_enforcer import Rules, compile_rules, get_unique_rule_violations, get_violations
+from batch import (SourceArena, _attach_arena, _check_arena_chunk, check_batch, check_batch_shared,
+                   check_batch_shared_records, check_source, get_parser)
+
+from fixtures import RULE_SETS, SOURCES
+
+
+def test_check_batch_threads():
+    sources = SOURCES * 10
+
+    for rules in RULE_SETS:
+        assert check_batch(sources, rules, workers=4) == \
+            [get_unique_rule_violations(src, rules) for src in sources]
+
+
+def test_check_batch_processes():
+    rules = RULE_SETS[1]
+
+    assert check_batch(SOURCES, rules, workers=2, mode='process') == \
+        [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+
+def test_parser_per_thread():
+    parsers = []
+    thread = threading.Thread(target=lambda: parsers.append(get_parser()))
+    thread.start()
+    thread.join()
+
+    assert get_parser() is get_parser()
+    assert parsers[0] is not get_parser()
+
+
+def test_check_source():
+    rules = Rules.from_dict({'disallow': ['loops']})
+
+    assert check_source(b'void f() { for (;;); }', rules) == {'Loops are disallowed.'}
+
+
+def test_check_batch_shared():
+    sources = SOURCES * 3
+
+    for rules in RULE_SETS:
+        assert check_batch_shared(sources, rules, workers=2) == \
+            [get_unique_rule_violations(src, rules) for src in sources]
+
+    assert check_batch_shared([], RULE_SETS[0]) == []
+
+
+def test_check_batch_shared_records():
+    sources = SOURCES * 2
+
+    for rules in RULE_SETS:
+        for src, records in zip(sources, check_batch_shared_records(sources, rules, workers=2, chunk_size=3)):
+            assert sorted(records) == sorted((violation.rule_id, violation.start_byte, violation.message)
+                                             for violation in get_violations(src, rules))
+
+
+def test_check_arena_chunk_error(monkeypatch):
+    def failing(tree, src, checks):
+        raise RecursionError
+
+    monkeypatch.setattr(batch, 'run_visitors', failing)
+
+    # The slice is released on the way out, so closing the attachment does not mask the error
+    with SourceArena(SOURCES) as arena, pytest.raises(RecursionError):
+        _check_arena_chunk(arena.name, compile_rules(RULE_SETS[1]), 0, len(SOURCES))
+
+
+def test_source_arena():
+    with SourceArena(SOURCES) as arena:
+        with _attach_arena(arena.name) as (offsets, buffer):
+            assert [bytes(buffer[offsets[i]:offsets[i + 1]]) for i in range(len(SOURCES))] == SOURCES
+
+
+def test_source_arena_cleanup(monkeypatch):
+    created = []
+    monkeypatch.setattr(batch, 'SharedMemory', lambda **kwargs: created.append(SharedMemory(**kwargs)) or created[-1])
+
+    with pytest.raises(TypeError):
+        SourceArena([b'int x;', 'not bytes'])
+
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(created[0].name)
+
+
+def test_check_batch_trace(tmp_path):
+    for mode in ['thread', 'process']:
+        trace = tmp_path / f'{mode}.json'
+        rules = RULE_SETS[0]
+
+        assert check_batch(SOURCES, rules, workers=2, mode=mode, chunk_size=2, trace=trace, trace_rules=True) == \
+            [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+        spans = [event for event in json.loads(trace.read_text())['traceEvents'] if event['ph'] == 'X']
+
+        assert sorted(int(event['name']) for event in spans if event['cat'] == 'submission') == \
+            list(range(len(SOURCES)))
+        assert {'parse', 'check', 'chunk'} <= {event['name'] for event in spans}
+        assert any(event['cat'] == 'rule' for event in spans)
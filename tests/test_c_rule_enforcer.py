@@ -1,4 +1,9 @@
-from c_rule_enforcer import Rules, get_unique_rule_violations
+from tree_sitter import Parser
+
+from c_rule_enforcer import (C_LANGUAGE, MAX_SYNTAX_ERRORS, LineIndex, Rules, check_against, get_unique_rule_violations,
+                             get_violations, get_violations_by_rule, walk_tree)
+
+from fixtures import RULE_SETS, SOURCES
 
 
 def test_disallow_main():
@@ -1547,3 +1552,203 @@ int asm() {
 
     for src in nonviolating_cases:
         assert not get_unique_rule_violations(src, rules)
+
+
+def test_check_against():
+    rule_sets = [
+        Rules.from_dict({}),
+        Rules.from_dict({'disallow': ['loops', 'printing']}),
+        Rules.from_dict({'disallow': ['loops'], 'disallow_symbols': ['x']}),
+        Rules.from_dict({'require_functions': ['f', 'g'], 'disallow': ['helper_functions']}),
+        Rules.from_dict({'require_includes': ['stdio.h'], 'allow_includes': []}),
+        Rules.from_dict({'limit_defined_functions': 1, 'limit_source_bytes': 10}),
+    ]
+
+    cases = [
+        b'''
+#include <stdio.h>
+
+int f(int x) {
+    for (int i = 0; i < x; i++) {
+        printf("%d", __i);
+    }
+
+    return f(x - 1);
+}
+''',
+        b'''
+#include <stdlib.h>
+
+void h() {
+}
+''',
+        b'''
+int g() {
+    while (1);
+}
+''',
+    ]
+
+    for src in cases:
+        assert check_against(src, rule_sets) == [get_unique_rule_violations(src, rules) for rules in rule_sets]
+
+
+def test_check_against_duplicate_rule_sets():
+    rules = Rules.from_dict({'disallow': ['loops']})
+    src = b'''
+void f() {
+    while (1) {
+    }
+}
+'''
+
+    assert check_against(src, [rules, rules]) == [{'Loops are disallowed.'}] * 2
+    assert check_against(src, []) == []
+
+
+def test_get_violations_by_rule():
+    rules = Rules.from_dict({'disallow': ['loops', 'printing', 'arrays'], 'disallow_symbols': ['x']})
+    src = b'''
+void f(int x) {
+    while (x) {
+        printf("%d", __y);
+    }
+}
+'''
+
+    assert get_violations_by_rule(src, rules) == {
+        'dunders': {'`__y` is disallowed.'},
+        'loops': {'Loops are disallowed.'},
+        'printing': {'Printing is disallowed.'},
+        'disallow_symbols': {'`x` is disallowed.'},
+    }
+
+
+def test_disallow_syntax_errors():
+    rules = Rules.from_dict({'disallow': ['syntax_errors', 'loops']})
+    src = b'''
+int f(int x) {
+    int y = x
+    while (x) x--;
+    return y;
+}
+
+int g( {
+}
+'''
+
+    assert get_unique_rule_violations(src, rules) == {
+        'Syntax error on line 3, column 14: missing `;`.',
+        'Syntax error on line 8, column 6.',
+        'Loops are disallowed.',
+    }
+    assert not get_unique_rule_violations(b'int f() { return 0; }', rules)
+
+    fail_fast = Rules.from_dict({'disallow': ['syntax_errors', 'loops'], 'fail_fast': True})
+
+    assert get_unique_rule_violations(src, fail_fast) == {
+        'Syntax error on line 3, column 14: missing `;`.',
+        'Syntax error on line 8, column 6.',
+    }
+    assert get_unique_rule_violations(b'void f() { while (1); }', fail_fast) == {'Loops are disallowed.'}
+    assert check_against(src, [rules, fail_fast]) == [get_unique_rule_violations(src, rules),
+                                                      get_unique_rule_violations(src, fail_fast)]
+
+
+def test_disallow_syntax_errors_limit():
+    rules = Rules.from_dict({'disallow': ['syntax_errors']})
+    src = b''.join(b'int f%d( {}\n' % i for i in range(10))
+
+    assert len(get_unique_rule_violations(src, rules)) == MAX_SYNTAX_ERRORS
+
+
+def test_limit_complexity():
+    src = b'''
+int f(int x) {
+    switch (x) {
+    case 1:
+        return x > 0 && x < 10 ? 1 : 0;
+    default: {
+        if (x) {
+        } else if (x || !x) {
+            x--;
+        } else {
+            while (x) {
+                {
+                    x--;
+                }
+            }
+        }
+    }
+    }
+}
+'''
+    # Nested 5 levels deep, with 7 statements and a cyclomatic complexity of 8
+    limits = {'limit_nesting_depth': 5, 'limit_function_statements': 7, 'limit_cyclomatic_complexity': 8}
+
+    assert not get_unique_rule_violations(src, Rules.from_dict(limits))
+    assert not check_against(src, [Rules.from_dict(limits)])[0]
+
+    for rule_id, limit in limits.items():
+        rules = Rules.from_dict({rule_id: limit - 1})
+
+        assert len(get_unique_rule_violations(src, rules)) == 1
+        assert get_violations_by_rule(src, rules).keys() == {rule_id}
+
+
+def test_limit_nodes():
+    rules = Rules.from_dict({'limit_nodes': 20, 'disallow': ['loops']})
+
+    assert get_unique_rule_violations(b'void f() { while (1); }', rules) == {'Loops are disallowed.'}
+    # Other rules are skipped once the node budget is exceeded
+    assert get_unique_rule_violations(b'void f() { while (1); while (1); }', rules) == {
+        'Source code is too complex; must have at most 20 syntax tree nodes.',
+    }
+
+
+def test_get_violations():
+    rules = Rules.from_dict({'disallow': ['loops', 'printing'], 'require_includes': ['stdio.h']})
+    src = b'''int f(int x) {
+    while (x) {
+        printf("%d", x--);
+    }
+}
+'''
+    violations = get_violations(src, rules)
+
+    assert [(violation.rule_id, violation.line, violation.column) for violation in violations] == [
+        ('loops', 2, 5),
+        ('printing', 3, 9),
+        ('require_includes', None, None),
+    ]
+    assert src[violations[0].start_byte:violations[0].end_byte].startswith(b'while (x) {')
+    assert violations[0].end_point == (3, 5)
+    assert violations[1].to_dict() == {
+        'rule': 'printing', 'message': 'Printing is disallowed.', 'start_byte': 39, 'end_byte': 45,
+        'line': 3, 'column': 9, 'end_line': 3, 'end_column': 15,
+    }
+    assert violations[2].to_dict() == {'rule': 'require_includes', 'message': 'Must include: stdio.h'}
+
+    for rules in RULE_SETS:
+        for src in SOURCES:
+            assert {violation.message for violation in get_violations(src, rules)} == \
+                get_unique_rule_violations(src, rules)
+
+
+def test_line_index():
+    src = b'a\n\nbc\n  d\n'
+    lines = LineIndex(src)
+
+    for offset in [*range(len(src) + 1), 0, 5, 2, 9, 1]:
+        row = src.count(b'\n', 0, offset)
+
+        assert lines.point(offset) == (row, offset - (src.rfind(b'\n', 0, offset) + 1))
+
+
+def test_walk_tree():
+    root = Parser(C_LANGUAGE).parse(b'int f() { return 1; }\nint g;\n').root_node
+
+    assert [(node.type, depth) for node, depth in walk_tree(root, max_depth=1)] == \
+        [('translation_unit', 0), ('function_definition', 1), ('declaration', 1)]
+    assert [node.type for node, _ in walk_tree(root, lambda node: node.type != 'function_definition')][:3] == \
+        ['translation_unit', 'function_definition', 'declaration']
@@ -0,0 +1,72 @@
+import pytest
+
+from c_rule_enforcer import Rules, get_violations_by_rule
+
+np = pytest.importorskip('numpy')
+
+from columnar import RULE_IDS, check_batch_columnar  # noqa: E402
+
+RULES = {
+    'p1': Rules.from_dict({'disallow': ['loops', 'printing']}),
+    'p2': Rules.from_dict({'disallow_symbols': ['x']}),
+}
+
+SOURCES = [
+    b'int f(int x) { while (x) {} for (;;) {} }',
+    b'void f(void) { printf("x"); }',
+    b'int f(int x) { return x; }',
+    b'int f(void) { return 0; }',
+]
+
+PROBLEMS = ['p1', 'p1', 'p2', 'p2']
+
+
+@pytest.mark.parametrize('mode', ['thread', 'process'])
+def test_check_batch_columnar(mode):
+    table = check_batch_columnar(SOURCES, RULES, PROBLEMS, workers=2, mode=mode, chunk_size=1)
+
+    assert table.submissions == 4
+    assert [(i, RULE_IDS[rule], count, first_byte) for i, rule, count, first_byte
+            in zip(table.submission, table.rule, table.count, table.first_byte)] == [
+        (0, 'loops', 2, SOURCES[0].index(b'while')),
+        (1, 'printing', 1, SOURCES[1].index(b'printf')),
+        (2, 'disallow_symbols', 2, SOURCES[2].index(b'x')),
+    ]
+
+    for i, src in enumerate(SOURCES):
+        assert {RULE_IDS[rule] for rule in table.rule[table.submission == i]} \
+            == set(get_violations_by_rule(src, RULES[PROBLEMS[i]]))
+
+
+def test_violation_table_aggregates():
+    table = check_batch_columnar(SOURCES, RULES, PROBLEMS, workers=1)
+
+    assert table.per_rule() == {'loops': (1, 2), 'printing': (1, 1), 'disallow_symbols': (1, 2)}
+    assert table.rejection_rates() == {'p1': 1.0, 'p2': 0.5}
+
+    matrix = table.submissions_by_problem_and_rule()
+
+    assert matrix.shape == (2, len(RULE_IDS))
+    assert matrix.sum() == 3
+    assert matrix[1, RULE_IDS.index('disallow_symbols')] == 1
+
+
+def test_check_batch_columnar_single_rules():
+    table = check_batch_columnar(SOURCES, RULES['p1'])
+
+    assert table.problems == ['default']
+    assert list(table.submission) == [0, 1]
+
+
+def test_check_batch_columnar_invalid_problems():
+    with pytest.raises(ValueError, match='problems must give'):
+        check_batch_columnar(SOURCES, RULES)
+
+    with pytest.raises(ValueError, match='Got 3 problems for 4 sources'):
+        check_batch_columnar(SOURCES, RULES, PROBLEMS[:3])
+
+    with pytest.raises(ValueError, match='No rules for problems: p3'):
+        check_batch_columnar(SOURCES, RULES, PROBLEMS[:3] + ['p3'])
+
+    with pytest.raises(ValueError, match='chunk_size must be at least 1, not 0'):
+        check_batch_columnar(SOURCES, RULES, PROBLEMS, chunk_size=0)
@@ -0,0 +1,234 @@
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+from collections import Counter
+from functools import partial
+
+import corpus
+from c_rule_enforcer import Rules, get_unique_rule_violations, get_violations_by_rule
+from corpus import merge, read_manifest, read_results, read_rules, run_shard, run_shards, shard_path
+from memory import check_with_budget
+from sinks import SqliteSink, connect, failing_submissions, violation_summary
+
+from fixtures import SOURCES
+
+RULES = {
+    'default': {'disallow': ['loops']},
+    'p2': {'disallow': ['printing'], 'require_includes': ['stdio.h']},
+}
+
+
+def make_corpus(tmp_path):
+    lines = []
+
+    for i, src in enumerate(SOURCES * 3):
+        (tmp_path / f'{i}.c').write_bytes(src)
+        lines.append(json.dumps({'id': f's{i}', 'path': f'{i}.c', 'problem': 'p2' if i % 2 else 'default'}))
+
+    lines.append(json.dumps({'id': 'missing', 'path': 'missing.c'}))
+    (tmp_path / 'manifest.jsonl').write_text('\n'.join(lines))
+    (tmp_path / 'rules.json').write_text(json.dumps(RULES))
+
+    return tmp_path / 'manifest.jsonl', tmp_path / 'rules.json'
+
+
+def test_corpus_run_and_merge(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    run_shards(manifest, rules, tmp_path / 'out', shards=3)
+
+    assert merge(manifest, tmp_path / 'out', tmp_path / 'merged.jsonl') == 0
+
+    merged = [json.loads(line) for line in (tmp_path / 'merged.jsonl').read_text().splitlines()]
+    submissions = read_manifest(manifest)
+
+    assert [result['id'] for result in merged] == [submission.id for submission in submissions]
+    assert 'error' in merged[-1]
+
+    for submission, result in zip(submissions[:-1], merged):
+        expected = get_unique_rule_violations(submission.path.read_bytes(), Rules.from_dict(RULES[submission.problem]))
+        assert result['violations'] == sorted(expected)
+
+
+def test_corpus_resume(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    submissions = read_manifest(manifest)
+    compiled = {problem: Rules.from_dict(d) for problem, d in RULES.items()}
+
+    assert run_shard(submissions[:5], compiled, tmp_path / 'out', 0, 1) == 5
+
+    # Simulates a crash in the middle of writing a line
+    with open(shard_path(tmp_path / 'out', 0, 1), 'a') as f:
+        f.write('{"id": "s5", "viol')
+
+    assert len(read_results(shard_path(tmp_path / 'out', 0, 1))) == 5
+    assert run_shard(submissions, compiled, tmp_path / 'out', 0, 1) == len(submissions) - 5
+    assert run_shard(submissions, compiled, tmp_path / 'out', 0, 1) == 0
+    assert merge(manifest, tmp_path / 'out', tmp_path / 'merged.jsonl') == 0
+
+
+def test_corpus_check_error(tmp_path, monkeypatch):
+    manifest, rules = make_corpus(tmp_path)
+    submissions = read_manifest(manifest)
+    compiled = {problem: Rules.from_dict(d) for problem, d in RULES.items()}
+
+    def check_source(src, rules):
+        if src == SOURCES[0]:
+            raise RecursionError('maximum recursion depth exceeded')
+
+        return get_unique_rule_violations(src, rules)
+
+    monkeypatch.setattr(corpus, 'check_source', check_source)
+
+    assert run_shard(submissions, compiled, tmp_path / 'out', 0, 1) == len(submissions)
+
+    results = read_results(shard_path(tmp_path / 'out', 0, 1))
+
+    assert results['s0']['error'] == 'RecursionError: maximum recursion depth exceeded'
+    assert results['s1']['violations'] == sorted(check_source(SOURCES[1], compiled['p2']))
+
+
+def test_corpus_sqlite(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    db_path = tmp_path / 'results.db'
+
+    subprocess.run([sys.executable, corpus.__file__, 'run', str(manifest), str(rules), str(tmp_path / 'out'),
+                    '--shards', '2', '--sqlite', str(db_path)], check=True)
+
+    submissions = read_manifest(manifest)
+    by_rule = {submission.id: get_violations_by_rule(submission.path.read_bytes(),
+                                                     Rules.from_dict(RULES[submission.problem]))
+               for submission in submissions[:-1]}
+    db = connect(db_path)
+
+    assert db.execute('SELECT COUNT(*) FROM results').fetchone() == (len(submissions),)
+    assert db.execute("SELECT error FROM results WHERE submission_id = 'missing'").fetchone()[0].startswith('FileNotFoundError')
+
+    for problem in RULES:
+        ids = [submission.id for submission in submissions[:-1] if submission.problem == problem]
+
+        assert violation_summary(db, problem) == Counter(rule for i in ids for rule in by_rule[i])
+        assert failing_submissions(db, problem, 'loops') == sorted(i for i in ids if 'loops' in by_rule[i])
+
+    # Resuming adds nothing
+    run_shards(manifest, rules, tmp_path / 'out', shards=2, sqlite=db_path)
+
+    assert db.execute('SELECT COUNT(*) FROM results').fetchone() == (len(submissions),)
+
+
+def test_corpus_sqlite_single_pass(tmp_path, monkeypatch):
+    manifest, rules = make_corpus(tmp_path)
+    submissions = read_manifest(manifest)
+    calls = Counter()
+
+    def counting(name, check):
+        def counted(*args):
+            calls[name] += 1
+            return check(*args)
+
+        return counted
+
+    for name in ['check_source', 'check_source_by_rule', 'traced_check', 'traced_check_by_rule', 'check_with_budget']:
+        monkeypatch.setattr(corpus, name, counting(name, getattr(corpus, name)))
+
+    options = [{}, {'trace': tmp_path / 'trace.json'}, {'memory': True}]
+
+    for i, kwargs in enumerate(options):
+        db_path = tmp_path / f'{i}.db'
+        calls.clear()
+        run_shard(submissions, read_rules(rules), tmp_path / f'out{i}', 0, 1, sqlite=db_path, **kwargs)
+
+        # Every readable submission is checked exactly once, rejected or not
+        assert sum(calls.values()) == len(submissions) - 1
+
+        db = connect(db_path)
+
+        for problem in RULES:
+            assert violation_summary(db, problem) == Counter(
+                rule for submission in submissions[:-1] if submission.problem == problem
+                for rule in get_violations_by_rule(submission.path.read_bytes(), Rules.from_dict(RULES[problem])))
+
+
+def _killed_shard(manifest, rules, out_dir, db_path, after):
+    add = SqliteSink.add
+    added = 0
+
+    def killing_add(self, *args):
+        nonlocal added
+
+        if (added := added + 1) > after:
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        add(self, *args)
+
+    SqliteSink.add = killing_add
+    # Anything written to the results file reaches it at once, as when its buffer fills up
+    corpus.open = partial(open, buffering=1)
+    run_shard(read_manifest(manifest), read_rules(rules), out_dir, 0, 1, checkpoint_every=4, sqlite=db_path)
+
+
+def test_corpus_sqlite_killed(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    db_path = tmp_path / 'results.db'
+    connect(db_path).close()
+
+    # Killed between the second and the third checkpoint
+    process = multiprocessing.get_context('fork').Process(
+        target=_killed_shard, args=(manifest, rules, tmp_path / 'out', db_path, 10))
+    process.start()
+    process.join()
+
+    assert process.exitcode == -signal.SIGKILL
+
+    db = connect(db_path)
+    stored = {submission_id for (submission_id,) in db.execute('SELECT submission_id FROM results')}
+    written = read_results(shard_path(tmp_path / 'out', 0, 1))
+
+    assert len(written) == 8
+    assert written.keys() <= stored
+
+    run_shard(read_manifest(manifest), read_rules(rules), tmp_path / 'out', 0, 1, checkpoint_every=4, sqlite=db_path)
+
+    assert db.execute('SELECT COUNT(*) FROM results').fetchone() == (len(read_manifest(manifest)),)
+    assert merge(manifest, tmp_path / 'out', tmp_path / 'merged.jsonl') == 0
+
+
+def test_corpus_trace(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    run_shards(manifest, rules, tmp_path / 'out', shards=2, trace=tmp_path / 'trace.json', trace_rules=True)
+
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+
+    assert {event['args']['name'] for event in events if event['ph'] == 'M'} == {'shard 0', 'shard 1'}
+    assert {event['name'] for event in spans if event['cat'] == 'submission'} == \
+        {submission.id for submission in read_manifest(manifest)}
+    assert {'read', 'parse', 'check', 'serialize', 'loops', 'printing', 'require_includes'} <= \
+        {event['name'] for event in spans}
+    assert all(event['dur'] >= 0 for event in spans)
+
+    merge(manifest, tmp_path / 'out', tmp_path / 'merged.jsonl')
+
+    for submission, line in zip(read_manifest(manifest)[:-1], (tmp_path / 'merged.jsonl').read_text().splitlines()):
+        expected = get_unique_rule_violations(submission.path.read_bytes(), Rules.from_dict(RULES[submission.problem]))
+        assert json.loads(line)['violations'] == sorted(expected)
+
+
+def test_corpus_memory_budget(tmp_path):
+    manifest, rules = make_corpus(tmp_path)
+    submissions = read_manifest(manifest)
+    compiled = {problem: Rules.from_dict(d) for problem, d in RULES.items()}
+    budget = max(map(len, SOURCES)) * 4
+    run_shard(submissions, compiled, tmp_path / 'out', 0, 1, memory_budget=budget)
+
+    results = read_results(shard_path(tmp_path / 'out', 0, 1))
+
+    assert any('over_budget' in result for result in results.values())
+
+    for submission in submissions[:-1]:
+        expected = check_with_budget(submission.path.read_bytes(), compiled[submission.problem], budget)
+
+        assert results[submission.id].get('over_budget') == expected.over_budget
+        assert results[submission.id]['memory']['nodes'] == expected.usage.nodes
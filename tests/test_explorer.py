@@ -0,0 +1,112 @@
+import io
+import json
+import tarfile
+
+from tree_sitter import Node, Parser
+
+from c_rule_enforcer import C_LANGUAGE, Rules, get_violations_by_rule
+from explorer import corpus_stats, dump, explore, file_stats
+
+from fixtures import SOURCES
+
+RULES = Rules.from_dict({'disallow': ['loops', 'printing', 'asm']})
+
+
+def test_explore(tmp_path, capsys):
+    (tmp_path / 'a.c').write_bytes(b'int main() { return 0; }')
+
+    lines = list(explore(str(tmp_path / 'a.c')))
+
+    assert capsys.readouterr().out == ''
+    assert lines[:3] == ['translation_unit', '--function_definition', '----primitive_type']
+
+
+def test_file_stats():
+    src = b'int f(void) { { { return 0; } } }'
+    stats = file_stats(src, Rules.from_dict({'disallow': ['loops']}))
+    blocks = stats.node_types['compound_statement']
+
+    assert (stats.files, stats.bytes) == (1, len(src))
+    assert (blocks.count, blocks.files) == (3, 1)
+    assert sorted(blocks.depths.elements()) == [2, 3, 4]
+    assert blocks.bytes == len(b'{ { { return 0; } } }') + len(b'{ { return 0; } }') + len(b'{ return 0; }')
+    assert stats.candidate_files == {'dunders': 1, 'loops': 0}
+    assert stats.violating_files == {'dunders': 0, 'loops': 0}
+
+
+def test_corpus_stats(tmp_path):
+    for i, src in enumerate(SOURCES):
+        (tmp_path / 'dir' / str(i % 2)).mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'dir' / str(i % 2) / f'{i}.c').write_bytes(src)
+
+    with tarfile.open(tmp_path / 'corpus.tar.gz', 'w:gz') as archive:
+        archive.add(tmp_path / 'dir', 'dir')
+
+    from_dir = corpus_stats([tmp_path / 'dir'], RULES, workers=2, chunk_size=1)
+    from_archive = corpus_stats([tmp_path / 'corpus.tar.gz'], RULES, workers=1)
+
+    assert from_dir.to_dict() == from_archive.to_dict()
+    assert from_dir.files == len(SOURCES)
+    assert from_dir.node_types['translation_unit'].count == len(SOURCES)
+
+    for rule in from_dir.rule_selectivity():
+        violating = sum(rule['rule'] in get_violations_by_rule(src, RULES) for src in SOURCES)
+
+        assert rule['violating_files'] == violating / len(SOURCES)
+        assert rule['candidate_files'] >= rule['violating_files']
+
+
+DUMP_SOURCE = b'int f(int x) {\n  return g(x);\n}\n'
+
+
+def dumped(src: bytes, *args, **kwargs) -> str:
+    out = io.StringIO()
+    dump(Parser(C_LANGUAGE).parse(src), src, out, *args, **kwargs)
+
+    return out.getvalue()
+
+
+def test_dump_sexp():
+    assert dumped(DUMP_SOURCE, 'sexp', node_types=['return_statement']) == """\
+(return_statement [1, 2] - [1, 14] 17..29
+  ("return" [1, 2] - [1, 8] 17..23)
+  (call_expression [1, 9] - [1, 13] 24..28
+    function: (identifier [1, 9] - [1, 10] 24..25)
+    arguments: (argument_list [1, 10] - [1, 13] 25..28
+      ("(" [1, 10] - [1, 11] 25..26)
+      (identifier [1, 11] - [1, 12] 26..27)
+      (")" [1, 12] - [1, 13] 27..28)))
+  (";" [1, 13] - [1, 14] 28..29))
+"""
+
+    assert dumped(DUMP_SOURCE, 'sexp', node_types=['identifier'], byte_range=(20, 30)) == \
+        '(identifier [1, 9] - [1, 10] 24..25)\n(identifier [1, 11] - [1, 12] 26..27)\n'
+
+
+def test_dump_json():
+    def expected(node: Node, field_name: str | None, depth: int) -> dict:
+        return {
+            'type': node.type,
+            'field': field_name,
+            'start_byte': node.start_byte,
+            'end_byte': node.end_byte,
+            'start_point': list(node.start_point),
+            'end_point': list(node.end_point),
+            'children': [expected(child, node.field_name_for_child(i), depth + 1)
+                         for i, child in enumerate(node.children) if child.is_named] if depth < 3 else [],
+        }
+
+    tree = Parser(C_LANGUAGE).parse(DUMP_SOURCE)
+
+    assert json.loads(dumped(DUMP_SOURCE, 'json', max_depth=3, named_only=True)) == \
+        expected(tree.root_node, None, 0)
+
+
+def test_dump_deep():
+    src = b'int f(void) {' + b'{' * 5000 + b'}' * 5000 + b'}'
+
+    assert dumped(src, 'tree').count('compound_statement') == 5001
+    # Too deep for the `json` module to load back
+    assert dumped(src, 'json').count('"children": [') == dumped(src, 'json').count(']}')
+    assert dumped(src, 'sexp', max_depth=1) == f'(translation_unit [0, 0] - [0, {len(src)}] 0..{len(src)}\n' \
+        f'  (function_definition [0, 0] - [0, {len(src)}] 0..{len(src)}))\n'
@@ -0,0 +1,90 @@
+import dbm
+
+import pytest
+
+from c_rule_enforcer import DisallowLoopsVisitor, Rules, get_unique_rule_violations
+from memo import RuleMemo
+
+SRC = b'''
+#include <stdio.h>
+
+int f(int x) {
+    for (int i = 0; i < x; i++) {
+        printf("%d", i);
+    }
+
+    return f(x - 1);
+}
+'''
+
+
+def test_rule_memo_recomputes_changed_rules_only():
+    memo = RuleMemo()
+    rules = {'disallow': ['loops', 'printing'], 'disallow_symbols': ['x']}
+
+    assert memo.check(SRC, Rules.from_dict(rules)) == get_unique_rule_violations(SRC, Rules.from_dict(rules))
+    assert (memo.hits, memo.misses) == (0, 4)
+
+    rules['disallow_symbols'] = ['x', 'i']
+
+    assert memo.check(SRC, Rules.from_dict(rules)) == get_unique_rule_violations(SRC, Rules.from_dict(rules))
+    assert (memo.hits, memo.misses) == (3, 5)
+
+    assert memo.check(SRC + b'\n', Rules.from_dict(rules)) == get_unique_rule_violations(SRC, Rules.from_dict(rules))
+    assert (memo.hits, memo.misses) == (3, 9)
+
+
+def test_rule_memo_fail_fast():
+    memo = RuleMemo()
+    rules = Rules.from_dict({'disallow': ['syntax_errors', 'loops'], 'fail_fast': True})
+    broken = SRC.replace(b'return f(x - 1);', b'return f(x - 1)')
+
+    assert memo.check(broken, rules) == get_unique_rule_violations(broken, rules)
+    assert (memo.hits, memo.misses) == (0, 1)
+
+    assert memo.check(SRC, rules) == get_unique_rule_violations(SRC, rules)
+    assert (memo.hits, memo.misses) == (0, 4)
+
+
+def test_rule_memo_persists(tmp_path):
+    rules = Rules.from_dict({'disallow': ['direct_recursion'], 'require_includes': ['stdlib.h']})
+
+    with RuleMemo.open(str(tmp_path / 'memo')) as memo:
+        assert memo.check(SRC, rules) == get_unique_rule_violations(SRC, rules)
+
+    with RuleMemo.open(str(tmp_path / 'memo')) as memo:
+        assert memo.check(SRC, rules) == get_unique_rule_violations(SRC, rules)
+        assert (memo.hits, memo.misses) == (3, 0)
+
+
+def test_rule_memo_open_failure(tmp_path):
+    path = tmp_path / 'memo'
+    path.write_bytes(b'not a database')
+
+    with pytest.raises(dbm.error) as failure:
+        RuleMemo.open(str(path))
+
+    # The lock is released even while the traceback, and the frame that opened it, are still alive
+    path.unlink()
+
+    with RuleMemo.open(str(path)) as memo:
+        assert memo.check(SRC, Rules.from_dict({})) == get_unique_rule_violations(SRC, Rules.from_dict({}))
+
+    assert failure.traceback
+
+
+def test_rule_memo_versions(tmp_path, monkeypatch):
+    rules = Rules.from_dict({'disallow': ['loops', 'printing']})
+
+    with RuleMemo.open(str(tmp_path / 'memo')) as memo:
+        memo.check(SRC, rules)
+
+        with pytest.raises(RuntimeError, match='already open'):
+            RuleMemo.open(str(tmp_path / 'memo'))
+
+    # A changed rule implementation invalidates only its own results
+    monkeypatch.setattr(DisallowLoopsVisitor, 'version', DisallowLoopsVisitor.version + 1)
+
+    with RuleMemo.open(str(tmp_path / 'memo')) as memo:
+        assert memo.check(SRC, rules) == get_unique_rule_violations(SRC, rules)
+        assert (memo.hits, memo.misses) == (2, 1)
@@ -0,0 +1,32 @@
+from c_rule_enforcer import Rules, get_unique_rule_violations, get_violations_by_rule
+from memory import NODE_BYTES, check_with_budget
+
+from fixtures import RULE_SETS, SOURCES
+
+
+def test_check_with_budget_accounts():
+    for rules in RULE_SETS:
+        for src in SOURCES:
+            result = check_with_budget(src, rules)
+
+            assert result.over_budget is None
+            assert result.violations == get_unique_rule_violations(src, rules)
+            assert result.by_rule == get_violations_by_rule(src, rules)
+            assert result.usage.source_bytes == len(src)
+            assert result.usage.nodes > 0 or not src
+
+
+def test_check_with_budget_stages():
+    rules = Rules.from_dict({'disallow': ['loops'], 'disallow_symbols': ['x']})
+    src = b'int f(int x) { return x; }\n' * 2000
+    usage = check_with_budget(src, rules).usage
+
+    assert check_with_budget(src, rules, len(src) - 1).over_budget == 'source'
+    assert check_with_budget(src, rules, len(src) + NODE_BYTES).over_budget == 'tree'
+
+    # Room for the tree but not for the thousands of reported violations
+    result = check_with_budget(src, rules, len(src) + usage.nodes * NODE_BYTES + 1000)
+
+    assert (result.over_budget, result.violations) == ('rules', None)
+    assert result.to_dict()['over_budget'] == 'rules'
+    assert check_with_budget(src, rules, usage.estimated_bytes * 2).violations == {'`x` is disallowed.'}
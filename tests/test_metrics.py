@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from c_rule_enforcer import Rules, get_unique_rule_violations, get_violations_by_rule
+from memo import RuleMemo
+from metrics import Histogram, Metrics, PeriodicWriter, measure_source, serve_metrics, write_textfile
+from snapshot import SnapshotCache
+from specialize import checker_cache_counts
+from pipeline import serve
+from warm_pool import WarmPool
+
+from fixtures import RULE_SETS, RULES, SOURCES, request
+
+
+def test_measure_source():
+    for rules in RULE_SETS:
+        for src in SOURCES:
+            measured = measure_source(src, rules)
+
+            assert measured.violations == get_unique_rule_violations(src, rules)
+            assert set(measured.rule_violations) == set(get_violations_by_rule(src, rules))
+            assert measured.source_bytes == len(src)
+
+
+def test_histogram():
+    histogram = Histogram([1, 2, 4])
+
+    for value in [0.5, 1, 1.5, 3, 10]:
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert (histogram.quantile(0.5), histogram.quantile(0.99)) == (2, float('inf'))
+
+
+def test_metrics_exposition(tmp_path):
+    metrics = Metrics()
+
+    for src in SOURCES:
+        metrics.record(measure_source(src, Rules.from_dict({'disallow': ['loops']})))
+
+    metrics.record_timeout()
+
+    text = metrics.to_prometheus()
+
+    assert f'c_rule_enforcer_checks_total {len(SOURCES)}' in text
+    assert 'c_rule_enforcer_timeouts_total 1' in text
+    assert 'c_rule_enforcer_violations_total{rule="loops"}' in text
+    assert f'c_rule_enforcer_parse_seconds_bucket{{le="+Inf"}} {len(SOURCES)}' in text
+
+    server = serve_metrics(metrics, 0)
+
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        assert urllib.request.urlopen(url + '/metrics').read().decode() == text
+        assert json.load(urllib.request.urlopen(url + '/metrics.json'))['checks'] == len(SOURCES)
+    finally:
+        server.shutdown()
+
+    with PeriodicWriter(metrics, tmp_path / 'metrics.prom', write_textfile, interval=60):
+        pass
+
+    assert (tmp_path / 'metrics.prom').read_text() == metrics.to_prometheus()
+
+
+def test_metrics_caches(tmp_path):
+    metrics = Metrics()
+    rules = Rules.from_dict({'disallow': ['loops']})
+    snapshots = SnapshotCache(tmp_path)
+    memo = RuleMemo()
+    metrics.track_cache('snapshot', snapshots)
+    metrics.track_cache('memo', memo)
+
+    for _ in range(2):
+        for src in SOURCES[:3]:
+            metrics.record(measure_source(src, rules))
+            snapshots.get(src)
+            memo.check(src, rules)
+
+    hits, misses = checker_cache_counts()
+    caches = metrics.to_dict()['caches']
+
+    assert caches['checker'] == {'hits': hits, 'misses': misses}
+    assert caches['snapshot'] == {'hits': 3, 'misses': 3}
+    assert caches['memo'] == {'hits': memo.hits, 'misses': memo.misses}
+    assert memo.hits > 0
+
+    text = metrics.to_prometheus()
+
+    for name, counts in caches.items():
+        assert f'c_rule_enforcer_cache_hits_total{{cache="{name}"}} {counts["hits"]}' in text
+        assert f'c_rule_enforcer_cache_misses_total{{cache="{name}"}} {counts["misses"]}' in text
+
+
+def test_serve_records_metrics():
+    metrics = Metrics()
+    lines = [request(i, src, '1') for i, src in enumerate(SOURCES)] + ['not json']
+
+    with ThreadPoolExecutor(2) as executor:
+        serve(lines, io.StringIO(), RULES, lambda src, rules: executor.submit(measure_source, src, rules),
+              metrics=metrics)
+
+    assert (metrics.checks, metrics.errors) == (len(SOURCES), 1)
+    assert metrics.rejected == sum(bool(get_unique_rule_violations(src, RULE_SETS[1])) for src in SOURCES)
+
+
+def test_serve_timeout():
+    metrics = Metrics()
+    out = io.StringIO()
+
+    def check(src, rules):
+        if src == b'slow':
+            time.sleep(0.5)
+
+        return measure_source(src, rules)
+
+    # The second check waits longer than the timeout in the queue, which must not count
+    with ThreadPoolExecutor(1) as executor:
+        serve([request('slow', b'slow', '1'), request('queued', SOURCES[0], '1')], out, RULES,
+              lambda src, rules: executor.submit(check, src, rules), metrics=metrics, timeout=0.2)
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [result['id'] for result in results] == ['slow', 'queued']
+    assert results[0]['error'].startswith('TimeoutError')
+    assert results[1]['violations'] == sorted(get_unique_rule_violations(SOURCES[0], RULE_SETS[1]))
+    assert (metrics.timeouts, metrics.errors, metrics.checks) == (1, 0, 1)
+
+
+def test_warm_pool_custom_check():
+    metrics = Metrics()
+
+    with WarmPool(RULES.values(), workers=2, check=measure_source) as pool:
+        results = [pool.submit(src, RULES['1']).result() for src in SOURCES]
+
+    for measured in results:
+        metrics.record(measured)
+
+    assert results[0].violations == get_unique_rule_violations(SOURCES[0], RULE_SETS[1])
+    assert all(measured.pid != os.getpid() for measured in results)
+    # Warming up generated every checker, so each check of a worker was a hit
+    assert metrics.to_dict()['caches']['checker']['hits'] >= len(SOURCES)
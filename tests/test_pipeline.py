@@ -0,0 +1,116 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from c_rule_enforcer import get_unique_rule_violations
+from batch import check_source
+from pipeline import serve
+
+from fixtures import RULE_SETS, RULES, SOURCES, request
+
+
+def test_serve():
+    lines = [request(f'{i}-{j}', src, str(i)) for i in range(len(RULE_SETS)) for j, src in enumerate(SOURCES)]
+    out = io.StringIO()
+
+    with ThreadPoolExecutor(4) as executor:
+        assert serve(lines, out, RULES, lambda src, rules: executor.submit(check_source, src, rules), window=3) == \
+            len(lines)
+
+    results = {result['id']: result['violations'] for result in map(json.loads, out.getvalue().splitlines())}
+
+    assert results == {f'{i}-{j}': sorted(get_unique_rule_violations(src, RULE_SETS[i]))
+                       for i in range(len(RULE_SETS)) for j, src in enumerate(SOURCES)}
+
+
+def test_serve_errors(tmp_path):
+    (tmp_path / 'a.c').write_bytes(b'int main() {}')
+    lines = [
+        'not json',
+        json.dumps({'id': 'unknown', 'source': '', 'rules': 'nope'}),
+        json.dumps({'id': 'base64', 'source': '!!', 'rules': '0'}),
+        json.dumps({'id': 'missing', 'path': str(tmp_path / 'missing.c'), 'rules': '0'}),
+        json.dumps({'id': 'path', 'path': str(tmp_path / 'a.c'), 'rules': '1'}),
+    ]
+    out = io.StringIO()
+
+    with ThreadPoolExecutor(1) as executor:
+        serve(lines, out, RULES, lambda src, rules: executor.submit(check_source, src, rules))
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [result['id'] for result in results if 'error' in result] == [None, 'unknown', 'base64', 'missing']
+    assert results[-1] == {'id': 'path', 'violations': sorted(get_unique_rule_violations(b'int main() {}', RULE_SETS[1]))}
+
+
+def test_serve_wrong_types():
+    lines = [
+        json.dumps({'id': 'source', 'source': 123, 'rules': '0'}),
+        json.dumps({'id': 'path', 'path': ['a.c'], 'rules': '0'}),
+        json.dumps({'id': 'rules', 'source': '', 'rules': [1]}),
+        '[1]',
+        request('valid', SOURCES[1], '1'),
+    ]
+    out = io.StringIO()
+
+    with ThreadPoolExecutor(1) as executor:
+        assert serve(lines, out, RULES, lambda src, rules: executor.submit(check_source, src, rules)) == len(lines)
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [(result['id'], result['error']) for result in results[:3]] == [
+        ('source', 'TypeError: source must be a string, not int'),
+        ('path', 'TypeError: path must be a string, not list'),
+        ('rules', 'TypeError: rules must be a string, not list'),
+    ]
+    assert 'error' in results[3]
+    assert results[-1] == {'id': 'valid', 'violations': sorted(get_unique_rule_violations(SOURCES[1], RULE_SETS[1]))}
+
+
+def test_serve_window():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def check(src, rules):
+        nonlocal active, peak
+
+        with lock:
+            active += 1
+            peak = max(peak, active)
+
+        violations = check_source(src, rules)
+
+        with lock:
+            active -= 1
+
+        return violations
+
+    with ThreadPoolExecutor(8) as executor:
+        serve([request(i, SOURCES[1], '1') for i in range(50)], io.StringIO(), RULES,
+              lambda src, rules: executor.submit(check, src, rules), window=2)
+
+    assert peak <= 2
+
+
+def test_serve_submit_failure():
+    out = io.StringIO()
+    submitted = 0
+
+    def submit(src, rules):
+        nonlocal submitted
+        submitted += 1
+
+        if submitted == 1:
+            raise RuntimeError('Pool is closed')
+
+        return executor.submit(check_source, src, rules)
+
+    with ThreadPoolExecutor(1) as executor:
+        serve([request('closed', SOURCES[0], '1'), request('open', SOURCES[0], '1')], out, RULES, submit, window=1)
+
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        {'id': 'closed', 'error': 'RuntimeError: Pool is closed'},
+        {'id': 'open', 'violations': sorted(get_unique_rule_violations(SOURCES[0], RULE_SETS[1]))},
+    ]
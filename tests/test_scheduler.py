@@ -0,0 +1,69 @@
+import threading
+
+import scheduler as scheduler_module
+from c_rule_enforcer import Rules, get_unique_rule_violations
+from scheduler import CostModel, Scheduler
+
+from fixtures import RULE_SETS, SOURCES
+
+FUNCTION = b'int f(int x) { for (int i = 0; i < x; i++) { x += i; } return x; }\n'
+
+
+def test_scheduler_results():
+    rules = RULE_SETS[1]
+
+    with Scheduler(workers=2, oversized_bytes=200) as scheduler:
+        results = scheduler.map(enumerate(SOURCES), rules)
+
+    assert [result.key for result in results] == list(range(len(SOURCES)))
+    assert [result.violations for result in results] == [get_unique_rule_violations(src, rules) for src in SOURCES]
+    assert all(result.queue_wait >= 0 and result.service_time >= 0 for result in results)
+
+
+def test_scheduler_shortest_job_first():
+    rules = Rules.from_dict({'disallow': ['loops']})
+
+    with Scheduler(workers=1, aging=0, oversized_bytes=10**9) as scheduler:
+        # Keeps the only worker busy while the rest are queued
+        scheduler.submit('blocker', FUNCTION * 2000, rules)
+        large = scheduler.submit('large', FUNCTION * 500, rules)
+        small = [scheduler.submit(f'small{i}', FUNCTION, rules) for i in range(5)]
+
+    # Submitted first, but started last
+    assert all(future.result().queue_wait < large.result().queue_wait for future in small)
+
+
+def test_scheduler_oversized_lane(monkeypatch):
+    rules = Rules.from_dict({'disallow': ['loops']})
+    started, release = threading.Event(), threading.Event()
+    timed_check = scheduler_module._timed_check
+
+    def blocking_check(src, rules):
+        # Holds oversized checks until the test lets them finish
+        if len(src) >= len(FUNCTION) * 100:
+            started.set()
+            assert release.wait(10)
+
+        return timed_check(src, rules)
+
+    monkeypatch.setattr(scheduler_module, '_timed_check', blocking_check)
+
+    with Scheduler(workers=1, oversized_bytes=len(FUNCTION) * 100) as scheduler:
+        large = scheduler.submit('large', FUNCTION * 2000, rules)
+        assert started.wait(10)
+        small = [scheduler.submit(f'small{i}', FUNCTION, rules) for i in range(3)]
+
+        # The regular worker serves the small sources while the oversized one is still running
+        assert [future.result(timeout=10).violations for future in small] == [{'Loops are disallowed.'}] * 3
+        assert not large.done()
+
+        release.set()
+
+        assert large.result(timeout=10).violations == {'Loops are disallowed.'}
+
+
+def test_cost_model():
+    model = CostModel(weight=1)
+    model.observe(100, 50, 0.5)
+
+    assert model.estimate(200) == 1.0
@@ -0,0 +1,46 @@
+from tree_sitter import Parser
+
+from c_rule_enforcer import C_LANGUAGE, Rules, get_unique_rule_violations, get_violations
+from sharding import check_sharded, get_violations_sharded, split_declarations
+
+from fixtures import RULE_SETS, SOURCES
+
+LARGE_SOURCE = b'\n'.join([
+    b'#include <stdio.h>',
+    *(b'int f%d(int x) { while (x) x--; return f%d(x); }' % (i, i) for i in range(40)),
+    b'#include "a.h"',
+    b'int g() { printf("done"); }',
+])
+
+
+def test_sharded_matches_generic():
+    for rules in [*RULE_SETS, Rules.from_dict({'limit_defined_functions': 40, 'require_functions': ['f0', 'g']})]:
+        for src in [*SOURCES, LARGE_SOURCE]:
+            for shards in [1, 3, 100]:
+                assert check_sharded(src, rules, workers=2, shards=shards) == get_unique_rule_violations(src, rules)
+
+
+def test_sharded_processes():
+    for rules in RULE_SETS:
+        assert check_sharded(LARGE_SOURCE, rules, workers=2, mode='process') == \
+            get_unique_rule_violations(LARGE_SOURCE, rules)
+
+
+def test_sharded_violation_locations():
+    rules = Rules.from_dict({'disallow': ['loops', 'printing', 'direct_recursion'], 'require_includes': ['math.h']})
+    expected = get_violations(LARGE_SOURCE, rules)
+
+    for mode in ['thread', 'process']:
+        violations = get_violations_sharded(LARGE_SOURCE, rules, workers=2, mode=mode)
+
+        assert violations == expected
+        assert [violation.start_point for violation in violations] == \
+            [violation.start_point for violation in expected]
+
+
+def test_split_declarations():
+    root = Parser(C_LANGUAGE).parse(LARGE_SOURCE).root_node
+    groups = split_declarations(root, 4)
+
+    assert len(groups) <= 4
+    assert [node for group in groups for node in group] == root.children
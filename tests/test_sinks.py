@@ -0,0 +1,40 @@
+from c_rule_enforcer import Rules, get_violations_by_rule
+from sinks import SqliteSink, connect, failing_submissions, violation_summary
+
+RULES = Rules.from_dict({'disallow': ['loops', 'printing']})
+
+SOURCES = {
+    'a': b'int f(void) { while (1) {} }',
+    'b': b'void f(void) { printf("x"); for (;;) {} }',
+    'c': b'int f(void) { return 0; }',
+}
+
+
+def test_sqlite_sink_batches_and_summarizes(tmp_path):
+    with SqliteSink(tmp_path / 'results.db', batch_size=2) as sink:
+        for submission_id, src in SOURCES.items():
+            sink.add(submission_id, 'p1', get_violations_by_rule(src, RULES))
+
+        sink.add('d', 'p1', error='OSError: missing')
+
+        assert sink.written == 4 and not sink.pending
+
+    db = connect(tmp_path / 'results.db')
+
+    assert db.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    assert violation_summary(db, 'p1') == {'loops': 2, 'printing': 1}
+    assert failing_submissions(db, 'p1', 'loops') == ['a', 'b']
+    assert dict(db.execute('SELECT submission_id, passed FROM results')) == {'a': 0, 'b': 0, 'c': 1, 'd': 0}
+
+
+def test_sqlite_sink_replaces_results(tmp_path):
+    with SqliteSink(tmp_path / 'results.db') as sink:
+        sink.add('a', 'p1', get_violations_by_rule(SOURCES['b'], RULES))
+
+    with SqliteSink(tmp_path / 'results.db') as sink:
+        sink.add('a', 'p1', get_violations_by_rule(SOURCES['a'], RULES))
+
+    db = connect(tmp_path / 'results.db')
+
+    assert violation_summary(db, 'p1') == {'loops': 1}
+    assert violation_summary(db, 'p2') == {}
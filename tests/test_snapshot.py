@@ -0,0 +1,71 @@
+import pytest
+
+from c_rule_enforcer import get_unique_rule_violations
+
+from fixtures import RULE_SETS, SOURCES
+
+np = pytest.importorskip('numpy')
+
+from snapshot import (KIND_NAMES, check_snapshot, get_unique_rule_violations_vectorized,  # noqa: E402
+                      snapshot_source)
+
+
+def test_vectorized_matches_generic():
+    for rules in RULE_SETS:
+        for src in SOURCES:
+            assert get_unique_rule_violations_vectorized(src, rules) == get_unique_rule_violations(src, rules)
+
+
+def test_snapshot_arrays():
+    src = b'int f(int x) { return x; }'
+    snapshot = snapshot_source(src)
+
+    assert KIND_NAMES[snapshot.kind[0]] == 'translation_unit'
+    assert snapshot.parent[0] == -1
+    assert snapshot.size[0] == len(snapshot)
+    assert (snapshot.parent[1:] < np.arange(1, len(snapshot))).all()
+    assert (snapshot.depth[1:] == snapshot.depth[snapshot.parent[1:]] + 1).all()
+    assert sorted(snapshot.texts_of(snapshot.identifiers)) == [b'f', b'x']
+    assert snapshot.src_len == len(src)
+
+
+def test_check_snapshot_reuse():
+    snapshot = snapshot_source(b'int f() { while (1); }')
+
+    assert check_snapshot(snapshot, RULE_SETS[0]) == set()
+    assert 'Loops are disallowed.' in check_snapshot(snapshot, RULE_SETS[1])
+
+
+def test_save_and_load_snapshot(tmp_path):
+    from snapshot import load_snapshot, save_snapshot
+
+    for src in SOURCES:
+        snapshot = snapshot_source(src)
+        save_snapshot(snapshot, tmp_path / 'snapshot.ast')
+        loaded = load_snapshot(tmp_path / 'snapshot.ast')
+
+        for name in ['kind', 'parent', 'depth', 'size', 'start_byte', 'end_byte', 'field_id', 'text_id']:
+            assert (getattr(loaded, name) == getattr(snapshot, name)).all()
+
+        assert loaded.texts == snapshot.texts
+        assert (loaded.syntax_errors == snapshot.syntax_errors).all()
+        assert loaded.src_len == snapshot.src_len
+
+        for rules in RULE_SETS:
+            assert check_snapshot(loaded, rules) == get_unique_rule_violations(src, rules)
+
+
+def test_snapshot_cache(tmp_path):
+    from snapshot import GRAMMAR_VERSION, SnapshotCache
+
+    cache = SnapshotCache(tmp_path)
+    src = SOURCES[1]
+
+    assert cache.check(src, RULE_SETS[1]) == get_unique_rule_violations(src, RULE_SETS[1])
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.path_for(src).is_relative_to(tmp_path / GRAMMAR_VERSION)
+
+    assert cache.check(src, RULE_SETS[2]) == get_unique_rule_violations(src, RULE_SETS[2])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert not SnapshotCache(tmp_path).get(src).kind.flags.writeable
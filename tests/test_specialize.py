@@ -0,0 +1,17 @@
+from c_rule_enforcer import Rules, get_unique_rule_violations
+from specialize import get_checker, get_unique_rule_violations_specialized
+
+from fixtures import RULE_SETS, SOURCES
+
+
+def test_specialized_matches_generic():
+    for rules in RULE_SETS:
+        for src in SOURCES:
+            assert get_unique_rule_violations_specialized(src, rules) == get_unique_rule_violations(src, rules)
+
+
+def test_specialized_checker_is_cached():
+    assert get_checker(Rules.from_dict({'disallow': ['loops']})) is \
+        get_checker(Rules.from_dict({'disallow': ['loops']}))
+    assert get_checker(Rules.from_dict({'disallow': ['loops']})) is not \
+        get_checker(Rules.from_dict({'disallow': ['arrays']}))
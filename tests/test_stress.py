@@ -0,0 +1,124 @@
+"""
+Pathological inputs against every engine, each with a time and memory budget.
+Slow, so not run by default: `python -m pytest -m stress`.
+
+Every check runs in a forked child, so a check over its time budget can be
+killed and its peak resident memory (including tree-sitter's) measured. All
+engines get the same budgets, since the generic one also runs every rule in a
+single shared traversal.
+"""
+import multiprocessing
+import resource
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import pytest
+
+from c_rule_enforcer import DISALLOW_RULE_IDS, Rules, check_against, get_unique_rule_violations
+from specialize import get_unique_rule_violations_specialized
+from warm_pool import current_rss
+
+pytestmark = pytest.mark.stress
+
+FULL_RULES = {
+    'disallow': sorted(DISALLOW_RULE_IDS),
+    'disallow_symbols': ['x'],
+    'require_functions': ['f'],
+    'limit_source_bytes': 10,
+    'limit_defined_functions': 3,
+    'limit_nesting_depth': 5,
+    'limit_function_statements': 100,
+    'limit_cyclomatic_complexity': 10,
+    'require_includes': ['stdio.h'],
+    'allow_includes': [],
+}
+
+MB = 2 ** 20
+
+
+@dataclass(frozen=True)
+class Case:
+    make_source: Callable[[], bytes]
+    seconds: float
+    memory: int
+    rules: dict[str, Any] | None = None
+
+
+CASES = {
+    'nested_blocks': Case(lambda: b'int f(void) {' + b'{' * 10_000 + b'}' * 10_000 + b'}', 1, 64 * MB),
+    'else_if_chain': Case(lambda: b'int f(int x) { if (x) {}' + b' else if (x) {}' * 10_000 + b' }', 2, 128 * MB),
+    'megabyte_line': Case(lambda: b'int f(int x) { ' + b'x = x + 1; ' * (MB // 11) + b'}', 6, 512 * MB),
+    'megabyte_expression': Case(lambda: b'int f(void) { return ' + b'1+' * (MB // 2) + b'1; }', 10, 768 * MB),
+    'identifiers': Case(lambda: b'int f(void) { ' + b''.join(b'int v%d; ' % i for i in range(100_000)) + b'}',
+                        5, 256 * MB),
+    'includes_and_defines': Case(
+        lambda: b''.join(b'#include <h%d.h>\n#define D%d "s%d"\n' % (i, i, i) for i in range(5_000)), 2, 64 * MB),
+    'disallow_symbols': Case(lambda: b'int f(void) { ' + b''.join(b'int v%d; ' % i for i in range(10_000)) + b'}',
+                             2, 64 * MB, {**FULL_RULES, 'disallow_symbols': [f's{i}' for i in range(100_000)]}),
+    # Only parsing; no rule traverses a tree over the node budget
+    'node_budget': Case(lambda: b'int f(void) { return ' + b'1+' * (MB // 2) + b'1; }', 1, 768 * MB,
+                        {**FULL_RULES, 'limit_nodes': 10_000}),
+}
+
+
+def _vectorized(src: bytes, rules: Rules) -> set[str]:
+    pytest.importorskip('numpy')
+    from snapshot import get_unique_rule_violations_vectorized
+
+    return get_unique_rule_violations_vectorized(src, rules)
+
+
+ENGINES = {
+    'generic': get_unique_rule_violations,
+    'shared': lambda src, rules: check_against(src, [rules])[0],
+    'specialized': get_unique_rule_violations_specialized,
+    'vectorized': _vectorized,
+}
+
+
+def _run(connection, engine: str, case: Case) -> None:
+    try:
+        src = case.make_source()
+        rules = Rules.from_dict(case.rules or FULL_RULES)
+        before = current_rss()
+        start = time.perf_counter()
+        ENGINES[engine](src, rules)
+        elapsed = time.perf_counter() - start
+        connection.send(('ok', elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before))
+
+    except pytest.skip.Exception as e:
+        connection.send(('skip', str(e), 0))
+
+    except BaseException:
+        connection.send(('error', traceback.format_exc(), 0))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('case', CASES)
+def test_stress(case, engine):
+    case = CASES[case]
+    seconds = case.seconds
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run, args=(sender, engine, case))
+    process.start()
+
+    try:
+        # Generating the source is not timed, so allow some slack for it
+        if not receiver.poll(seconds + 10):
+            pytest.fail(f'Exceeded the time budget of {seconds} seconds')
+
+        status, value, peak = receiver.recv()
+
+    finally:
+        process.kill()
+        process.join()
+
+    if status == 'skip':
+        pytest.skip(value)
+
+    assert status == 'ok', value
+    assert value <= seconds, f'Took {value:.2f} seconds; budget is {seconds}'
+    assert peak <= case.memory, f'Peak memory grew by {peak / MB:.0f} MB; budget is {case.memory / MB:.0f} MB'
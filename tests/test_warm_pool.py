@@ -0,0 +1,82 @@
+import os
+import signal
+
+import pytest
+
+from c_rule_enforcer import Rules, get_unique_rule_violations
+from batch import check_source
+from warm_pool import WarmPool, WorkerError
+
+from fixtures import RULE_SETS, SOURCES
+
+
+def test_warm_pool():
+    with WarmPool(RULE_SETS, workers=2) as pool:
+        for rules in RULE_SETS:
+            assert pool.map(SOURCES, rules) == [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+
+def test_warm_pool_recycles_workers():
+    rules = Rules.from_dict({'disallow': ['loops']})
+
+    with WarmPool([rules], workers=2, max_tasks=3) as pool:
+        assert pool.map(SOURCES * 5, rules) == [get_unique_rule_violations(src, rules) for src in SOURCES * 5]
+
+    assert pool.recycled >= 5
+
+
+def test_warm_pool_recycles_on_rss():
+    rules = Rules.from_dict({})
+
+    with WarmPool([rules], workers=1, max_rss=1) as pool:
+        assert pool.map(SOURCES, rules) == [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+    assert pool.recycled == len(SOURCES)
+
+
+def test_warm_pool_worker_death():
+    rules = Rules.from_dict({'disallow': ['loops']})
+
+    def check(src, rules):
+        if src == b'die':
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        if src == b'raise':
+            class Unpicklable(Exception):
+                pass
+
+            raise Unpicklable('local classes cannot be pickled')
+
+        return check_source(src, rules)
+
+    with WarmPool([rules], workers=2, check=check) as pool:
+        futures = [pool.submit(src, rules) for src in [b'die', b'raise', *SOURCES]]
+
+        with pytest.raises(WorkerError, match='died with exit code -9'):
+            futures[0].result(timeout=30)
+
+        with pytest.raises(WorkerError, match="Unpicklable\\('local classes cannot be pickled'\\)"):
+            futures[1].result(timeout=30)
+
+        assert [future.result(timeout=30) for future in futures[2:]] == \
+            [get_unique_rule_violations(src, rules) for src in SOURCES]
+
+    assert pool.died == 1
+
+
+def test_warm_pool_worker_death_before_start():
+    rules = Rules.from_dict({'disallow': ['loops']})
+
+    with WarmPool([rules], workers=1) as pool:
+        (pid,) = pool._workers
+        # Stopped, the worker cannot read the task it is handed before it is killed
+        os.kill(pid, signal.SIGSTOP)
+        future = pool.submit(SOURCES[1], rules)
+        os.kill(pid, signal.SIGKILL)
+
+        with pytest.raises(WorkerError, match=f'Worker {pid} died'):
+            future.result(timeout=30)
+
+        assert pool.submit(SOURCES[1], rules).result(timeout=30) == get_unique_rule_violations(SOURCES[1], rules)
+
+    assert pool.died == 1